@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+
+# Placeholder used during preprocessing for missing categorical values
+MISSING_VALUE = 'Missing'
+# Class used for categories the encoder never saw
+UNKNOWN_VALUE = 'Unknown'
+
+def _is_missing(value: Any) -> bool:
+    """None, NaN or pd.NA; cheaper than pd.isna on a single value"""
+    return value is None or value is pd.NA or value != value
+
+class CompiledEncoders:
+    """
+    Serving-time view of the fitted LabelEncoders.
+    Each column maps its classes to codes through a dict, so encoding is a
+    hash lookup per value instead of a scan over `classes_`. Values outside the
+    vocabulary get a fixed unknown code: the code of 'Unknown' when the encoder
+    has that class, otherwise len(classes_), which is what appending 'Unknown'
+    to `classes_` used to produce. Classes appended by incremental updates
+    continue the codes after `classes_`. The source encoders are never modified.
+    """
+
+    def __init__(self, codes: Dict[str, Dict[Any, int]], unknown_codes: Dict[str, int]):
+        self.codes = codes
+        self.unknown_codes = unknown_codes
+
+    @classmethod
+    def from_label_encoders(cls, label_encoders: Dict[str, Any],
+                            appended_classes: Optional[Dict[str, List[Any]]] = None) -> "CompiledEncoders":
+        """Compile {column: LabelEncoder} and any appended classes into per-column lookup tables"""
+        codes = {}
+        unknown_codes = {}
+        for col, encoder in label_encoders.items():
+            classes = list(encoder.classes_) + list((appended_classes or {}).get(col, []))
+            codes[col] = {value: code for code, value in enumerate(classes)}
+            unknown_codes[col] = codes[col].get(UNKNOWN_VALUE, len(classes))
+        return cls(codes, unknown_codes)
+
+    def __contains__(self, col: str) -> bool:
+        return col in self.codes
+
+    def encode(self, col: str, values: pd.Series) -> np.ndarray:
+        """Encode a column of raw values, mapping missing values to 'Missing'"""
+        return self.encode_counting(col, values)[0]
+
+    def encode_counting(self, col: str, values: pd.Series) -> Tuple[np.ndarray, int]:
+        """Encode a column and count the values that fell back to the unknown code"""
+        # One dict.get per value; Series.map(dict) would rebuild a hash table
+        # from the whole vocabulary on every call
+        lookup = self.codes[col].get
+        codes = np.fromiter(
+            (lookup(MISSING_VALUE if _is_missing(value) else value, -1) for value in values.tolist()),
+            dtype=np.int64, count=len(values)
+        )
+        unknown = codes < 0
+        codes[unknown] = self.unknown_codes[col]
+        return codes, int(unknown.sum())
+
+    def encode_value(self, col: str, value: Any) -> int:
+        """Encode a single raw value"""
+        if value is None:
+            value = MISSING_VALUE
+        return self.codes[col].get(value, self.unknown_codes[col])
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+# Supported explanation modes:
+#   exact        path-dependent TreeSHAP over every tree
+#   approximate  Saabas path attribution: each split on a row's decision path
+#                credits its feature with the change in expected value
+EXPLANATION_MODES = ('exact', 'approximate')
+# Features the response shows for each prediction
+TOP_K = 5
+
+def positive_class_shap(shap_values) -> np.ndarray:
+    """Reduce explainer output to a (rows, features) matrix for the positive class"""
+    if isinstance(shap_values, list):
+        return np.asarray(shap_values[1])
+    shap_values = np.asarray(shap_values)
+    if shap_values.ndim == 3:
+        return shap_values[:, :, 1]
+    return shap_values
+
+def compute_contributions(explainer, data: pd.DataFrame, mode: str = 'exact') -> np.ndarray:
+    """Feature contributions for the positive class using the given explanation mode"""
+    if mode == 'exact':
+        return positive_class_shap(explainer.shap_values(data))
+    if mode not in EXPLANATION_MODES:
+        raise ValueError(f"Unknown explanation mode: {mode}")
+    return positive_class_shap(explainer.shap_values(data, approximate=True))
@@ -1,17 +1,48 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware  # Add this import
-from pydantic import BaseModel
-import pickle
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+import json
+import os
+import sys
+import threading
+import time
+import uuid
 import pandas as pd
 import numpy as np
-import shap
-from typing import Dict, List
+from typing import Any, Dict, List, Optional
+
+# Make the project root and the shared pipeline modules in src/ importable
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (PROJECT_ROOT, os.path.join(PROJECT_ROOT, 'src')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from app.cache import LRUCache, file_fingerprint
+from app.explain import EXPLANATION_MODES, TOP_K, compute_contributions
+from app.metrics import Metrics, MetricsMiddleware
+from app.scheduler import InferenceScheduler, SchedulerOverloaded
+from app.serving import ModelManager, ModelNotLoaded, ServingModel
+from data_processing import FEATURE_SPEC_PATH, LABEL_ENCODERS_PATH
+from model_registry import REGISTRY_DIR, ModelRegistry
+from study_design import DESIGN_COLUMNS, parse_study_design
+from text_features import clean_criteria
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    scheduler.start()
+    # Started here rather than at import, so app/serve.py never forks while it runs
+    threading.Thread(target=start_up, name="start-up", daemon=True).start()
+    yield
+    await scheduler.stop()
 
 # Initialize the FastAPI app
 app = FastAPI(
     title="Clinical Trial Completion Prediction API",
     description="An API to predict the completion status of clinical trials based on study design, criteria, and other features.",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -23,37 +54,107 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load the trained model and preprocessors
+# Latency histograms, counters, /metrics and the Server-Timing header; METRICS_ENABLED=0 turns them off
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no')
+metrics = Metrics(enabled=METRICS_ENABLED)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# Versioned models written by training; the API serves the one CURRENT names
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', REGISTRY_DIR)
+# Used when the registry has no current version yet, together with the label
+# encoders and feature spec preprocessing writes to data/processed
 MODEL_PATH = 'models/random_forest_model.pkl'
-LABEL_ENCODERS_PATH = 'data/label_encoders.pkl'
-
-try:
-    with open(MODEL_PATH, 'rb') as f:
-        model = pickle.load(f)
-    with open(LABEL_ENCODERS_PATH, 'rb') as le_file:
-        label_encoders = pickle.load(le_file)
-    
-    # Initialize SHAP explainer
-    explainer = shap.TreeExplainer(model)
-    print("Model, encoders and explainer loaded successfully.")
-except Exception as e:
-    raise RuntimeError(f"Failed to load model or explainer: {str(e)}")
+COMPILED_MODEL_DIR = 'models/random_forest_compiled'
+
+# Batches up to this size use the compiled forest; larger ones are faster in scikit-learn
+COMPILED_FOREST_MAX_ROWS = int(os.environ.get('COMPILED_FOREST_MAX_ROWS', 256))
+
+# Rows scored per predict_proba/SHAP call when streaming NDJSON batches
+STREAM_CHUNK_SIZE = 1000
+
+# Micro-batching settings for the inference scheduler
+BATCH_WINDOW_MS = float(os.environ.get('BATCH_WINDOW_MS', 3.0))
+MAX_BATCH_ROWS = int(os.environ.get('MAX_BATCH_ROWS', 256))
+MAX_QUEUE_DEPTH = int(os.environ.get('MAX_QUEUE_DEPTH', 1024))
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 1))
+
+# Default explanation mode: exact or approximate (see app/explain.py)
+EXPLANATION_MODE = os.environ.get('EXPLANATION_MODE', 'exact')
+if EXPLANATION_MODE not in EXPLANATION_MODES:
+    raise RuntimeError(f"EXPLANATION_MODE must be one of {EXPLANATION_MODES}, got {EXPLANATION_MODE!r}")
+
+# Explanation cache settings
+EXPLANATION_CACHE_SIZE = int(os.environ.get('EXPLANATION_CACHE_SIZE', 10000))
+EXPLANATION_CACHE_TTL = float(os.environ.get('EXPLANATION_CACHE_TTL', 3600))
+PENDING_EXPLANATIONS_SIZE = int(os.environ.get('PENDING_EXPLANATIONS_SIZE', 10000))
+# Seconds between checks of the registry's CURRENT (or the model file) for a new version
+MODEL_CHECK_INTERVAL = float(os.environ.get('MODEL_CHECK_INTERVAL', 5.0))
+
+# When the first model version is loaded:
+#   import      while this module is imported, so a broken model stops the server
+#               (app/serve.py relies on it to load once before forking workers)
+#   background  on a thread once the server is up; /health answers straight away
+#               and /ready returns 503 until the model is in place
+MODEL_LOADING_MODES = ('import', 'background')
+MODEL_LOADING = os.environ.get('MODEL_LOADING', 'import')
+if MODEL_LOADING not in MODEL_LOADING_MODES:
+    raise RuntimeError(f"MODEL_LOADING must be one of {MODEL_LOADING_MODES}, got {MODEL_LOADING!r}")
+# When shap is imported and the first version's TreeExplainer built:
+#   eager       before the version is served
+#   background  on a thread once the server is up; predictions are served meanwhile
+#   lazy        on the first explanation request
+# Versions swapped in later always build theirs before the swap.
+EXPLAINER_LOADING_MODES = ('eager', 'background', 'lazy')
+EXPLAINER_LOADING = os.environ.get('EXPLAINER_LOADING', 'background')
+if EXPLAINER_LOADING not in EXPLAINER_LOADING_MODES:
+    raise RuntimeError(f"EXPLAINER_LOADING must be one of {EXPLAINER_LOADING_MODES}, got {EXPLAINER_LOADING!r}")
+
+# Categorical features that were label-encoded during preprocessing
+CATEGORICAL_COLS = [
+    'study_title', 'criteria', 'Allocation',
+    'Intervention_Model', 'Masking', 'Primary_Purpose',
+    'intervention', 'condition'
+]
+
+# Feature order must match training data; models trained on other columns bring their own
+FEATURE_ORDER = [
+    'study_title', 'criteria', 'enrollment',
+    'Allocation', 'Intervention_Model', 'Masking', 'Primary_Purpose',
+    'intervention', 'condition'
+]
+
+# Per-trial source aggregates; models trained with --aggregate-features use them
+AGGREGATE_COLS = [
+    'withdrawal_count', 'facility_count', 'country_count',
+    'event_count', 'subjects_at_risk'
+]
+
+registry = ModelRegistry(MODEL_REGISTRY_DIR)
+
+def load_serving_model(version: Optional[str] = None) -> ServingModel:
+    """A registry version, by default the current one, or the files at MODEL_PATH when none is current"""
+    version = version or registry.current()
+    if version is not None:
+        return ServingModel.from_registry(registry, version, FEATURE_ORDER)
+    return ServingModel.from_files(file_fingerprint(MODEL_PATH), MODEL_PATH, LABEL_ENCODERS_PATH,
+                                   FEATURE_SPEC_PATH, COMPILED_MODEL_DIR, FEATURE_ORDER)
 
 def get_prediction_explanation(data: pd.DataFrame) -> Dict[str, float]:
     """Calculate SHAP values and return feature contributions"""
     # Calculate SHAP values
-    shap_values = explainer.shap_values(data)
-    
+    shap_values = model_manager.current.explainer.shap_values(data)
+
     # Get feature importance
     feature_importance = dict(zip(data.columns, shap_values[0]))
-    
+
     # Sort by absolute importance
     sorted_importance = {k: v for k, v in sorted(
-        feature_importance.items(), 
-        key=lambda x: abs(x[1]), 
+        feature_importance.items(),
+        key=lambda x: abs(x[1]),
         reverse=True
     )}
-    
+
     return sorted_importance
 
 # Define the input schema
@@ -67,92 +168,483 @@ class TrialData(BaseModel):
     Primary_Purpose: str | None = None
     intervention: str | None = None
     condition: str | None = None
+    # Raw 'Allocation: ...|Masking: ...' string; fills design fields left empty
+    study_design: str | None = None
+    withdrawal_count: float | None = None
+    facility_count: int | None = None
+    country_count: int | None = None
+    event_count: int | None = None
+    subjects_at_risk: float | None = None
+
+class TrialBatch(BaseModel):
+    trials: List[TrialData]
+
+def encode_trials(trials: List[TrialData], serving: ServingModel) -> pd.DataFrame:
+    """Build the model input of `serving` for a batch of trials, encoding each column in one pass"""
+    with metrics.stage('frame'):
+        data = pd.DataFrame([trial.model_dump() for trial in trials], columns=list(TrialData.model_fields))
+
+        # Design fields sent explicitly win over those parsed from study_design
+        has_design = data['study_design'].notna()
+        if has_design.any():
+            parsed = parse_study_design(data.loc[has_design, 'study_design'])
+            for col in DESIGN_COLUMNS:
+                data.loc[has_design, col] = data.loc[has_design, col].fillna(parsed[col].astype(object))
+        # Same cleanup as training, whether criteria are label-encoded or hashed
+        data['criteria'] = clean_criteria(data['criteria'].astype(object))
+
+    with metrics.stage('encode'):
+        # Apply label encoding to categorical features
+        sparse_encoders = {**serving.multi_hot_encoders, **serving.text_hashers}
+        for col in CATEGORICAL_COLS:
+            if col not in sparse_encoders:
+                data[col], unknown = serving.compiled_encoders.encode_counting(col, data[col])
+                metrics.count_unknown(col, unknown)
+        # No records in a source means a count of 0
+        data[AGGREGATE_COLS] = data[AGGREGATE_COLS].astype(float).fillna(0)
+
+        # Multi-hot and hashed text fields: the sparse rows are densified, request batches are small
+        blocks = []
+        for col, encoder in sparse_encoders.items():
+            matrix = encoder.transform(data[col])
+            if col in serving.multi_hot_encoders:
+                # Rows with a token outside the vocabulary set the trailing other column
+                metrics.count_unknown(col, int(matrix[:, -1].sum()))
+            blocks.append(pd.DataFrame(matrix.toarray().astype(np.float32),
+                                       columns=encoder.feature_names(), index=data.index))
+        if blocks:
+            data = pd.concat([data.drop(columns=list(sparse_encoders))] + blocks, axis=1)
+
+    return data[serving.feature_order]
+
+def run_inference(data: pd.DataFrame, explain_modes: np.ndarray, serving: ServingModel):
+    """
+    Predict a whole batch with a single predict_proba call and explain it
+    with one SHAP call per explanation mode present in `explain_modes`.
+    Rows that were not explained get NaN contributions.
+    """
+    with metrics.stage('predict'):
+        probabilities = serving.predict_proba(data, COMPILED_FOREST_MAX_ROWS)
+        predictions = serving.model.classes_.take(np.argmax(probabilities, axis=1))
+    shap_matrix = np.full(data.shape, np.nan)
+    for mode in EXPLANATION_MODES:
+        rows = explain_modes == mode
+        if not rows.any():
+            continue
+        with metrics.stage('shap'):
+            if rows.all():
+                shap_matrix[:] = compute_contributions(serving.explainer, data, mode)
+            else:
+                shap_matrix[rows] = compute_contributions(serving.explainer, data[rows], mode)
+    return predictions, shap_matrix
+
+# Runs model inference on worker threads, merging concurrent requests for the same model version into one batch
+scheduler = InferenceScheduler(
+    run_inference,
+    window_ms=BATCH_WINDOW_MS,
+    max_batch_rows=MAX_BATCH_ROWS,
+    max_queue_depth=MAX_QUEUE_DEPTH,
+    workers=INFERENCE_WORKERS
+)
+
+# (model_version, explanation mode, encoded row) -> (prediction, SHAP row)
+explanation_cache = LRUCache(EXPLANATION_CACHE_SIZE, EXPLANATION_CACHE_TTL)
+# request_id -> (trial, encoded row) for predictions served with explain=false
+pending_explanations = LRUCache(PENDING_EXPLANATIONS_SIZE, EXPLANATION_CACHE_TTL)
+
+def warm_up(serving: ServingModel) -> Dict[str, float]:
+    """
+    Encode an empty trial and score the canary rows before a version takes
+    traffic. Explanations are warmed up too, except for the first version
+    unless EXPLAINER_LOADING=eager.
+    """
+    encode_trials([TrialData()], serving)
+    explain = EXPLAINER_LOADING == 'eager' or model_manager.current is not None
+    return serving.warm_up(EXPLANATION_MODES if explain else ())
+
+def clear_explanations(serving: ServingModel, previous: Optional[ServingModel]):
+    """Entries are keyed by version, so the previous version's are dead weight"""
+    if previous is not None:
+        explanation_cache.clear()
+
+# Loads new versions in the background and swaps them in between requests
+model_manager = ModelManager(load_serving_model, warm_up=warm_up, on_swap=clear_explanations)
+if MODEL_LOADING == 'import':
+    try:
+        model_manager.load()
+        print("Model and encoders loaded successfully.")
+    except Exception as e:
+        raise RuntimeError(f"Failed to load model or explainer: {str(e)}")
+_model_checked_at = time.monotonic()
+
+def start_up():
+    """
+    Runs on a thread once the server has started: loads the first version
+    with MODEL_LOADING=background, then builds and warms up its explainer
+    with EXPLAINER_LOADING=background.
+    """
+    if model_manager.current is None:
+        model_manager.reload(wait=True)
+    serving = model_manager.current
+    if serving is None or EXPLAINER_LOADING != 'background' or serving.explainer_state() != 'lazy':
+        return
+    try:
+        serving.warm_up_explanations()
+        print(f"SHAP explainer for version {serving.version} ready in {serving.explainer_seconds}s")
+    except Exception as e:
+        print(f"Explainer warm-up failed for version {serving.version}, "
+              f"explanations will retry it on demand: {str(e)}")
+
+def check_model_version():
+    """Start loading a new version once the registry's CURRENT (or the legacy model file) changes"""
+    global _model_checked_at
+    if model_manager.current is None:
+        # The first version is still loading in the background
+        return
+    now = time.monotonic()
+    if now - _model_checked_at < MODEL_CHECK_INTERVAL:
+        return
+    _model_checked_at = now
+    try:
+        version = registry.current()
+        latest = version or file_fingerprint(MODEL_PATH)
+    except OSError:
+        return
+    if latest != model_manager.current.version and latest not in model_manager.failed:
+        if model_manager.reload(version, label=latest):
+            print(f"Model version {latest} found; loading it in the background.")
+
+def _to_native(value: Any) -> Any:
+    """Convert numpy scalars to plain Python values for JSON responses"""
+    return value.item() if isinstance(value, np.generic) else value
+
+def build_prediction_response(trial_data: TrialData, prediction: Any,
+                              shap_row: Optional[np.ndarray], columns: List[str],
+                              request_id: Optional[str] = None,
+                              explanation_mode: str = 'exact',
+                              feature_fields: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Assemble the /predict response for one trial. Without a SHAP row the
+    explanation is left out and `request_id` points to /explanations.
+    """
+    prediction = _to_native(prediction)
+    response = {
+        "study_title": trial_data.study_title,
+        "criteria": trial_data.criteria,
+        "enrollment": trial_data.enrollment,
+        "Allocation": trial_data.Allocation,
+        "Intervention_Model": trial_data.Intervention_Model,
+        "Masking": trial_data.Masking,
+        "Primary_Purpose": trial_data.Primary_Purpose,
+        "intervention": trial_data.intervention,
+        "condition": trial_data.condition,
+        "prediction": prediction,
+    }
+    if request_id is not None:
+        response["request_id"] = request_id
+    if shap_row is None:
+        response["explanation"] = None
+        return response
+
+    # Convert to dictionary with scalar values; multi-hot columns add up to their field
+    feature_importance = {}
+    for col, val in zip(columns, shap_row):
+        field = (feature_fields or {}).get(col, col)
+        feature_importance[field] = feature_importance.get(field, 0.0) + float(val)
+
+    # Get top TOP_K features or all if fewer
+    top_features = dict(sorted(
+        feature_importance.items(),
+        key=lambda x: abs(x[1]),
+        reverse=True
+    )[:TOP_K])
+
+    # Create interpretation
+    interpretation = []
+    for feature, impact in top_features.items():
+        direction = "increased" if impact > 0 else "decreased"
+        impact_str = f"{abs(impact):.3f}"
+        interpretation.append(f"{feature} {direction} likelihood of completion by {impact_str}")
+
+    response["explanation"] = {
+        "top_contributing_features": top_features,
+        "interpretation": f"The model predicted {prediction}. " + " ".join(interpretation),
+        "mode": explanation_mode
+    }
+    return response
+
+def resolve_explanation_mode(explanation_mode: Optional[str]) -> str:
+    """Validate a per-request explanation mode, defaulting to EXPLANATION_MODE"""
+    mode = explanation_mode or EXPLANATION_MODE
+    if mode not in EXPLANATION_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"explanation_mode must be one of {', '.join(EXPLANATION_MODES)}"
+        )
+    return mode
+
+async def score_rows(data: pd.DataFrame, explain_mode: Optional[str], serving: ServingModel):
+    """
+    Predict rows encoded for `serving`, serving repeats from the explanation cache.
+    Returns per-row predictions and SHAP rows (None when explain_mode is None).
+    """
+    rows = data.to_numpy(dtype=np.float64)
+    # Prediction-only lookups reuse entries cached under the default mode
+    lookup_mode = explain_mode or EXPLANATION_MODE
+    keys = [(serving.version, lookup_mode, row.tobytes()) for row in rows]
+    cached = [explanation_cache.get(key) for key in keys]
+
+    predictions = [entry[0] if entry is not None else None for entry in cached]
+    shap_rows = [entry[1] if entry is not None and explain_mode else None for entry in cached]
+
+    missing = [i for i, entry in enumerate(cached) if entry is None]
+    if missing:
+        # Queue wait plus the batched predict and SHAP calls
+        with metrics.stage('inference'):
+            new_predictions, new_shap = await scheduler.submit(data.iloc[missing], explain_mode, context=serving)
+        for i, prediction, shap_row in zip(missing, new_predictions, new_shap):
+            predictions[i] = prediction
+            # Only complete results go into the cache
+            if explain_mode:
+                shap_rows[i] = shap_row
+                explanation_cache.put(keys[i], (prediction, shap_row))
+    return predictions, shap_rows
+
+async def predict_trials(trials: List[TrialData], explain: bool = True,
+                         explanation_mode: str = EXPLANATION_MODE) -> List[Dict[str, Any]]:
+    """
+    Score a batch of trials and build one response per trial. With
+    explain=False the SHAP pass is skipped and each response gets a
+    request_id that can be resolved later through /explanations.
+    """
+    check_model_version()
+    # The whole batch is encoded, scored and explained by the same version
+    serving = model_manager.serving()
+    data = encode_trials(trials, serving)
+    predictions, shap_rows = await score_rows(data, explanation_mode if explain else None, serving)
+    columns = list(data.columns)
+
+    with metrics.stage('respond'):
+        responses = []
+        for i, (trial, prediction, shap_row) in enumerate(zip(trials, predictions, shap_rows)):
+            request_id = None
+            if not explain:
+                request_id = uuid.uuid4().hex
+                pending_explanations.put(request_id, (trial, data.iloc[[i]], serving.version))
+            responses.append(build_prediction_response(
+                trial, prediction, shap_row, columns, request_id, explanation_mode, serving.feature_fields
+            ))
+    return responses
 
 @app.post("/predict")
-async def predict(trial_data: TrialData):
+async def predict(trial_data: TrialData, explain: bool = True, explanation_mode: Optional[str] = None):
+    # Body read and pydantic validation happen before the endpoint runs
+    metrics.since_request_start('parse')
+    mode = resolve_explanation_mode(explanation_mode)
     try:
-        # Prepare the data as a DataFrame
-        data = pd.DataFrame([trial_data.model_dump()])
+        return (await predict_trials([trial_data], explain, mode))[0]
 
-        # Apply label encoding to categorical features
-        categorical_cols = [
-            'study_title', 'criteria', 'Allocation', 
-            'Intervention_Model', 'Masking', 'Primary_Purpose',
-            'intervention', 'condition'
-        ]
-        
-        for col in categorical_cols:
-            if col in data.columns:
-                data[col] = data[col].fillna('Missing').apply(
-                    lambda x: x if x in label_encoders[col].classes_ else 'Unknown'
-                )
-                if 'Unknown' not in label_encoders[col].classes_:
-                    label_encoders[col].classes_ = np.append(label_encoders[col].classes_, 'Unknown')
-                data[col] = label_encoders[col].transform(data[col])
-
-        # Ensure feature order matches training data
-        feature_order = [
-            'study_title', 'criteria', 'enrollment',
-            'Allocation', 'Intervention_Model', 'Masking', 'Primary_Purpose',
-            'intervention', 'condition'
-        ]
-        data = data[feature_order]
-
-        # Predict
-        prediction = model.predict(data)
-
-        # Get SHAP values as numpy array
-        shap_values = explainer.shap_values(data)
-        if isinstance(shap_values, list):
-            shap_array = shap_values[1][0]  # Index 1 for positive class, then [0] for single row
-        else:
-            shap_array = shap_values[0][0]  # For binary classification, pick [0] for single row
-
-        # Convert to dictionary with scalar values
-        feature_importance = {
-            col: float(val) 
-            for col, val in zip(data.columns, shap_array)
-        }
-
-        # Get top 5 features or all if fewer than 5
-        top_features = dict(sorted(
-            feature_importance.items(),
-            key=lambda x: abs(x[1]),
-            reverse=True
-        )[:5])
-
-        # Create interpretation
-        interpretation = []
-        for feature, impact in top_features.items():
-            direction = "increased" if impact > 0 else "decreased"
-            impact_str = f"{abs(impact):.3f}"
-            interpretation.append(f"{feature} {direction} likelihood of completion by {impact_str}")
-
-        return {
-            "study_title": trial_data.study_title,
-            "criteria": trial_data.criteria,
-            "enrollment": trial_data.enrollment,
-            "Allocation": trial_data.Allocation,
-            "Intervention_Model": trial_data.Intervention_Model,
-            "Masking": trial_data.Masking,
-            "Primary_Purpose": trial_data.Primary_Purpose,
-            "intervention": trial_data.intervention,
-            "condition": trial_data.condition,
-            "prediction": prediction[0],
-            "explanation": {
-                "top_contributing_features": top_features,
-                "interpretation": f"The model predicted {prediction[0]}. " + " ".join(interpretation)
-            }
-        }
+    except (SchedulerOverloaded, ModelNotLoaded) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Prediction error: {str(e)}")
+
+@app.post("/predict/batch")
+async def predict_batch(batch: TrialBatch, explain: bool = True, explanation_mode: Optional[str] = None):
+    metrics.since_request_start('parse')
+    mode = resolve_explanation_mode(explanation_mode)
+    if not batch.trials:
+        return {"predictions": []}
+    try:
+        return {"predictions": await predict_trials(batch.trials, explain, mode)}
 
+    except (SchedulerOverloaded, ModelNotLoaded) as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Prediction error: {str(e)}")
 
-# Health check endpoint
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    Streaming response for generators that are still reading the request body.
+    StreamingResponse normally listens for client disconnects on receive(),
+    which would swallow the body messages the generator is waiting for.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def _iter_ndjson_lines(request: Request):
+    """Yield complete lines from a streamed request body"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+@app.post("/predict/batch/stream")
+async def predict_batch_stream(request: Request, explain: bool = True,
+                               explanation_mode: Optional[str] = None):
+    """
+    Score newline-delimited JSON trials, one object per line, and stream
+    one NDJSON result per input line in the same order.
+    """
+    mode = resolve_explanation_mode(explanation_mode)
+
+    async def generate():
+        pending: List[TrialData] = []
+        line_number = 0
+
+        async def flush():
+            try:
+                results = await predict_trials(pending, explain, mode)
+            except Exception as e:
+                results = [{"error": f"Prediction error: {str(e)}"}] * len(pending)
+            pending.clear()
+            return "".join(json.dumps(result) + "\n" for result in results)
+
+        async for line in _iter_ndjson_lines(request):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                with metrics.stage('parse'):
+                    pending.append(TrialData.model_validate_json(line))
+            except ValidationError as e:
+                # Keep output aligned with input: emit queued results before the error
+                if pending:
+                    yield await flush()
+                yield json.dumps({"line": line_number, "error": f"Invalid trial: {str(e)}"}) + "\n"
+                continue
+            if len(pending) >= STREAM_CHUNK_SIZE:
+                yield await flush()
+
+        if pending:
+            yield await flush()
+
+    return NDJSONStreamingResponse(generate())
+
+@app.get("/explanations/{request_id}")
+async def get_explanation(request_id: str, explanation_mode: Optional[str] = None):
+    """Explain a prediction that was served with explain=false"""
+    mode = resolve_explanation_mode(explanation_mode)
+    item = pending_explanations.get(request_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired request_id: {request_id}")
+    trial_data, data, version = item
+    try:
+        check_model_version()
+        serving = model_manager.serving()
+        if version != serving.version:
+            # The model changed since the prediction; explain with the one now served
+            data = encode_trials([trial_data], serving)
+        predictions, shap_rows = await score_rows(data, mode, serving)
+        return build_prediction_response(trial_data, predictions[0], shap_rows[0],
+                                         list(data.columns), request_id, mode, serving.feature_fields)
+
+    except (SchedulerOverloaded, ModelNotLoaded) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Explanation error: {str(e)}")
+
+@app.get("/cache")
+async def cache_stats():
+    """Explanation cache hit/miss counters"""
+    return {"model_version": model_manager.status()["version"], **explanation_cache.stats()}
+
+@app.get("/scheduler")
+async def scheduler_stats():
+    """Micro-batching settings, queue depth and batch-size counters"""
+    return scheduler.stats()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text-format metrics"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=0)")
+    scheduler_stats = scheduler.stats()
+    metrics.gauge('scheduler_queue_depth', "Requests waiting for an inference worker").set(
+        value=scheduler_stats['queue_depth'])
+    metrics.gauge('explanation_cache_entries', "Entries in the explanation cache").set(
+        value=len(explanation_cache))
+    metrics.gauge('explanation_cache_hit_ratio', "Explanation cache hits per lookup").set(
+        value=explanation_cache.stats()['hit_rate'])
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/model")
+async def model_status():
+    """Version being served, its metadata and the state of background reloads"""
+    serving = model_manager.current
+    status = {**model_manager.status(), "registry": MODEL_REGISTRY_DIR, "registry_current": registry.current()}
+    if serving is None:
+        return status
+    metadata = {key: value for key, value in serving.metadata.items() if key != 'feature_importances'}
+    if 'metrics' in metadata:
+        metadata['metrics'] = {key: value for key, value in metadata['metrics'].items() if key != 'report'}
+    return {
+        **status,
+        "compiled_forest": serving.compiled_forest is not None,
+        "explainer": serving.explainer_state(),
+        "metadata": metadata,
+    }
+
+@app.post("/model/reload", status_code=202)
+async def reload_model(version: Optional[str] = None):
+    """
+    Load a registry version (the registry's CURRENT by default) in the
+    background and swap it in once it has passed its canary batch.
+    Requests keep being served by the current version meanwhile. A given
+    version is also made CURRENT, so other workers follow within
+    MODEL_CHECK_INTERVAL and the version watcher does not switch back.
+    """
+    if version is not None:
+        if version not in registry.versions():
+            raise HTTPException(status_code=404, detail=f"Unknown model version: {version}")
+        registry.set_current(version)
+        model_manager.failed.discard(version)
+    target = version or registry.current()
+    # A load of the same target started by the version watcher counts as accepted
+    if not model_manager.reload(target, label=target) and model_manager.loading != (target or "default"):
+        raise HTTPException(status_code=409, detail=f"Already loading {model_manager.loading}")
+    return {"loading": target or MODEL_PATH, "serving": model_manager.status()["version"]}
+
+# Liveness: the process is up and its event loop is answering
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness: 503 until a model version is loaded and warmed up, then 200
+    with the version, the explainer's state and how long the version took
+    to load. Requests that need an explanation before the explainer is
+    ready wait for it.
+    """
+    serving = model_manager.current
+    if serving is None:
+        status = "failed" if model_manager.last_error is not None and model_manager.loading is None else "loading"
+        return JSONResponse(status_code=503, content={"status": status, "error": model_manager.last_error})
+    loaded = next((entry for entry in reversed(model_manager.history) if entry["version"] == serving.version), {})
+    return {
+        "status": "ready",
+        "pid": os.getpid(),
+        "model_version": serving.version,
+        "explainer": serving.explainer_state(),
+        "startup": {
+            "model_loading": MODEL_LOADING,
+            "explainer_loading": EXPLAINER_LOADING,
+            "load_seconds": loaded.get("load_seconds"),
+            "warm_up_seconds": loaded.get("warm_up_seconds"),
+            "explainer_seconds": serving.explainer_seconds,
+        },
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,212 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    """Monotonic count per label combination"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+class Gauge(Counter):
+    """Current value per label combination"""
+    kind = "gauge"
+
+    def set(self, *label_values: str, value: float):
+        with self._lock:
+            self._values[label_values] = value
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label combination"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values: str, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class RequestTimings:
+    """Stage durations of one request, reported in its Server-Timing header"""
+    __slots__ = ("start", "stages")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self) -> str:
+        entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ", ".join(entries)
+
+# Timings of the request being served; unset on inference threads and outside requests
+_current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+class Metrics:
+    """
+    Request and stage latency histograms plus request, error and
+    unknown-category counters, rendered in the Prometheus text format.
+    With enabled=False every method is a no-op, so instrumented code paths
+    cost one attribute check.
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = "trialvision"):
+        self.enabled = enabled
+        self.requests = Counter(f"{prefix}_requests_total", "HTTP requests served",
+                                ("method", "path", "status"))
+        self.errors = Counter(f"{prefix}_errors_total", "HTTP requests answered with a 4xx/5xx status",
+                              ("path", "status"))
+        self.request_latency = Histogram(f"{prefix}_request_duration_seconds",
+                                         "Time from receiving a request to its last response byte", ("path",))
+        self.stage_latency = Histogram(f"{prefix}_stage_duration_seconds",
+                                       "Time spent per processing stage", ("stage",))
+        self.unknown_categories = Counter(f"{prefix}_unknown_category_total",
+                                          "Values encoded as unknown because training never saw them",
+                                          ("column",))
+        self.gauges: Dict[str, Gauge] = {}
+        self._prefix = prefix
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        """A gauge set at scrape time, created on first use"""
+        name = f"{self._prefix}_{name}"
+        if name not in self.gauges:
+            self.gauges[name] = Gauge(name, help, labels)
+        return self.gauges[name]
+
+    def observe_stage(self, stage: str, seconds: float):
+        """Record one stage duration, and add it to the current request's Server-Timing"""
+        if not self.enabled:
+            return
+        self.stage_latency.observe(stage, value=seconds)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(stage, seconds)
+
+    def stage(self, stage: str):
+        """Context manager timing a block as `stage`"""
+        return self._timed(stage) if self.enabled else nullcontext()
+
+    @contextmanager
+    def _timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start)
+
+    def since_request_start(self, stage: str):
+        """Record the time since the request arrived, e.g. body parsing and validation before the endpoint"""
+        timings = _current_timings.get() if self.enabled else None
+        if timings is not None:
+            self.observe_stage(stage, time.perf_counter() - timings.start - sum(timings.stages.values()))
+
+    def count_unknown(self, column: str, count: int):
+        if self.enabled and count:
+            self.unknown_categories.inc(column, amount=count)
+
+    def render(self) -> str:
+        metrics = [self.requests, self.errors, self.request_latency, self.stage_latency,
+                   self.unknown_categories, *self.gauges.values()]
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and errors, timing them per route and
+    adding a Server-Timing header with the stages recorded before the
+    response started. Routes are labelled by their path template, so
+    /explanations/{request_id} stays one series.
+    """
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                MutableHeaders(scope=message).append("Server-Timing", timings.header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timings.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            self.metrics.request_latency.observe(path, value=time.perf_counter() - timings.start)
+            self.metrics.requests.inc(scope["method"], path, str(status[0]))
+            if status[0] >= 400:
+                self.metrics.errors.inc(path, str(status[0]))
@@ -0,0 +1,194 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+class SchedulerOverloaded(Exception):
+    """Raised when the inference queue is full"""
+
+class _Pending:
+    """One caller's rows waiting to be scored"""
+    __slots__ = ("data", "explain_mode", "context", "future")
+
+    def __init__(self, data: pd.DataFrame, explain_mode: Optional[str], context: Any, future: asyncio.Future):
+        self.data = data
+        self.explain_mode = explain_mode
+        self.context = context
+        self.future = future
+
+    def explain_modes(self) -> np.ndarray:
+        return np.full(len(self.data), self.explain_mode, dtype=object)
+
+class InferenceScheduler:
+    """
+    Dynamic micro-batching in front of a CPU-bound inference function.
+
+    Callers submit encoded rows and await their results. Rows that arrive
+    within `window_ms` of the first queued request (or until `max_batch_rows`
+    is reached) are concatenated and scored with one call to `infer_fn` on a
+    worker thread, so the event loop stays free to serve other requests.
+    A new batch is only formed when a worker is free, which lets batches grow
+    under load instead of queueing many tiny ones.
+
+    `infer_fn(data, explain_modes, context)` receives each row's explanation
+    mode (None when its caller did not ask for one) and the `context` its
+    callers submitted with, and must return a tuple of row-aligned arrays;
+    each caller receives the slice of every array for its rows. Callers with
+    different contexts (e.g. rows encoded for different model versions) are
+    never scored in the same call.
+    """
+
+    def __init__(self, infer_fn: Callable[[pd.DataFrame, np.ndarray, Any], Tuple[np.ndarray, ...]],
+                 window_ms: float = 3.0, max_batch_rows: int = 256,
+                 max_queue_depth: int = 1024, workers: int = 1):
+        self.infer_fn = infer_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_rows = max_batch_rows
+        self.max_queue_depth = max_queue_depth
+        self.workers = workers
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_depth)
+        self._slots = asyncio.Semaphore(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self._task: asyncio.Task | None = None
+
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+
+    def start(self):
+        """Start the batching loop on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop batching and release the worker threads"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, data: pd.DataFrame, explain_mode: Optional[str] = None,
+                     context: Any = None) -> Tuple[np.ndarray, ...]:
+        """Queue rows for scoring and wait for this caller's slice of the results"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_Pending(data, explain_mode, context, future))
+        except asyncio.QueueFull:
+            raise SchedulerOverloaded(f"Inference queue is full ({self.max_queue_depth} requests)")
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        """Current settings and batching counters"""
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch_rows": self.max_batch_rows,
+            "max_queue_depth": self.max_queue_depth,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_rows": self.rows / self.batches if self.batches else 0.0,
+            "largest_batch_rows": self.largest_batch,
+        }
+
+    async def _collect(self) -> List[_Pending]:
+        """Wait for one request, then gather more until the window or row cap is hit"""
+        batch = [await self._queue.get()]
+        rows = len(batch[0].data)
+        deadline = time.monotonic() + self.window
+        while rows < self.max_batch_rows:
+            # Take whatever is already queued without waiting
+            if not self._queue.empty():
+                pending = self._queue.get_nowait()
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch.append(pending)
+            rows += len(pending.data)
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List[_Pending]):
+        try:
+            # One inference call per context, in order of first arrival
+            groups: Dict[int, List[_Pending]] = {}
+            for pending in batch:
+                if not pending.future.cancelled():
+                    groups.setdefault(id(pending.context), []).append(pending)
+            for group in groups.values():
+                await self._score(group)
+        finally:
+            self._slots.release()
+
+    async def _score(self, batch: List[_Pending]):
+        loop = asyncio.get_running_loop()
+        try:
+            if len(batch) == 1:
+                data, explain_modes = batch[0].data, batch[0].explain_modes()
+            else:
+                data = pd.concat([pending.data for pending in batch], ignore_index=True)
+                explain_modes = np.concatenate([pending.explain_modes() for pending in batch])
+            try:
+                results = await loop.run_in_executor(self._executor, self.infer_fn, data, explain_modes,
+                                                     batch[0].context)
+            except Exception:
+                if len(batch) == 1:
+                    raise
+                # Score callers separately so one bad request does not fail the rest
+                for pending in batch:
+                    await self._dispatch_single(pending)
+                return
+
+            self.batches += 1
+            self.rows += len(data)
+            self.largest_batch = max(self.largest_batch, len(data))
+
+            start = 0
+            for pending in batch:
+                end = start + len(pending.data)
+                if not pending.future.done():
+                    pending.future.set_result(tuple(result[start:end] for result in results))
+                start = end
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+
+    async def _dispatch_single(self, pending: _Pending):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self._executor, self.infer_fn, pending.data, pending.explain_modes(), pending.context
+            )
+        except Exception as e:
+            if not pending.future.done():
+                pending.future.set_exception(e)
+            return
+        self.batches += 1
+        self.rows += len(pending.data)
+        if not pending.future.done():
+            pending.future.set_result(results)
@@ -0,0 +1,145 @@
+"""
+Pre-fork server for the prediction API. The master process imports the app
+once, which loads the model, compiled forest, encoders and SHAP explainer,
+freezes the garbage collector and forks the workers. Workers inherit the
+loaded model instead of each importing and unpickling their own, and since
+frozen objects are never visited by the collector, their pages stay shared
+copy-on-write until a worker writes to them.
+
+Run from the project root:
+    python -m app.serve --workers 4 --port 8000
+"""
+import argparse
+import ctypes
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# Seconds a worker gets to finish in-flight requests after SIGTERM
+GRACEFUL_TIMEOUT = 30
+# A worker that exits sooner than this after starting is not restarted; the server shuts down instead
+MIN_WORKER_UPTIME = 5.0
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """Listening socket created before the fork and shared by every worker"""
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+def release_unused_memory():
+    """
+    Hand memory that loading freed back to the OS before forking. Allocators
+    keep freed pages for reuse, and a worker reusing one copies it first.
+    pyarrow's pool, which pandas' string columns allocate from, keeps what
+    the warm-up freed, and glibc keeps the top of its heap.
+    """
+    gc.collect()
+    try:
+        import pyarrow
+        pyarrow.default_memory_pool().release_unused()
+    except ImportError:
+        pass
+    try:
+        ctypes.CDLL(None).malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def run_worker(app, sock: socket.socket, log_level: str):
+    """Serve on the inherited socket until SIGTERM or SIGINT"""
+    import uvicorn
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # The inherited model sits in the frozen generation; only objects created from here on are collected
+    gc.enable()
+    config = uvicorn.Config(app, log_level=log_level, timeout_graceful_shutdown=GRACEFUL_TIMEOUT)
+    uvicorn.Server(config).run(sockets=[sock])
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the prediction API from pre-forked workers")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1)),
+                        help="worker processes (default: WEB_CONCURRENCY, else the CPU count)")
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args()
+
+    # 1) Load everything workers should share. The model has to be loaded during
+    #    import to be in memory before the fork, and the explainer is built up
+    #    front unless EXPLAINER_LOADING says otherwise
+    os.environ['MODEL_LOADING'] = 'import'
+    os.environ.setdefault('EXPLAINER_LOADING', 'eager')
+    # Collections during the load would only touch pages that are about to be shared
+    gc.disable()
+    start = time.perf_counter()
+    from app.main import app
+    print(f"Loaded the app in {time.perf_counter() - start:.2f}s")
+    release_unused_memory()
+    gc.freeze()
+    sock = bind_socket(args.host, args.port)
+
+    # 2) Fork the workers, and start a replacement whenever one dies
+    workers = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(app, sock, args.log_level)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        workers[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        # Workers also get SIGINT from the terminal; a SIGTERM on top of it still shuts them down gracefully
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(max(args.workers, 1)):
+        spawn()
+    print(f"Master {os.getpid()} serving on http://{args.host}:{args.port} "
+          f"with workers {', '.join(str(pid) for pid in workers)}")
+
+    status = 0
+    while workers:
+        try:
+            pid, wait_status = os.wait()
+        except ChildProcessError:
+            break
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        code = os.waitstatus_to_exitcode(wait_status)
+        if time.monotonic() - started < MIN_WORKER_UPTIME:
+            print(f"Worker {pid} exited with status {code} right after starting; shutting down")
+            status = 1
+            stop(signal.SIGTERM, None)
+            continue
+        print(f"Worker {pid} exited with status {code}; starting a new one")
+        spawn()
+    sock.close()
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import json
+import os
+import pickle
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from app.explain import EXPLANATION_MODES, compute_contributions
+from app.encoding import CompiledEncoders
+from forest_compiler import CompiledForest
+from model_registry import (CANARY_FILE, COMPILED_DIR, FEATURE_SPEC_FILE, LABEL_ENCODERS_FILE, MODEL_FILE,
+                            ModelRegistry)
+from multi_hot import MultiHotEncoder
+from text_features import TextHasher
+
+# Swaps kept in ModelManager.status()
+HISTORY_SIZE = 10
+
+class ModelNotLoaded(RuntimeError):
+    """Raised for requests that arrive before the first model version has been loaded"""
+
+class ServingModel:
+    """
+    One model version and everything derived from it for serving: encoders,
+    compiled forest, SHAP explainer and feature order. It is never modified
+    after loading, so a request keeps using the version it started with
+    while a newer one is swapped in. The one exception is the explainer:
+    shap and its TreeExplainer are only loaded on first use, since importing
+    shap takes longer than loading the rest of the model.
+    """
+
+    def __init__(self, version: str, model, label_encoders, feature_spec: Optional[dict] = None,
+                 compiled_forest: Optional[CompiledForest] = None, default_feature_order: Sequence[str] = (),
+                 metadata: Optional[dict] = None, canary: Optional[dict] = None):
+        self.version = version
+        self.model = model
+        self.compiled_forest = compiled_forest
+        self.metadata = metadata or {}
+        self.canary = canary
+
+        # Models trained on other columns (e.g. --aggregate-features) define their own order
+        self.feature_order = list(default_feature_order)
+        if set(getattr(model, 'feature_names_in_', [])) - set(self.feature_order):
+            self.feature_order = list(model.feature_names_in_)
+
+        feature_spec = feature_spec or {}
+        # Hash-based lookup tables; the pickled encoders stay untouched
+        self.compiled_encoders = CompiledEncoders.from_label_encoders(
+            label_encoders, feature_spec.get('appended_classes'))
+        # Fields trained as sparse multi-hot columns (preprocessing --encoding sparse)
+        # or hashed term vectors (--text-encoding hashed)
+        self.multi_hot_encoders = {
+            col: MultiHotEncoder.from_dict(encoder)
+            for col, encoder in feature_spec.get('multi_hot', {}).items()
+        }
+        self.text_hashers = {
+            col: TextHasher.from_dict(hasher)
+            for col, hasher in feature_spec.get('text_hashing', {}).items()
+        }
+        # Encoded column -> request field, for reporting explanations per field
+        self.feature_fields = {
+            name: col
+            for col, encoder in {**self.multi_hot_encoders, **self.text_hashers}.items()
+            for name in encoder.feature_names()
+        }
+        self._explainer = None
+        self._explainer_lock = threading.Lock()
+        self.explainer_seconds: Optional[float] = None
+
+    @classmethod
+    def from_files(cls, version: str, model_path: str, label_encoders_path: str,
+                   feature_spec_path: Optional[str] = None, compiled_dir: Optional[str] = None,
+                   default_feature_order: Sequence[str] = (), metadata: Optional[dict] = None,
+                   canary_path: Optional[str] = None) -> "ServingModel":
+        with open(model_path, 'rb') as f:
+            model = pickle.load(f)
+        # Memory-mapped forest arrays, shared between worker processes through the page cache
+        compiled_forest = None
+        if compiled_dir and os.path.isdir(compiled_dir):
+            compiled_forest = CompiledForest.load(compiled_dir)
+            if not compiled_forest.is_compiled_from(model_path):
+                print(f"{compiled_dir} is out of date with {model_path}; "
+                      "run `python src/forest_compiler.py` to rebuild it.")
+                compiled_forest = None
+        with open(label_encoders_path, 'rb') as f:
+            label_encoders = pickle.load(f)
+        feature_spec = None
+        if feature_spec_path and os.path.exists(feature_spec_path):
+            with open(feature_spec_path) as f:
+                feature_spec = json.load(f)
+        canary = None
+        if canary_path and os.path.exists(canary_path):
+            with np.load(canary_path) as arrays:
+                canary = {name: arrays[name] for name in arrays.files}
+        return cls(version, model, label_encoders, feature_spec, compiled_forest,
+                   default_feature_order, metadata, canary)
+
+    @classmethod
+    def from_registry(cls, registry: ModelRegistry, version: str,
+                      default_feature_order: Sequence[str] = ()) -> "ServingModel":
+        return cls.from_files(
+            version, registry.path(version, MODEL_FILE), registry.path(version, LABEL_ENCODERS_FILE),
+            registry.path(version, FEATURE_SPEC_FILE), registry.path(version, COMPILED_DIR),
+            default_feature_order, registry.metadata(version), registry.path(version, CANARY_FILE)
+        )
+
+    @property
+    def explainer(self):
+        """The SHAP TreeExplainer, built by the first caller; concurrent callers wait for it"""
+        if self._explainer is None:
+            with self._explainer_lock:
+                if self._explainer is None:
+                    start = time.perf_counter()
+                    import shap
+                    self._explainer = shap.TreeExplainer(self.model)
+                    self.explainer_seconds = round(time.perf_counter() - start, 3)
+        return self._explainer
+
+    def explainer_state(self) -> str:
+        """'ready', 'building', or 'lazy' when nothing has asked for it yet"""
+        if self._explainer is not None:
+            return "ready"
+        return "building" if self._explainer_lock.locked() else "lazy"
+
+    def predict_proba(self, data: pd.DataFrame, compiled_max_rows: int) -> np.ndarray:
+        """Small batches use the compiled forest; larger ones are faster in scikit-learn"""
+        if self.compiled_forest is not None and len(data) <= compiled_max_rows:
+            return self.compiled_forest.predict_proba(data)
+        return self.model.predict_proba(data)
+
+    def _canary_rows(self):
+        """Canary rows and their published probabilities, or one all-zero row and None"""
+        if self.canary is not None:
+            columns = [str(c) for c in self.canary['columns']]
+            if columns != self.feature_order:
+                raise ValueError(f"Canary columns of {self.version} do not match its feature order")
+            return pd.DataFrame(self.canary['X'], columns=columns), self.canary['proba']
+        return pd.DataFrame(np.zeros((1, len(self.feature_order)), dtype=np.float32), columns=self.feature_order), None
+
+    def warm_up(self, modes: Sequence[str] = EXPLANATION_MODES) -> Dict[str, float]:
+        """
+        Score the canary rows with the compiled forest and scikit-learn and
+        explain them in every mode in `modes`, so the first requests do not
+        pay for cold caches. Raises if the probabilities differ from the ones
+        recorded when the version was published, or from each other.
+        Without canary rows one all-zero row is used and nothing is compared.
+        """
+        X, expected = self._canary_rows()
+        timings = {}
+        start = time.perf_counter()
+        proba = self.model.predict_proba(X)
+        timings['predict_ms'] = (time.perf_counter() - start) * 1000
+        if expected is not None and not np.allclose(proba, expected):
+            raise ValueError(f"Canary probabilities of {self.version} differ from the published ones")
+        if self.compiled_forest is not None:
+            start = time.perf_counter()
+            compiled = self.compiled_forest.predict_proba(X)
+            timings['compiled_predict_ms'] = (time.perf_counter() - start) * 1000
+            if not np.allclose(compiled, proba):
+                raise ValueError(f"Compiled forest of {self.version} disagrees with the model")
+        timings = {name: round(ms, 2) for name, ms in timings.items()}
+        if modes:
+            timings.update(self.warm_up_explanations(modes, X))
+        return timings
+
+    def warm_up_explanations(self, modes: Sequence[str] = EXPLANATION_MODES,
+                             X: Optional[pd.DataFrame] = None) -> Dict[str, float]:
+        """Build the explainer and explain the canary rows in every mode in `modes`"""
+        if X is None:
+            X = self._canary_rows()[0]
+        timings = {}
+        start = time.perf_counter()
+        explainer = self.explainer
+        timings['explainer_ms'] = (time.perf_counter() - start) * 1000
+        for mode in modes:
+            start = time.perf_counter()
+            contributions = compute_contributions(explainer, X, mode)
+            timings[f'shap_{mode}_ms'] = (time.perf_counter() - start) * 1000
+            if not np.isfinite(contributions).all():
+                raise ValueError(f"Non-finite {mode} explanations from {self.version}")
+        return {name: round(ms, 2) for name, ms in timings.items()}
+
+class ModelManager:
+    """
+    Holds the ServingModel requests use and replaces it without downtime.
+    reload() loads and warms the next version on a background thread while
+    the current one keeps serving, then swaps it in with a single reference
+    assignment. Requests read `current` once and keep that version until they
+    finish. A version that fails to load or warm up is never swapped in.
+    """
+
+    def __init__(self, load_fn: Callable[[Optional[str]], ServingModel],
+                 warm_up: Callable[[ServingModel], Dict[str, float]],
+                 on_swap: Optional[Callable[[ServingModel, Optional[ServingModel]], None]] = None):
+        self._load_fn = load_fn
+        self._warm_up = warm_up
+        self._on_swap = on_swap
+        self._lock = threading.Lock()
+        self.current: Optional[ServingModel] = None
+        self.loading: Optional[str] = None
+        self.failed: set = set()
+        self.last_error: Optional[str] = None
+        self.history: List[Dict[str, Any]] = []
+
+    def load(self, version: Optional[str] = None) -> ServingModel:
+        """Load, warm up and swap in a version on the calling thread"""
+        start = time.perf_counter()
+        serving = self._load_fn(version)
+        loaded = time.perf_counter()
+        warm_up = self._warm_up(serving)
+        previous, self.current = self.current, serving
+        self.history = (self.history + [{
+            "version": serving.version,
+            "previous": previous.version if previous is not None else None,
+            "swapped_at": time.time(),
+            "load_seconds": round(loaded - start, 3),
+            "warm_up_seconds": round(time.perf_counter() - loaded, 3),
+            "warm_up": warm_up,
+        }])[-HISTORY_SIZE:]
+        if self._on_swap is not None:
+            self._on_swap(serving, previous)
+        print(f"Serving model version {serving.version} (loaded in {loaded - start:.2f}s, "
+              f"warmed up in {time.perf_counter() - loaded:.2f}s)")
+        return serving
+
+    def reload(self, version: Optional[str] = None, label: Optional[str] = None, wait: bool = False) -> bool:
+        """
+        Start loading `version` (the default source when None) in the
+        background, or on the calling thread with wait=True. Returns False
+        when a load is already running. `label` names the version in `failed`
+        when it is not known up front.
+        """
+        with self._lock:
+            if self.loading is not None:
+                return False
+            self.loading = label or version or "default"
+        if wait:
+            self._reload(version, label or version)
+            return True
+        threading.Thread(target=self._reload, args=(version, label or version),
+                         name="model-reload", daemon=True).start()
+        return True
+
+    def _reload(self, version: Optional[str], label: Optional[str]):
+        try:
+            self.load(version)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = f"{label or 'default'}: {str(e)}"
+            if label is not None:
+                self.failed.add(label)
+            serving = self.current.version if self.current is not None else "nothing"
+            print(f"Model reload failed, still serving {serving}: {self.last_error}")
+        finally:
+            with self._lock:
+                self.loading = None
+
+    def serving(self) -> ServingModel:
+        """The version requests should use; raises ModelNotLoaded until one has been loaded"""
+        current = self.current
+        if current is None:
+            if self.last_error is not None and self.loading is None:
+                raise ModelNotLoaded(f"No model could be loaded: {self.last_error}")
+            raise ModelNotLoaded("Model is still loading")
+        return current
+
+    def status(self) -> Dict[str, Any]:
+        current = self.current
+        return {
+            "version": current.version if current is not None else None,
+            "loading": self.loading,
+            "last_error": self.last_error,
+            "failed": sorted(self.failed),
+            "history": self.history,
+        }
@@ -1,18 +1,25 @@
-import joblib
+import argparse
+import os
+import sys
+
 import pandas as pd
-import numpy as np
 
-def get_feature_importance():
-    model = joblib.load('models/random_forest_model.pkl')
-    feature_names = model.feature_names_in_
-    importances = model.feature_importances_
-    
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from model_registry import ModelRegistry
+
+def get_feature_importance(version=None):
+    # Importances are stored in the version's metadata sidecar at registration
+    importances = ModelRegistry().metadata(version)['feature_importances']
+
     feature_imp = pd.DataFrame({
-        'feature': feature_names,
-        'importance': importances
+        'feature': list(importances),
+        'importance': list(importances.values())
     }).sort_values('importance', ascending=False)
-    
+
     return feature_imp.head(10)  # Top 10 important features
 
 if __name__ == "__main__":
-    print(get_feature_importance())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Top 10 feature importances of a registered model")
+    parser.add_argument('--version', help="registry version (default: the current one)")
+    args = parser.parse_args()
+    print(get_feature_importance(args.version))
@@ -0,0 +1,289 @@
+# benchmark_pipeline.py
+# Time and memory-profile every stage of the data pipeline and training on raw data of a known size,
+# write a JSON report, and compare it against a baseline report with regression thresholds.
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import psutil
+import sklearn
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+sys.path.insert(0, SCRIPTS_DIR)
+
+from data_processing import (ENCODINGS, TEXT_ENCODINGS, RAW_FILES, encode_features, expand_columns,
+                             expand_partitioned, impute_enrollment, load_data, merge_datasets, save_processed_data,
+                             select_columns, split_data)
+from dtype_policy import DTYPE_POLICIES, frame_memory_mb
+from generate_synthetic_data import generate
+from imputation import IMPUTATION_STRATEGIES
+from model_training import SEARCH_MODES, as_model_input, train_model
+from text_features import N_TEXT_FEATURES
+
+STAGES = ('load', 'merge', 'impute', 'expand', 'encode', 'split', 'save', 'train')
+REPORT_VERSION = 1
+# Regressions: a stage slower or larger than the baseline by more than these
+# fractions; time changes under MIN_SECONDS are treated as noise
+TIME_THRESHOLD = 0.25
+MEMORY_THRESHOLD = 0.25
+MIN_SECONDS = 0.5
+
+class StageProfiler:
+    """
+    Wall time and resident memory per stage. RSS of this process and its
+    children (the parallel loaders) is sampled on a background thread, so
+    peaks inside native pandas/Arrow/sklearn code are caught too.
+    """
+
+    def __init__(self, interval=0.02, stream=None):
+        self.interval = interval
+        # Progress goes here even while the pipeline's own output is redirected
+        self.stream = stream or sys.stdout
+        self.process = psutil.Process()
+        self.stages = {}
+
+    def rss(self):
+        total = self.process.memory_info().rss
+        for child in self.process.children(recursive=True):
+            with contextlib.suppress(psutil.Error):
+                total += child.memory_info().rss
+        return total
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        result = {}
+        peak = [self.rss()]
+        start_rss = peak[0]
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(self.interval):
+                peak[0] = max(peak[0], self.rss())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            seconds = time.perf_counter() - start
+            done.set()
+            sampler.join()
+            end_rss = self.rss()
+            self.stages[name] = {
+                "seconds": round(seconds, 4),
+                "peak_rss_mb": round(max(peak[0], end_rss) / 2**20, 1),
+                "rss_delta_mb": round((end_rss - start_rss) / 2**20, 1),
+                **result,
+            }
+            print(f"  {name:<7} {seconds:8.2f}s  peak {self.stages[name]['peak_rss_mb']:9.1f} MB",
+                  file=self.stream, flush=True)
+
+def run_pipeline(profiler, raw_dir, workers=1, imputation='neighbors', aggregate_features=False,
+                 encoding='label', min_token_freq=5, text_encoding='label', text_features=N_TEXT_FEATURES,
+                 dtypes='compact', partitions=0, search='halving', max_trees=30, train_rows=50_000, log=None):
+    """Run every stage the way data_processing.main and model_training.main do, one profiled stage at a time"""
+    quiet = contextlib.redirect_stdout(log) if log else contextlib.nullcontext()
+    with quiet:
+        with profiler.stage('load') as stage:
+            datasets = load_data(raw_dir=raw_dir, workers=workers)
+            stage['rows'] = int(sum(len(df) for df in datasets))
+        with profiler.stage('merge') as stage:
+            merged = merge_datasets(datasets)
+            del datasets
+            stage['rows'] = len(merged)
+        with profiler.stage('impute') as stage:
+            keys = merged['nct_id'] if partitions > 1 else None
+            merged = select_columns(merged, aggregate_features)
+            merged = impute_enrollment(merged, strategy=imputation)
+            stage['rows'] = len(merged)
+        # Frame sizes are measured outside the timed stages: a deep count walks every string
+        profiler.stages['impute']['frame_mb'] = round(frame_memory_mb(merged), 1)
+        with profiler.stage('expand') as stage:
+            if keys is not None:
+                merged = expand_partitioned(merged, keys, encoding, dtypes=dtypes, partitions=partitions,
+                                            workers=workers or os.cpu_count())
+            else:
+                merged = expand_columns(merged, encoding, dtypes=dtypes)
+            stage['rows'] = len(merged)
+        profiler.stages['expand']['frame_mb'] = round(frame_memory_mb(merged), 1)
+        with profiler.stage('encode') as stage:
+            merged = encode_features(merged, encoding=encoding, min_token_freq=min_token_freq,
+                                     text_encoding=text_encoding, text_features=text_features, dtypes=dtypes)
+            stage['rows'], stage['columns'] = merged.shape
+        profiler.stages['encode']['frame_mb'] = round(frame_memory_mb(merged), 1)
+        with profiler.stage('split') as stage:
+            X_train, X_test, y_train, y_test = split_data(merged)
+            del merged
+            stage['rows'] = len(X_train) + len(X_test)
+        with profiler.stage('save') as stage:
+            save_processed_data(X_train, X_test, y_train, y_test)
+            stage['bytes'] = int(sum(os.path.getsize(os.path.join('data', 'processed', name))
+                                     for name in os.listdir(os.path.join('data', 'processed'))))
+        if search is None:
+            return
+        with profiler.stage('train') as stage:
+            if train_rows and len(X_train) > train_rows:
+                # By position: exploded rows of one trial share an index label
+                rows = np.random.default_rng(42).choice(len(X_train), train_rows, replace=False)
+                X_train, y_train = X_train.iloc[rows], y_train.iloc[rows]
+            train_model(as_model_input(X_train), y_train.to_numpy(), search=search,
+                        min_trees=min(10, max_trees), max_trees=max_trees)
+            stage['rows'] = len(X_train)
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=PROJECT_ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report, baseline, time_threshold=TIME_THRESHOLD, memory_threshold=MEMORY_THRESHOLD,
+            min_seconds=MIN_SECONDS):
+    """Print stage-by-stage changes against `baseline` and return the regressions found"""
+    changed = sorted(key for key in set(report["config"]) | set(baseline.get("config", {}))
+                     if report["config"].get(key) != baseline.get("config", {}).get(key))
+    if changed:
+        print(f"Warning: baseline was measured with different {', '.join(changed)}")
+    regressions = []
+    print(f"\n{'stage':<8}{'seconds':>10}{'baseline':>10}{'change':>9}{'peak MB':>10}{'baseline':>10}{'change':>9}")
+    for name, stage in report["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None:
+            continue
+        time_change = stage["seconds"] / base["seconds"] - 1 if base["seconds"] else 0.0
+        memory_change = stage["peak_rss_mb"] / base["peak_rss_mb"] - 1 if base["peak_rss_mb"] else 0.0
+        print(f"{name:<8}{stage['seconds']:>10.2f}{base['seconds']:>10.2f}{time_change:>+9.0%}"
+              f"{stage['peak_rss_mb']:>10.0f}{base['peak_rss_mb']:>10.0f}{memory_change:>+9.0%}")
+        if time_change > time_threshold and stage["seconds"] - base["seconds"] >= min_seconds:
+            regressions.append(f"{name}: {stage['seconds']:.2f}s vs {base['seconds']:.2f}s ({time_change:+.0%})")
+        if memory_change > memory_threshold:
+            regressions.append(f"{name}: peak {stage['peak_rss_mb']:.0f} MB vs {base['peak_rss_mb']:.0f} MB "
+                               f"({memory_change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data pipeline and training per stage")
+    parser.add_argument('--rows', type=int, default=10_000,
+                        help="trials to generate when --raw-dir is not given")
+    parser.add_argument('--raw-dir', help="existing raw files to benchmark on instead of generated ones")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes used to load raw files (0 = all cores)")
+    parser.add_argument('--imputation', choices=IMPUTATION_STRATEGIES, default='neighbors')
+    parser.add_argument('--aggregate-features', action='store_true')
+    parser.add_argument('--encoding', choices=ENCODINGS, default='label')
+    parser.add_argument('--text-encoding', choices=TEXT_ENCODINGS, default='label')
+    parser.add_argument('--text-features', type=int, default=N_TEXT_FEATURES)
+    parser.add_argument('--dtypes', choices=DTYPE_POLICIES, default='compact')
+    parser.add_argument('--partitions', type=int, default=0,
+                        help="expand in this many nct_id partitions on --workers processes (0 = one frame)")
+    parser.add_argument('--search', choices=SEARCH_MODES, default='halving')
+    parser.add_argument('--max-trees', type=int, default=30, help="trees in the trained model")
+    parser.add_argument('--train-rows', type=int, default=50_000,
+                        help="training rows sampled for the train stage (0 = all)")
+    parser.add_argument('--skip-train', action='store_true')
+    parser.add_argument('--output', default='benchmark_report.json')
+    parser.add_argument('--baseline', help="earlier report to compare against")
+    parser.add_argument('--time-threshold', type=float, default=TIME_THRESHOLD)
+    parser.add_argument('--memory-threshold', type=float, default=MEMORY_THRESHOLD)
+    parser.add_argument('--min-seconds', type=float, default=MIN_SECONDS)
+    parser.add_argument('--work-dir', help="directory for processed data and models (default: temporary)")
+    parser.add_argument('--verbose', action='store_true', help="show the pipeline's own output")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    work_dir = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix='trialvision-bench-'))
+    os.makedirs(work_dir, exist_ok=True)
+    cwd = os.getcwd()
+    try:
+        raw_dir = os.path.abspath(args.raw_dir) if args.raw_dir else os.path.join(work_dir, 'data', 'raw')
+        if not args.raw_dir:
+            print(f"Generating {args.rows} trials in {raw_dir}")
+            generate(raw_dir, args.rows, seed=args.seed)
+        raw_files = [os.path.join(raw_dir, spec["name"]) for spec in RAW_FILES
+                     if os.path.exists(os.path.join(raw_dir, spec["name"]))]
+        raw_bytes = {os.path.basename(p): os.path.getsize(p) for p in raw_files}
+
+        # The pipeline writes to data/processed and models/ relative to the working directory
+        os.chdir(work_dir)
+        profiler = StageProfiler()
+        print("Running stages:")
+        with open(os.path.join(work_dir, 'pipeline.log'), 'w') as log:
+            run_pipeline(profiler, raw_dir, workers=args.workers or None, imputation=args.imputation,
+                         aggregate_features=args.aggregate_features, encoding=args.encoding,
+                         text_encoding=args.text_encoding, text_features=args.text_features,
+                         dtypes=args.dtypes, partitions=args.partitions, search=None if args.skip_train else args.search, max_trees=args.max_trees,
+                         train_rows=args.train_rows, log=None if args.verbose else log)
+    finally:
+        os.chdir(cwd)
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "version": REPORT_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "commit": git_commit(),
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "memory_mb": round(psutil.virtual_memory().total / 2**20),
+        },
+        "versions": {"pandas": pd.__version__, "numpy": np.__version__, "scikit-learn": sklearn.__version__},
+        "config": {
+            "raw_bytes": raw_bytes,
+            "generated_trials": None if args.raw_dir else args.rows,
+            "seed": args.seed,
+            "workers": args.workers,
+            "imputation": args.imputation,
+            "aggregate_features": args.aggregate_features,
+            "encoding": args.encoding,
+            "text_encoding": args.text_encoding,
+            "text_features": args.text_features,
+            "dtypes": args.dtypes,
+            "partitions": args.partitions,
+            "search": None if args.skip_train else args.search,
+            "max_trees": args.max_trees,
+            "train_rows": args.train_rows,
+        },
+        "stages": profiler.stages,
+        "total_seconds": round(sum(stage["seconds"] for stage in profiler.stages.values()), 4),
+        "peak_rss_mb": max(stage["peak_rss_mb"] for stage in profiler.stages.values()),
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Total {report['total_seconds']:.2f}s, peak {report['peak_rss_mb']:.0f} MB; report written to {output}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.time_threshold, args.memory_threshold, args.min_seconds)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"- {regression}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# benchmark_startup.py
+# Cold-start time and per-worker memory of the prediction API: plain uvicorn workers, which each
+# import the app and load the model, against app/serve.py, which loads it once and forks.
+import argparse
+import contextlib
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import psutil
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+sys.path.insert(0, SCRIPTS_DIR)
+
+from benchmark_pipeline import git_commit
+from load_test import load_trial_pool, server_processes
+
+REPORT_VERSION = 1
+SERVERS = ('uvicorn', 'prefork')
+EXPLAINER_LOADING_MODES = ('eager', 'background', 'lazy')
+POLL_INTERVAL = 0.05
+START_TIMEOUT = 300.0
+
+def server_command(server, port, workers):
+    if server == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1', '--port', str(port),
+                '--workers', str(workers), '--log-level', 'warning']
+    return [sys.executable, '-m', 'app.serve', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(workers), '--log-level', 'warning']
+
+def _get_or_none(url):
+    with contextlib.suppress(httpx.HTTPError):
+        return httpx.get(url, timeout=5)
+    return None
+
+def poll(url, workers, deadline, started):
+    """
+    Seconds from `started` until /health first answers, until /ready first
+    answers 200 and until every worker has answered /ready. Each poll opens
+    fresh connections so they spread over the workers. Servers without
+    /ready count as ready once healthy, and their workers cannot be told apart.
+    """
+    timings = {"health_seconds": None, "ready_seconds": None, "all_ready_seconds": None}
+    ready_pids = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while time.monotonic() < deadline:
+            if timings["health_seconds"] is None:
+                with contextlib.suppress(httpx.HTTPError):
+                    if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                        timings["health_seconds"] = time.monotonic() - started
+            if timings["health_seconds"] is not None:
+                responses = [r for r in pool.map(lambda _: _get_or_none(f"{url}/ready"), range(workers))
+                             if r is not None]
+                if any(r.status_code == 404 for r in responses):
+                    timings["ready_seconds"] = timings["health_seconds"]
+                    return timings
+                for response in responses:
+                    if response.status_code == 200:
+                        if timings["ready_seconds"] is None:
+                            timings["ready_seconds"] = time.monotonic() - started
+                        ready_pids.add(response.json().get("pid"))
+                if len(ready_pids) >= workers:
+                    timings["all_ready_seconds"] = time.monotonic() - started
+                    return timings
+            time.sleep(POLL_INTERVAL)
+    raise RuntimeError(f"Server at {url} was not ready after {START_TIMEOUT:.0f}s")
+
+def memory(pid):
+    """RSS, PSS and USS in MB per server process; PSS splits shared pages between the processes sharing them"""
+    usage = {}
+    for process_pid, (role, process) in server_processes(pid).items():
+        with contextlib.suppress(psutil.Error):
+            info = process.memory_full_info()
+            usage[str(process_pid)] = {
+                "role": role,
+                "rss_mb": round(info.rss / 2**20, 1),
+                "pss_mb": round(info.pss / 2**20, 1),
+                "uss_mb": round(info.uss / 2**20, 1),
+            }
+    return usage
+
+def run_once(server, explainer_loading, args, payloads):
+    """Start a server, time it to readiness and its first explanations, sample memory and stop it"""
+    env = {**os.environ, 'EXPLAINER_LOADING': explainer_loading, 'MODEL_LOADING': args.model_loading}
+    url = f"http://127.0.0.1:{args.port}"
+    started = time.monotonic()
+    process = subprocess.Popen(server_command(server, args.port, args.workers), cwd=os.getcwd(), env=env,
+                               stdout=subprocess.DEVNULL)
+    try:
+        result = poll(url, args.workers, started + START_TIMEOUT, started)
+        # 1) First explained prediction after readiness, then the rest of the requests
+        with httpx.Client(base_url=url, timeout=120) as client:
+            latencies = []
+            for payload in payloads:
+                start = time.monotonic()
+                response = client.post('/predict', json=payload)
+                response.raise_for_status()
+                latencies.append(time.monotonic() - start)
+        result["first_explain_seconds"] = latencies[0]
+        result["explain_p50_seconds"] = sorted(latencies)[len(latencies) // 2]
+        # 2) Memory once the workers have served requests
+        result["processes"] = memory(process.pid)
+        result = {key: round(value, 3) if isinstance(value, float) else value for key, value in result.items()}
+    finally:
+        process.terminate()
+        with contextlib.suppress(subprocess.TimeoutExpired):
+            process.wait(timeout=30)
+        if process.poll() is None:
+            process.kill()
+    workers = [usage for usage in result["processes"].values() if usage["role"] != "master"]
+    result["worker_rss_mb"] = round(sum(usage["rss_mb"] for usage in workers) / max(len(workers), 1), 1)
+    result["total_pss_mb"] = round(sum(usage["pss_mb"] for usage in result["processes"].values()), 1)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API cold start and per-worker memory")
+    parser.add_argument('--servers', choices=SERVERS, nargs='+', default=list(SERVERS))
+    parser.add_argument('--explainer', choices=EXPLAINER_LOADING_MODES, nargs='+', default=['eager', 'lazy'],
+                        help="EXPLAINER_LOADING settings to run each server with")
+    parser.add_argument('--model-loading', choices=('import', 'background'), default='import',
+                        help="MODEL_LOADING for uvicorn; app/serve.py always loads at import")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=20, help="explained predictions after readiness")
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--output', default='startup_report.json')
+    args = parser.parse_args()
+
+    payloads = load_trial_pool(pool_size=max(args.requests, 1))
+    runs = []
+    print(f"{'server':<10}{'explainer':<12}{'health s':>10}{'ready s':>10}{'all ready':>11}{'1st explain':>13}"
+          f"{'worker RSS':>12}{'total PSS':>11}")
+    for server, explainer_loading, _ in itertools.product(args.servers, args.explainer, range(args.repeats)):
+        result = run_once(server, explainer_loading, args, payloads[:max(args.requests, 1)])
+        runs.append({"server": server, "explainer_loading": explainer_loading, **result})
+        all_ready = result["all_ready_seconds"]
+        print(f"{server:<10}{explainer_loading:<12}{result['health_seconds']:>10.2f}{result['ready_seconds']:>10.2f}"
+              f"{all_ready if all_ready is not None else float('nan'):>11.2f}{result['first_explain_seconds']:>13.2f}"
+              f"{result['worker_rss_mb']:>10.0f}MB{result['total_pss_mb']:>9.0f}MB")
+
+    report = {
+        "version": REPORT_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "commit": git_commit(),
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "memory_mb": round(psutil.virtual_memory().total / 2**20),
+        },
+        "config": {
+            "workers": args.workers,
+            "model_loading": args.model_loading,
+            "requests": args.requests,
+        },
+        "runs": runs,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmark_study_design.py
+# Time the single-pass study_design parser against the four str.extract scans it replaced.
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from study_design import DESIGN_COLUMNS, parse_study_design
+
+# Shapes of design strings found in ClinicalTrials.gov exports
+DESIGN_TEMPLATES = [
+    "Allocation: {allocation}|Intervention Model: {model}|Masking: {masking}|Primary Purpose: {purpose}",
+    "Intervention Model: {model}|Masking: {masking}|Primary Purpose: {purpose}",
+    "Allocation: {allocation}|Intervention Model: {model}|Masking: {masking}",
+    "Observational Model: Cohort|Time Perspective: Prospective",
+]
+ALLOCATIONS = ['RANDOMIZED', 'NON_RANDOMIZED', 'NA']
+MODELS = ['PARALLEL', 'SINGLE_GROUP', 'CROSSOVER', 'FACTORIAL', 'SEQUENTIAL']
+MASKINGS = ['NONE', 'SINGLE (Participant)', 'DOUBLE (Participant, Investigator)',
+            'TRIPLE (Participant, Care Provider, Investigator)',
+            'QUADRUPLE (Participant, Care Provider, Investigator, Outcomes Assessor)']
+PURPOSES = ['TREATMENT', 'PREVENTION', 'SUPPORTIVE_CARE', 'BASIC_SCIENCE', 'DIAGNOSTIC', 'OTHER']
+
+def synthetic_designs(rows: int, seed: int = 42) -> pd.Series:
+    """Design strings drawn from every template/value combination, with 5% missing"""
+    rng = np.random.default_rng(seed)
+    pool = [
+        template.format(allocation=a, model=m, masking=k, purpose=p)
+        for template in DESIGN_TEMPLATES
+        for a in ALLOCATIONS for m in MODELS for k in MASKINGS for p in PURPOSES
+    ]
+    pool = list(dict.fromkeys(pool))
+    values = np.asarray(pool, dtype=object)[rng.integers(0, len(pool), rows)]
+    values[rng.random(rows) < 0.05] = None
+    return pd.Series(values)
+
+def four_extracts(designs: pd.Series) -> pd.DataFrame:
+    """The previous path: one regex scan per field"""
+    df = pd.DataFrame(index=designs.index)
+    for feature in ['Allocation', 'Intervention Model', 'Masking', 'Primary Purpose']:
+        df[feature] = designs.str.extract(f"{feature}: ([^|]*)")
+    df = df.fillna('Unknown')
+    return df.rename(columns={'Intervention Model': 'Intervention_Model', 'Primary Purpose': 'Primary_Purpose'})
+
+def best_of(func, designs, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(designs)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark study_design parsing")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    designs = synthetic_designs(args.rows)
+    print(f"{len(designs)} rows, {designs.nunique()} distinct designs")
+
+    extract_seconds, expected = best_of(four_extracts, designs, args.repeats)
+    parse_seconds, parsed = best_of(parse_study_design, designs, args.repeats)
+    identical = expected[DESIGN_COLUMNS].astype(object).equals(parsed[DESIGN_COLUMNS].astype(object))
+
+    print(f"four str.extract scans: {extract_seconds:.3f}s")
+    print(f"single-pass parser:     {parse_seconds:.3f}s ({extract_seconds / parse_seconds:.0f}x faster)")
+    print(f"identical output:       {identical}")
+
+if __name__ == "__main__":
+    main()
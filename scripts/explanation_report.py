@@ -0,0 +1,105 @@
+# explanation_report.py
+# Compare the API explanation modes against exact TreeSHAP on the X_test split.
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import shap
+from scipy.stats import spearmanr
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+from app.explain import EXPLANATION_MODES, TOP_K, compute_contributions
+from model_training import X_TEST_PATH, as_model_input, read_split
+
+MODEL_PATH = 'models/random_forest_model.pkl'
+REPORT_PATH = 'reports/explanation_modes.json'
+
+def top_k_order(contributions: np.ndarray, k: int = TOP_K) -> np.ndarray:
+    """Feature indices of the k largest absolute contributions per row, largest first"""
+    return np.argsort(-np.abs(contributions), axis=1, kind='stable')[:, :k]
+
+def time_per_row(explainer, rows: pd.DataFrame, mode: str) -> float:
+    """Mean seconds to explain one row on its own, as /predict does"""
+    start = time.perf_counter()
+    for i in range(len(rows)):
+        compute_contributions(explainer, rows.iloc[[i]], mode)
+    return (time.perf_counter() - start) / len(rows)
+
+def compare_modes(model, X: pd.DataFrame, latency_rows: int):
+    """Accuracy and latency of every explanation mode relative to exact SHAP"""
+    explainer = shap.TreeExplainer(model)
+    start = time.perf_counter()
+    exact = compute_contributions(explainer, X, 'exact')
+    exact_batch_seconds = time.perf_counter() - start
+    exact_top = top_k_order(exact)
+    latency_sample = X.iloc[:latency_rows]
+
+    report = {}
+    for mode in EXPLANATION_MODES:
+        if mode == 'exact':
+            contributions, batch_seconds = exact, exact_batch_seconds
+        else:
+            start = time.perf_counter()
+            contributions = compute_contributions(explainer, X, mode)
+            batch_seconds = time.perf_counter() - start
+        mode_top = top_k_order(contributions)
+
+        # Share of each row's exact top-k features that the mode also ranks top-k
+        overlap = np.mean([len(set(a) & set(b)) / TOP_K for a, b in zip(exact_top, mode_top)])
+        # Rows whose top-k features come out in exactly the same order
+        same_order = np.mean(np.all(exact_top == mode_top, axis=1))
+        rank_corr = np.nanmean([
+            spearmanr(np.abs(a), np.abs(b))[0] for a, b in zip(exact, contributions)
+        ])
+
+        report[mode] = {
+            f"top{TOP_K}_overlap": float(overlap),
+            f"top{TOP_K}_same_order": float(same_order),
+            "spearman_abs_rank": float(rank_corr),
+            "max_abs_error": float(np.max(np.abs(exact - contributions))),
+            "single_row_ms": time_per_row(explainer, latency_sample, mode) * 1000,
+            "batch_per_row_ms": batch_seconds / len(X) * 1000,
+        }
+        print(f"{mode:12s} overlap={overlap:.3f} same_order={same_order:.3f} "
+              f"spearman={rank_corr:.3f} single_row={report[mode]['single_row_ms']:.2f}ms "
+              f"batch_per_row={report[mode]['batch_per_row_ms']:.3f}ms")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare explanation modes with exact SHAP")
+    parser.add_argument('--rows', type=int, default=500, help="X_test rows to explain")
+    parser.add_argument('--latency-rows', type=int, default=50, help="rows timed one at a time")
+    parser.add_argument('--output', default=REPORT_PATH)
+    args = parser.parse_args()
+
+    with open(MODEL_PATH, 'rb') as f:
+        model = pickle.load(f)
+    # The split as the model was trained on it: Feather when preprocessing wrote it, float32 or sparse
+    X_test = as_model_input(read_split(X_TEST_PATH))
+    X = X_test.sample(n=min(args.rows, len(X_test)), random_state=42)
+    if any(isinstance(dtype, pd.SparseDtype) for dtype in X.dtypes):
+        # Explained densely, as the API does with its densified multi-hot rows
+        X = X.sparse.to_dense()
+    print(f"Explaining {len(X)} rows from {X_TEST_PATH} with {len(model.estimators_)} trees")
+
+    report = {
+        "model": MODEL_PATH,
+        "rows": len(X),
+        "top_k": TOP_K,
+        "modes": compare_modes(model, X, min(args.latency_rows, len(X))),
+    }
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,18 @@
-import joblib
+import argparse
+import os
+import sys
 
-def get_model_features():
-    model = joblib.load('models/random_forest_model.pkl')
-    print("Model feature order:", model.feature_names_in_)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from model_registry import ModelRegistry
+
+def get_model_features(version=None):
+    # Read from the version's metadata sidecar; the forest itself is never unpickled
+    metadata = ModelRegistry().metadata(version)
+    print(f"Model version: {metadata['version']}")
+    print("Model feature order:", metadata['feature_order'])
 
 if __name__ == "__main__":
-    get_model_features()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Print the feature order of a registered model")
+    parser.add_argument('--version', help="registry version (default: the current one)")
+    args = parser.parse_args()
+    get_model_features(args.version)
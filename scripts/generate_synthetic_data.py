@@ -0,0 +1,234 @@
+# generate_synthetic_data.py
+# Write synthetic AACT-style raw files of a chosen size, for benchmarking the pipeline.
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# Trials generated and written at a time; bounds memory at any --rows
+CHUNK_TRIALS = 100_000
+
+# Share of missing values per field, roughly as in ClinicalTrials.gov exports
+MISSING_RATES = {
+    'enrollment': 0.03,
+    'study_design': 0.01,
+    'conditions': 0.005,
+    'interventions': 0.08,
+    'criteria': 0.005,
+    'country': 0.01,
+    'subjects_at_risk': 0.02,
+    'count': 0.01,
+}
+# Mean rows per trial in the child files
+FACILITIES_PER_TRIAL = 3.0
+EVENTS_PER_TRIAL = 4.0
+WITHDRAWALS_PER_TRIAL = 1.0
+
+STATUSES = {
+    'COMPLETED': 0.55, 'TERMINATED': 0.08, 'WITHDRAWN': 0.04, 'SUSPENDED': 0.01,
+    'RECRUITING': 0.12, 'ACTIVE_NOT_RECRUITING': 0.07, 'NOT_YET_RECRUITING': 0.04, 'UNKNOWN': 0.09,
+}
+DESIGNS = [
+    "Allocation: {allocation}|Intervention Model: {model}|Masking: {masking}|Primary Purpose: {purpose}",
+    "Intervention Model: {model}|Masking: {masking}|Primary Purpose: {purpose}",
+    "Observational Model: Cohort|Time Perspective: Prospective",
+]
+ALLOCATIONS = ['RANDOMIZED', 'NON_RANDOMIZED', 'NA']
+MODELS = ['PARALLEL', 'SINGLE_GROUP', 'CROSSOVER', 'FACTORIAL', 'SEQUENTIAL']
+MASKINGS = ['NONE', 'SINGLE (Participant)', 'DOUBLE (Participant, Investigator)',
+            'TRIPLE (Participant, Care Provider, Investigator)',
+            'QUADRUPLE (Participant, Care Provider, Investigator, Outcomes Assessor)']
+PURPOSES = ['TREATMENT', 'PREVENTION', 'SUPPORTIVE_CARE', 'BASIC_SCIENCE', 'DIAGNOSTIC', 'OTHER']
+CONDITIONS = ['Breast Cancer', 'Diabetes Mellitus, Type 2', 'Hypertension', 'Obesity', 'Asthma',
+              'HIV Infections', 'Depression', 'Alzheimer Disease', 'Prostate Cancer', 'Heart Failure',
+              'Stroke', 'COVID-19', 'Schizophrenia', 'Rheumatoid Arthritis', 'Chronic Kidney Disease']
+INTERVENTION_TYPES = ['DRUG', 'BIOLOGICAL', 'DEVICE', 'PROCEDURE', 'BEHAVIORAL', 'OTHER',
+                      'RADIATION', 'DIETARY_SUPPLEMENT']
+INTERVENTIONS = ['Placebo', 'Metformin', 'Pembrolizumab', 'Aspirin', 'Atorvastatin', 'Insulin Glargine',
+                 'Exercise Program', 'Cognitive Behavioral Therapy', 'Radiotherapy', 'Vitamin D']
+CRITERIA_BULLETS = [
+    'Age {n} years or older', 'ECOG performance status of {k} or less', 'BMI below {n}',
+    'Signed informed consent', 'Prior treatment with study drug within {k} months',
+    'Pregnant or breastfeeding', 'Life expectancy of at least {k} months', 'HbA1c above {k}.5%',
+    'Creatinine clearance above {n} mL/min', 'Participation in another trial within {n} days',
+]
+COUNTRIES = ['United States', 'China', 'France', 'Germany', 'Canada', 'United Kingdom', 'Spain',
+             'Italy', 'Japan', 'Korea, Republic of', 'Egypt', 'Brazil', 'Australia', 'India']
+WITHDRAWAL_REASONS = ['Withdrawal by Subject', 'Lost to Follow-up', 'Adverse Event', 'Physician Decision',
+                      'Death', 'Protocol Violation', 'Lack of Efficacy']
+EVENT_TERMS = ['Nausea', 'Headache', 'Fatigue', 'Diarrhoea', 'Anaemia', 'Pneumonia', 'Rash', 'Dizziness']
+
+def vocabulary(names, size, prefix):
+    """Known names followed by a numbered long tail, `size` entries in all"""
+    return np.asarray(list(names) + [f"{prefix} {i}" for i in range(size - len(names))], dtype=object)
+
+def zipf_choice(rng, pool, shape, a=1.3):
+    """Draw from `pool` with a Zipf-like skew towards its first entries"""
+    ranks = (rng.zipf(a, size=shape) - 1) % len(pool)
+    return pool[ranks]
+
+def with_missing(rng, values, rate):
+    values = np.asarray(values, dtype=object)
+    values[rng.random(len(values)) < rate] = None
+    return values
+
+def join_multi(rng, pool, n, max_values, delimiter='|'):
+    """'a|b|c' strings with 1 to `max_values` skewed draws from `pool` per row"""
+    draws = zipf_choice(rng, pool, (n, max_values))
+    counts = rng.integers(1, max_values + 1, n)
+    joined = pd.Series(draws[:, 0])
+    for j in range(1, max_values):
+        joined = joined.where(counts <= j, joined + delimiter + draws[:, j])
+    return joined.to_numpy(dtype=object), draws[:, 0]
+
+def criteria_text(rng, bullets, n):
+    """Multi-line eligibility text with inclusion and exclusion bullets"""
+    picks = bullets[rng.integers(0, len(bullets), (n, 5))]
+    text = pd.Series("Inclusion Criteria:\n\n  * " + picks[:, 0])
+    for j in (1, 2):
+        text = text + "\n  * " + picks[:, j]
+    text = text + "\n\nExclusion Criteria:\n\n  * " + picks[:, 3] + "\n  * " + picks[:, 4]
+    return text.to_numpy(dtype=object)
+
+def child_rows(rng, nct_ids, mean_per_trial, with_rows=1.0):
+    """nct_id of each child row: a `with_rows` share of trials gets a geometric number of rows"""
+    counts = rng.geometric(1.0 / (mean_per_trial / with_rows), len(nct_ids))
+    counts[rng.random(len(nct_ids)) >= with_rows] = 0
+    return np.repeat(nct_ids, counts)
+
+def generate_chunk(rng, start, n, pools, next_ids):
+    """All five files' rows for trials start .. start + n - 1"""
+    nct_ids = np.asarray([f"NCT{i:08d}" for i in range(start, start + n)], dtype=object)
+    conditions, first_condition = join_multi(rng, pools['conditions'], n, 3)
+    interventions, first_intervention = join_multi(rng, pools['interventions'], n, 3)
+    designs = pools['designs'][rng.integers(0, len(pools['designs']), n)]
+    statuses = rng.choice(list(STATUSES), n, p=list(STATUSES.values()))
+    enrollment = rng.lognormal(4.5, 1.3, n).round().astype(np.int64).astype(object)
+    titles = ("A Study of " + pd.Series(first_intervention).str.split(': ', n=1).str[-1]
+              + " in " + pd.Series(first_condition)).to_numpy(dtype=object)
+
+    usecase = pd.DataFrame({
+        'NCT Number': nct_ids,
+        'Study Title': titles,
+        'Study URL': "https://clinicaltrials.gov/study/" + pd.Series(nct_ids),
+        'Study Status': statuses,
+        'Conditions': with_missing(rng, conditions, MISSING_RATES['conditions']),
+        'Interventions': with_missing(rng, interventions, MISSING_RATES['interventions']),
+        'Sponsor': zipf_choice(rng, pools['sponsors'], n),
+        'Enrollment': with_missing(rng, enrollment, MISSING_RATES['enrollment']),
+        'Study Type': np.where(pd.Series(designs).str.startswith('Observational'), 'OBSERVATIONAL', 'INTERVENTIONAL'),
+        'Study Design': with_missing(rng, designs, MISSING_RATES['study_design']),
+    })
+
+    eligibilities = pd.DataFrame({
+        'id': np.arange(next_ids['eligibilities'], next_ids['eligibilities'] + n),
+        'nct_id': nct_ids,
+        'sampling_method': '',
+        'gender': rng.choice(['ALL', 'FEMALE', 'MALE'], n, p=[0.85, 0.1, 0.05]),
+        'minimum_age': rng.choice(['18 Years', '12 Years', '65 Years', ''], n),
+        'maximum_age': rng.choice(['', '75 Years', '65 Years'], n),
+        'healthy_volunteers': rng.choice(['f', 't'], n, p=[0.8, 0.2]),
+        'criteria': with_missing(rng, criteria_text(rng, pools['bullets'], n), MISSING_RATES['criteria']),
+    })
+
+    ids = child_rows(rng, nct_ids, FACILITIES_PER_TRIAL)
+    facilities = pd.DataFrame({
+        'id': np.arange(next_ids['facilities'], next_ids['facilities'] + len(ids)),
+        'nct_id': ids,
+        'status': '',
+        'name': zipf_choice(rng, pools['sites'], len(ids)),
+        'city': '',
+        'state': '',
+        'zip': '',
+        'country': with_missing(rng, zipf_choice(rng, pools['countries'], len(ids)), MISSING_RATES['country']),
+    })
+
+    # Only trials with posted results report events and withdrawals
+    ids = child_rows(rng, nct_ids, EVENTS_PER_TRIAL, with_rows=0.4)
+    at_risk = rng.integers(1, 500, len(ids)).astype(np.float64)
+    at_risk[rng.random(len(ids)) < MISSING_RATES['subjects_at_risk']] = np.nan
+    events = pd.DataFrame({
+        'id': np.arange(next_ids['reported_events'], next_ids['reported_events'] + len(ids)),
+        'nct_id': ids,
+        'result_group_id': rng.integers(1, 10**7, len(ids)),
+        'ctgov_group_code': rng.choice(['EG000', 'EG001', 'EG002'], len(ids)),
+        'event_type': rng.choice(['serious', 'other'], len(ids), p=[0.3, 0.7]),
+        'subjects_affected': rng.integers(0, 50, len(ids)),
+        'subjects_at_risk': at_risk,
+        'event_count': rng.integers(0, 80, len(ids)),
+        'adverse_event_term': rng.choice(EVENT_TERMS, len(ids)),
+    })
+
+    ids = child_rows(rng, nct_ids, WITHDRAWALS_PER_TRIAL, with_rows=0.3)
+    count = rng.integers(0, 40, len(ids)).astype(np.float64)
+    count[rng.random(len(ids)) < MISSING_RATES['count']] = np.nan
+    withdrawals = pd.DataFrame({
+        'id': np.arange(next_ids['drop_withdrawals'], next_ids['drop_withdrawals'] + len(ids)),
+        'nct_id': ids,
+        'result_group_id': rng.integers(1, 10**7, len(ids)),
+        'ctgov_group_code': rng.choice(['FG000', 'FG001'], len(ids)),
+        'period': 'Overall Study',
+        'reason': rng.choice(WITHDRAWAL_REASONS, len(ids)),
+        'count': count,
+    })
+    return {'usecase_3_.csv': usecase, 'eligibilities.txt': eligibilities, 'facilities.txt': facilities,
+            'reported_events.txt': events, 'drop_withdrawals.txt': withdrawals}
+
+def build_pools(rng):
+    designs = [template.format(allocation=a, model=m, masking=k, purpose=p)
+               for template in DESIGNS for a in ALLOCATIONS for m in MODELS for k in MASKINGS for p in PURPOSES]
+    bullets = [template.format(n=n, k=k) for template in CRITERIA_BULLETS
+               for n in (18, 21, 30, 40, 60) for k in (1, 2, 3, 6)]
+    interventions = vocabulary(INTERVENTIONS, 20_000, 'Compound')
+    types = rng.choice(INTERVENTION_TYPES, len(interventions))
+    return {
+        'designs': np.asarray(list(dict.fromkeys(designs)), dtype=object),
+        'bullets': np.asarray(list(dict.fromkeys(bullets)), dtype=object),
+        'conditions': vocabulary(CONDITIONS, 5_000, 'Condition'),
+        'interventions': np.asarray([f"{t}: {name}" for t, name in zip(types, interventions)], dtype=object),
+        'sponsors': vocabulary(['National Cancer Institute (NCI)', 'Pfizer', 'AstraZeneca'], 3_000, 'Sponsor'),
+        'sites': vocabulary(['Research Site', 'Mayo Clinic', 'MD Anderson Cancer Center'], 50_000, 'Site'),
+        'countries': np.asarray(COUNTRIES, dtype=object),
+    }
+
+def generate(out_dir, rows, seed=42, chunk_trials=CHUNK_TRIALS):
+    """
+    Write the five raw files for `rows` trials to `out_dir`, chunk by chunk.
+    The child files get about FACILITIES_PER_TRIAL, EVENTS_PER_TRIAL and
+    WITHDRAWALS_PER_TRIAL rows per trial. Returns rows written per file.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    pools = build_pools(rng)
+    written = {}
+    for start in range(0, rows, chunk_trials):
+        n = min(chunk_trials, rows - start)
+        next_ids = {name.split('.')[0]: written.get(name, 0) + 1 for name in
+                    ['eligibilities.txt', 'facilities.txt', 'reported_events.txt', 'drop_withdrawals.txt']}
+        for name, frame in generate_chunk(rng, start, n, pools, next_ids).items():
+            frame.to_csv(os.path.join(out_dir, name), sep=',' if name.endswith('.csv') else '|',
+                         index=False, header=start == 0, mode='w' if start == 0 else 'a')
+            written[name] = written.get(name, 0) + len(frame)
+        print(f"  {start + n}/{rows} trials")
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic AACT-style raw files")
+    parser.add_argument('--rows', type=int, default=10_000,
+                        help="trials to generate (10k to 10M); child files get several rows per trial")
+    parser.add_argument('--out', default=os.path.join('data', 'synthetic'),
+                        help="output directory, laid out like data/raw")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    written = generate(args.out, args.rows, seed=args.seed)
+    for name, count in written.items():
+        size = os.path.getsize(os.path.join(args.out, name)) / 2**20
+        print(f"{name}: {count} rows, {size:.1f} MB")
+    print(f"Generated in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# global_shap.py
+# Global SHAP analysis of the trained model: values computed chunk by chunk on
+# a process pool into a memory-mapped cache, then summary and dependence plots.
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+
+from app.explain import positive_class_shap
+from dtype_policy import as_float32_frame
+from model_training import MODEL_SAVE_PATH, X_TEST_PATH, X_TRAIN_PATH, Y_TEST_PATH, Y_TRAIN_PATH, read_split
+from pipeline_cache import PipelineCache, cache_key, read_frame, write_frame
+
+SPLITS = {'train': (X_TRAIN_PATH, Y_TRAIN_PATH), 'test': (X_TEST_PATH, Y_TEST_PATH)}
+SHAP_CACHE_DIR = os.path.join('reports', 'shap_cache')
+PLOT_DIR = 'notebooks'
+CHUNK_ROWS = 2000
+# Rows drawn from the cache for plots; the importance ranking uses every row
+PLOT_ROWS = 5000
+TOP_FEATURES = 20
+
+# Per-worker state, set up once by init_worker
+_explainer = None
+_values = None
+
+def split_file(csv_path: str) -> str:
+    """The file read_split reads for a split: its Feather copy when that is current, else the CSV"""
+    feather_path = os.path.splitext(csv_path)[0] + '.feather'
+    if os.path.exists(feather_path) and (
+        not os.path.exists(csv_path) or os.path.getmtime(feather_path) >= os.path.getmtime(csv_path)
+    ):
+        return feather_path
+    return csv_path
+
+def sample_rows(y: pd.Series, n: int, stratify: bool, seed: int) -> np.ndarray:
+    """
+    Sorted row positions to explain: all rows when n is 0 or covers the split,
+    otherwise n rows drawn at random, per class in proportion when stratify is set
+    """
+    if not n or n >= len(y):
+        return np.arange(len(y))
+    rng = np.random.default_rng(seed)
+    if not stratify:
+        return np.sort(rng.choice(len(y), n, replace=False))
+    labels = y.to_numpy()
+    classes, counts = np.unique(labels, return_counts=True)
+    # Largest-remainder allocation, so the per-class counts add up to n
+    quotas = counts * n / len(labels)
+    taken = np.floor(quotas).astype(int)
+    taken[np.argsort(taken - quotas)[:n - taken.sum()]] += 1
+    rows = [rng.choice(np.flatnonzero(labels == label), k, replace=False)
+            for label, k in zip(classes, taken)]
+    return np.sort(np.concatenate(rows))
+
+def init_worker(model_path: str, values_path: str):
+    """Load the model once per worker and open the shared values array for writing"""
+    global _explainer, _values
+    import shap
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    _explainer = shap.TreeExplainer(model)
+    _values = np.load(values_path, mmap_mode='r+')
+
+def explain_chunk(index: int, start: int, X: np.ndarray):
+    """Write the positive-class SHAP values of one chunk into its slice of the cache"""
+    _values[start:start + len(X)] = positive_class_shap(_explainer.shap_values(X))
+    _values.flush()
+    return index
+
+class ShapCache:
+    """
+    SHAP values of one model on one sample of a split, under
+    reports/shap_cache/<model sha256>/<sample key>/:
+      features.feather  the explained rows (write_frame layout)
+      values.npy        float32 (rows, features), filled chunk by chunk
+      progress.json     chunks written so far, so an interrupted run resumes
+      meta.json         written last; its presence marks the entry complete
+    """
+
+    def __init__(self, root: str, model_digest: str, key: str):
+        self.dir = os.path.join(root, model_digest, key)
+        self.features_path = os.path.join(self.dir, 'features.feather')
+        self.values_path = os.path.join(self.dir, 'values.npy')
+        self.progress_path = os.path.join(self.dir, 'progress.json')
+        self.meta_path = os.path.join(self.dir, 'meta.json')
+
+    def complete(self) -> bool:
+        return os.path.exists(self.meta_path)
+
+    def meta(self) -> dict:
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def done_chunks(self, chunk_rows: int) -> set:
+        """Chunks already written, as long as they were cut to the same size"""
+        if not os.path.exists(self.progress_path):
+            return set()
+        with open(self.progress_path) as f:
+            progress = json.load(f)
+        return set(progress['done']) if progress['chunk_rows'] == chunk_rows else set()
+
+    def mark_done(self, done: set, chunk_rows: int):
+        tmp_path = self.progress_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'chunk_rows': chunk_rows, 'done': sorted(done)}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def features(self) -> pd.DataFrame:
+        return read_frame(self.features_path, zero_copy=True)
+
+    def values(self) -> np.ndarray:
+        return np.load(self.values_path, mmap_mode='r')
+
+def compute_shap(cache: ShapCache, model_path: str, X: pd.DataFrame, chunk_rows: int, workers: int):
+    """Fill the cache's values array chunk by chunk, skipping chunks an earlier run finished"""
+    os.makedirs(cache.dir, exist_ok=True)
+    if not os.path.exists(cache.features_path):
+        write_frame(cache.features_path, X)
+    if not os.path.exists(cache.values_path):
+        np.lib.format.open_memmap(cache.values_path, mode='w+', dtype=np.float32, shape=X.shape).flush()
+
+    starts = list(range(0, len(X), chunk_rows))
+    done = cache.done_chunks(chunk_rows)
+    pending = [i for i in range(len(starts)) if i not in done]
+    print(f"Explaining {len(X)} rows in {len(starts)} chunks of {chunk_rows} "
+          f"({len(starts) - len(pending)} already cached) on {workers} workers")
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(model_path, cache.values_path)) as pool:
+        # A few chunks per worker in flight, so only those are ever copied out of X
+        queue, running = iter(pending), set()
+        while True:
+            for i in queue:
+                chunk = as_float32_frame(X.iloc[starts[i]:starts[i] + chunk_rows]).to_numpy()
+                running.add(pool.submit(explain_chunk, i, starts[i], chunk))
+                if len(running) >= 2 * workers:
+                    break
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done.add(future.result())
+            cache.mark_done(done, chunk_rows)
+            elapsed = time.perf_counter() - start_time
+            computed = len(done) - (len(starts) - len(pending))
+            print(f"  {len(done)}/{len(starts)} chunks, {elapsed:.1f}s "
+                  f"({elapsed / computed:.2f}s per chunk)", flush=True)
+
+def feature_importance(values: np.ndarray, columns, chunk_rows: int) -> pd.Series:
+    """Mean absolute SHAP value per feature, read from the memory map a chunk at a time"""
+    totals = np.zeros(values.shape[1])
+    for start in range(0, len(values), chunk_rows):
+        totals += np.abs(values[start:start + chunk_rows]).sum(axis=0, dtype=np.float64)
+    return pd.Series(totals / max(len(values), 1), index=columns).sort_values(ascending=False)
+
+def plot(cache: ShapCache, plot_dir: str, top: int, features, plot_rows: int, seed: int, chunk_rows: int):
+    """Summary plot plus one dependence plot per top or requested feature, from cached values only"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import shap
+
+    meta = cache.meta()
+    values = cache.values()
+    columns = meta['features']
+    importance = feature_importance(values, columns, chunk_rows)
+    importance.rename('mean_abs_shap').to_csv(os.path.join(cache.dir, 'importance.csv'), index_label='feature')
+    if top:
+        print(f"Top {min(top, len(importance))} features by mean absolute SHAP value:")
+        for i, (feature, value) in enumerate(importance.head(top).items(), 1):
+            print(f"{i}. {feature}: {value:.4f}")
+
+    unknown = [f for f in features if f not in importance.index]
+    if unknown:
+        raise ValueError(f"Unknown features: {', '.join(unknown)}")
+    selected = list(dict.fromkeys(importance.head(top).index.tolist() + list(features)))
+
+    # Plots only need a sample of the rows; scatter plots of every row are slow and unreadable
+    rows = np.arange(len(values))
+    if plot_rows and len(rows) > plot_rows:
+        rows = np.sort(np.random.default_rng(seed).choice(len(rows), plot_rows, replace=False))
+    plot_values = np.asarray(values[rows])
+    plot_features = as_float32_frame(cache.features().iloc[rows])
+
+    os.makedirs(plot_dir, exist_ok=True)
+    shap.summary_plot(plot_values, plot_features, show=False, max_display=top or TOP_FEATURES)
+    summary_path = os.path.join(plot_dir, 'shap_summary_plot.png')
+    plt.savefig(summary_path, bbox_inches='tight')
+    plt.close()
+    print(f"SHAP summary plot saved to {summary_path}")
+
+    dependence_dir = os.path.join(plot_dir, 'shap_dependence_plots')
+    os.makedirs(dependence_dir, exist_ok=True)
+    for feature in selected:
+        try:
+            shap.dependence_plot(feature, plot_values, plot_features, interaction_index=None, show=False)
+            plt.savefig(os.path.join(dependence_dir, f'dependence_{feature}.png'), bbox_inches='tight', dpi=100)
+        except Exception as e:
+            print(f"Failed to generate plot for {feature}: {e}")
+        finally:
+            plt.close()
+    print(f"{len(selected)} dependence plots saved to {dependence_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Cached, parallel global SHAP analysis with summary and dependence plots")
+    parser.add_argument('--split', choices=list(SPLITS), default='train', help="processed split to explain")
+    parser.add_argument('--model', default=MODEL_SAVE_PATH)
+    parser.add_argument('--sample', type=int, default=0, help="rows to explain (0 = all)")
+    parser.add_argument('--stratify', action='store_true', help="sample each study_status in proportion")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=0, help="worker processes (0 = all cores)")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--cache-dir', default=SHAP_CACHE_DIR)
+    parser.add_argument('--plot-dir', default=PLOT_DIR)
+    parser.add_argument('--top', type=int, default=TOP_FEATURES, help="dependence plots for the top features")
+    parser.add_argument('--features', nargs='*', default=[], help="extra features to draw dependence plots for")
+    parser.add_argument('--plot-rows', type=int, default=PLOT_ROWS, help="cached rows drawn in plots (0 = all)")
+    parser.add_argument('--no-plots', action='store_true', help="only fill the cache")
+    args = parser.parse_args()
+
+    # 1) Key the cache by the model's content and the rows explained
+    digests = PipelineCache(args.cache_dir)
+    model_digest = digests.file_digest(args.model)[:16]
+    x_path, y_path = SPLITS[args.split]
+    sample = {'split': args.split, 'data': digests.file_digest(split_file(x_path)),
+              'sample': args.sample, 'stratify': args.stratify,
+              'seed': args.seed if args.sample else None}
+    cache = ShapCache(args.cache_dir, model_digest, cache_key(sample))
+
+    # 2) Compute the SHAP values unless an earlier run already did
+    if cache.complete():
+        print(f"Using cached SHAP values in {cache.dir}")
+    else:
+        X = read_split(x_path)
+        y = read_split(y_path)['study_status']
+        rows = sample_rows(y, args.sample, args.stratify, args.seed)
+        X = X.iloc[rows]
+        compute_shap(cache, args.model, X, args.chunk_rows, args.workers or os.cpu_count())
+
+        import shap
+        with open(args.model, 'rb') as f:
+            expected_value = np.ravel(shap.TreeExplainer(pickle.load(f)).expected_value)
+        meta = {
+            'model': args.model,
+            'model_sha256': model_digest,
+            **sample,
+            'rows': len(X),
+            'features': list(X.columns),
+            'class_counts': {str(k): int(v) for k, v in y.iloc[rows].value_counts().items()},
+            'expected_value': float(expected_value[-1]),
+        }
+        with open(cache.meta_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        print(f"SHAP values cached in {cache.dir}")
+
+    # 3) Plot from the cache
+    if not args.no_plots:
+        plot(cache, args.plot_dir, args.top, args.features, args.plot_rows, args.seed, args.chunk_rows)
+
+if __name__ == "__main__":
+    main()
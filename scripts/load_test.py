@@ -0,0 +1,436 @@
+# load_test.py
+# Drive the prediction API with trials decoded from X_test at a fixed open-loop rate or a fixed
+# concurrency, report throughput, latency percentiles and CPU/RSS per server process as JSON,
+# and compare against a baseline report with regression thresholds.
+import argparse
+import asyncio
+import contextlib
+import datetime
+import itertools
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+import psutil
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+sys.path.insert(0, SCRIPTS_DIR)
+
+from benchmark_pipeline import git_commit
+from data_processing import FEATURE_SPEC_PATH, LABEL_ENCODERS_PATH
+from model_training import X_TEST_PATH, read_split
+from multi_hot import MultiHotEncoder
+
+REPORT_VERSION = 1
+LOAD_MODES = ('closed', 'open')
+EXPLAIN_SETTINGS = ('on', 'off', 'both')
+# Trials decoded up front; every request draws from this pool
+POOL_SIZE = 2000
+WARMUP_REQUESTS = 20
+SAMPLE_INTERVAL = 0.25
+# Regressions: p99 latency up, or throughput down, by more than these fractions,
+# or an error rate more than ERROR_THRESHOLD above the baseline's
+LATENCY_THRESHOLD = 0.25
+THROUGHPUT_THRESHOLD = 0.15
+ERROR_THRESHOLD = 0.01
+
+def decode_trials(X, label_encoders, feature_spec, unknown_rate=0.0, seed=42):
+    """
+    Turn encoded X_test rows back into /predict payloads: label codes become
+    their class strings, multi-hot columns the '|'-joined tokens. Hashed text
+    columns cannot be inverted and are left out. Each categorical field is
+    replaced by a value the encoders never saw with probability `unknown_rate`.
+    """
+    rng = np.random.default_rng(seed)
+    fields = {}
+    for col, encoder in label_encoders.items():
+        if col in X.columns:
+            classes = np.array(list(encoder.classes_) + feature_spec.get('appended_classes', {}).get(col, []),
+                               dtype=object)
+            fields[col] = np.append(classes, 'Unknown')[np.minimum(X[col].to_numpy(dtype=np.int64), len(classes))]
+    for col, spec in feature_spec.get('multi_hot', {}).items():
+        encoder = MultiHotEncoder.from_dict(spec)
+        names = encoder.feature_names()
+        if not set(names) <= set(X.columns):
+            continue
+        block = X[names].sparse.to_coo().tocsr()
+        tokens = encoder.vocabulary + [f'rare {col}']
+        fields[col] = np.array(['|'.join(tokens[j] for j in block[i].indices) or 'Unknown'
+                                for i in range(block.shape[0])], dtype=object)
+    trials = []
+    for i in range(len(X)):
+        trial = {col: values[i] for col, values in fields.items()}
+        if 'enrollment' in X.columns:
+            trial['enrollment'] = int(X['enrollment'].iloc[i])
+        for col in fields:
+            if unknown_rate and rng.random() < unknown_rate:
+                trial[col] = f"unseen {col} {rng.integers(1 << 30)}"
+        trials.append(trial)
+    return trials
+
+def load_trial_pool(pool_size=POOL_SIZE, unknown_rate=0.0, seed=42, label_encoders_path=LABEL_ENCODERS_PATH,
+                    feature_spec_path=FEATURE_SPEC_PATH):
+    X = read_split(X_TEST_PATH)
+    rows = np.random.default_rng(seed).choice(len(X), min(pool_size, len(X)), replace=False)
+    with open(label_encoders_path, 'rb') as f:
+        label_encoders = pickle.load(f)
+    feature_spec = {}
+    if os.path.exists(feature_spec_path):
+        with open(feature_spec_path) as f:
+            feature_spec = json.load(f)
+    return decode_trials(X.iloc[np.sort(rows)], label_encoders, feature_spec, unknown_rate, seed)
+
+class ProcessSampler:
+    """CPU and RSS of the server processes, sampled on a background thread"""
+
+    def __init__(self, processes, interval=SAMPLE_INTERVAL):
+        self.processes = processes
+        self.interval = interval
+        self.samples = {pid: {"role": role, "cpu": [], "rss": []} for pid, (role, _) in processes.items()}
+        self._done = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        for _, process in self.processes.values():
+            with contextlib.suppress(psutil.Error):
+                process.cpu_percent(None)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            for pid, (_, process) in self.processes.items():
+                with contextlib.suppress(psutil.Error):
+                    self.samples[pid]["cpu"].append(process.cpu_percent(None))
+                    self.samples[pid]["rss"].append(process.memory_info().rss)
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+
+    def summary(self):
+        return {
+            str(pid): {
+                "role": sample["role"],
+                "cpu_mean_percent": round(float(np.mean(sample["cpu"])), 1) if sample["cpu"] else None,
+                "cpu_max_percent": round(float(np.max(sample["cpu"])), 1) if sample["cpu"] else None,
+                "rss_max_mb": round(max(sample["rss"]) / 2**20, 1) if sample["rss"] else None,
+            }
+            for pid, sample in self.samples.items()
+        }
+
+def server_processes(pid):
+    """The server process and its worker children, by pid, leaving out multiprocessing's resource tracker"""
+    master = psutil.Process(pid)
+    children = []
+    for child in master.children(recursive=True):
+        with contextlib.suppress(psutil.Error):
+            if 'resource_tracker' not in ' '.join(child.cmdline()):
+                children.append(child)
+    if not children:
+        return {pid: ("server", master)}
+    return {pid: ("master", master), **{child.pid: ("worker", child) for child in children}}
+
+def find_server_pid(url):
+    """Pid of the local process listening on the URL's port, or None"""
+    port = httpx.URL(url).port or 80
+    with contextlib.suppress(psutil.Error):
+        for connection in psutil.net_connections('tcp'):
+            if connection.status == psutil.CONN_LISTEN and connection.laddr.port == port and connection.pid:
+                return connection.pid
+    return None
+
+class Scenario:
+    """One request shape: trials per request and whether SHAP explanations are requested"""
+
+    def __init__(self, batch_size, explain, explanation_mode=None):
+        self.batch_size = batch_size
+        self.explain = explain
+        self.explanation_mode = explanation_mode
+        self.name = f"{'single' if batch_size == 1 else f'batch{batch_size}'}-{'explain' if explain else 'no-explain'}"
+
+    def request(self, pool, rng):
+        params = {"explain": str(self.explain).lower()}
+        if self.explanation_mode:
+            params["explanation_mode"] = self.explanation_mode
+        trials = [pool[i] for i in rng.integers(len(pool), size=self.batch_size)]
+        if self.batch_size == 1:
+            return "/predict", trials[0], params
+        return "/predict/batch", {"trials": trials}, params
+
+async def send(client, request, scheduled, results):
+    """POST one request; latency counts from when it was due, so a slow server cannot hide queueing"""
+    path, body, params = request
+    start = time.perf_counter()
+    try:
+        response = await client.post(path, json=body, params=params)
+        status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    end = time.perf_counter()
+    results.append((status, end - (scheduled or start), end - start))
+
+async def run_closed(client, scenario, pool, rng, concurrency, duration):
+    """`concurrency` clients, each sending its next request as soon as the previous one returns"""
+    results = []
+    deadline = time.perf_counter() + duration
+
+    async def user():
+        while time.perf_counter() < deadline:
+            await send(client, scenario.request(pool, rng), None, results)
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return results
+
+async def run_open(client, scenario, pool, rng, rate, duration):
+    """Requests started every 1/rate seconds whether or not earlier ones have returned"""
+    results = []
+    tasks = []
+    start = time.perf_counter()
+    for i in range(int(rate * duration)):
+        scheduled = start + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(client, scenario.request(pool, rng), scheduled, results)))
+    await asyncio.gather(*tasks)
+    return results
+
+def summarize(results, elapsed, batch_size):
+    """Throughput, status counts and latency percentiles of one scenario run"""
+    ok = [latency for status, latency, _ in results if status == 200]
+    service = [seconds for status, _, seconds in results if status == 200]
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    summary = {
+        "requests": len(results),
+        "ok": len(ok),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "rows_per_second": round(len(ok) * batch_size / elapsed, 2) if elapsed else 0.0,
+    }
+    if ok:
+        latency_ms = np.asarray(ok) * 1000
+        p50, p95, p99 = np.percentile(latency_ms, [50, 95, 99])
+        summary["latency_ms"] = {
+            "mean": round(float(latency_ms.mean()), 3),
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "max": round(float(latency_ms.max()), 3),
+        }
+        summary["service_p99_ms"] = round(float(np.percentile(service, 99) * 1000), 3)
+    return summary
+
+async def run_scenarios(client, scenarios, pool, args, processes):
+    rng = np.random.default_rng(args.seed)
+    report = {}
+    for scenario in scenarios:
+        # Connections, caches and the first SHAP calls warm up outside the measurement
+        for _ in range(args.warmup_requests):
+            await send(client, scenario.request(pool, rng), None, [])
+        cache_before = (await client.get("/cache")).json() if args.server_stats else None
+
+        with ProcessSampler(processes) as sampler:
+            start = time.perf_counter()
+            if args.mode == 'open':
+                results = await run_open(client, scenario, pool, rng, args.rate, args.duration)
+            else:
+                results = await run_closed(client, scenario, pool, rng, args.concurrency, args.duration)
+            elapsed = time.perf_counter() - start
+        summary = summarize(results, elapsed, scenario.batch_size)
+        summary["processes"] = sampler.summary()
+
+        if args.server_stats:
+            cache_after = (await client.get("/cache")).json()
+            lookups = (cache_after["hits"] + cache_after["misses"]) - (cache_before["hits"] + cache_before["misses"])
+            summary["explanation_cache_hit_rate"] = round(
+                (cache_after["hits"] - cache_before["hits"]) / lookups, 4) if lookups else None
+            summary["scheduler"] = (await client.get("/scheduler")).json()
+        report[scenario.name] = summary
+        latency = summary.get("latency_ms", {})
+        print(f"{scenario.name:<22} {summary['rps']:>9.1f} req/s  p50 {latency.get('p50', float('nan')):8.2f}ms  "
+              f"p95 {latency.get('p95', float('nan')):8.2f}ms  p99 {latency.get('p99', float('nan')):8.2f}ms  "
+              f"errors {summary['error_rate']:.1%}")
+    return report
+
+@contextlib.asynccontextmanager
+async def in_process_client(timeout):
+    """The app in this process, lifespan included, behind an ASGI transport"""
+    from app.main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+            yield client
+
+@contextlib.contextmanager
+def spawned_server(port, workers):
+    """A local uvicorn serving app.main:app, stopped on exit"""
+    command = [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1',
+               '--port', str(port), '--workers', str(workers), '--log-level', 'warning']
+    server = subprocess.Popen(command, cwd=os.getcwd())
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 120
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+            with contextlib.suppress(httpx.HTTPError):
+                if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                    break
+            if time.monotonic() > deadline:
+                raise RuntimeError("uvicorn did not become healthy within 120s")
+            time.sleep(0.5)
+        yield url, server.pid
+    finally:
+        server.terminate()
+        with contextlib.suppress(subprocess.TimeoutExpired):
+            server.wait(timeout=30)
+        if server.poll() is None:
+            server.kill()
+
+async def run(args, scenarios, pool):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    if args.target == 'in-process':
+        async with in_process_client(args.timeout) as client:
+            processes = {os.getpid(): ("in-process", psutil.Process())}
+            return await run_scenarios(client, scenarios, pool, args, processes)
+
+    with contextlib.ExitStack() as stack:
+        if args.target == 'spawn':
+            url, pid = stack.enter_context(spawned_server(args.port, args.server_workers))
+        else:
+            url, pid = args.url, args.server_pid or find_server_pid(args.url)
+            if pid is None:
+                print(f"No local process found listening for {url}; CPU/RSS will not be reported")
+        processes = server_processes(pid) if pid else {}
+        async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+            return await run_scenarios(client, scenarios, pool, args, processes)
+
+def compare(report, baseline, latency_threshold=LATENCY_THRESHOLD, throughput_threshold=THROUGHPUT_THRESHOLD,
+            error_threshold=ERROR_THRESHOLD):
+    """Print scenario-by-scenario changes against `baseline` and return the regressions found"""
+    changed = sorted(key for key in set(report["config"]) | set(baseline.get("config", {}))
+                     if report["config"].get(key) != baseline.get("config", {}).get(key))
+    if changed:
+        print(f"Warning: baseline was measured with different {', '.join(changed)}")
+    regressions = []
+    print(f"\n{'scenario':<22}{'req/s':>10}{'baseline':>10}{'change':>9}{'p99 ms':>10}{'baseline':>10}{'change':>9}")
+    for name, scenario in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None or "latency_ms" not in base:
+            continue
+        p99 = scenario.get("latency_ms", {}).get("p99", float('inf'))
+        base_p99 = base["latency_ms"]["p99"]
+        rps_change = scenario["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        p99_change = p99 / base_p99 - 1 if base_p99 else 0.0
+        print(f"{name:<22}{scenario['rps']:>10.1f}{base['rps']:>10.1f}{rps_change:>+9.0%}"
+              f"{p99:>10.2f}{base_p99:>10.2f}{p99_change:>+9.0%}")
+        if rps_change < -throughput_threshold:
+            regressions.append(f"{name}: {scenario['rps']:.1f} req/s vs {base['rps']:.1f} ({rps_change:+.0%})")
+        if p99_change > latency_threshold:
+            regressions.append(f"{name}: p99 {p99:.2f}ms vs {base_p99:.2f}ms ({p99_change:+.0%})")
+        if scenario["error_rate"] > base["error_rate"] + error_threshold:
+            regressions.append(f"{name}: error rate {scenario['error_rate']:.1%} vs {base['error_rate']:.1%}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the prediction API")
+    parser.add_argument('--target', choices=('in-process', 'spawn', 'url'), default='in-process',
+                        help="in-process: app.main:app through an ASGI transport; spawn: start a local "
+                             "uvicorn; url: an already running server")
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help="server for --target url")
+    parser.add_argument('--server-pid', type=int, help="pid to sample for --target url (default: port owner)")
+    parser.add_argument('--port', type=int, default=8765, help="port for --target spawn")
+    parser.add_argument('--server-workers', type=int, default=1, help="uvicorn workers for --target spawn")
+    parser.add_argument('--mode', choices=LOAD_MODES, default='closed',
+                        help="closed: fixed concurrency; open: fixed arrival rate")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=50.0, help="requests per second for --mode open")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1],
+                        help="trials per request; 1 uses /predict, more use /predict/batch")
+    parser.add_argument('--explain', choices=EXPLAIN_SETTINGS, default='both')
+    parser.add_argument('--explanation-mode', help="explanation_mode query parameter (default: server's)")
+    parser.add_argument('--unknown-rate', type=float, default=0.0,
+                        help="chance of replacing each categorical field with an unseen value")
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE, help="X_test trials requests draw from")
+    parser.add_argument('--warmup-requests', type=int, default=WARMUP_REQUESTS)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--no-server-stats', dest='server_stats', action='store_false',
+                        help="do not read /cache and /scheduler around each scenario")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='load_test_report.json')
+    parser.add_argument('--baseline', help="earlier report to compare against")
+    parser.add_argument('--latency-threshold', type=float, default=LATENCY_THRESHOLD)
+    parser.add_argument('--throughput-threshold', type=float, default=THROUGHPUT_THRESHOLD)
+    parser.add_argument('--error-threshold', type=float, default=ERROR_THRESHOLD)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    explain = {'on': [True], 'off': [False], 'both': [True, False]}[args.explain]
+    scenarios = [Scenario(batch_size, flag, args.explanation_mode)
+                 for batch_size, flag in itertools.product(args.batch_sizes, explain)]
+    pool = load_trial_pool(args.pool_size, args.unknown_rate, args.seed)
+    print(f"Replaying {len(pool)} X_test trials ({args.unknown_rate:.0%} unseen values) against {args.target}, "
+          f"{args.mode} loop, {args.duration:.0f}s per scenario")
+    results = asyncio.run(run(args, scenarios, pool))
+
+    report = {
+        "version": REPORT_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "commit": git_commit(),
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "memory_mb": round(psutil.virtual_memory().total / 2**20),
+        },
+        "config": {
+            "target": args.target,
+            "server_workers": args.server_workers if args.target == 'spawn' else None,
+            "mode": args.mode,
+            "concurrency": args.concurrency if args.mode == 'closed' else None,
+            "rate": args.rate if args.mode == 'open' else None,
+            "duration": args.duration,
+            "explanation_mode": args.explanation_mode,
+            "unknown_rate": args.unknown_rate,
+            "pool_size": len(pool),
+            "seed": args.seed,
+        },
+        "scenarios": results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.latency_threshold, args.throughput_threshold,
+                              args.error_threshold)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"- {regression}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,22 @@
 import pandas as pd
 import numpy as np
 import warnings
-import gc
+import argparse
+import contextlib
+import functools
+import io
+import json
 import os
 import pickle
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
+from pipeline_cache import CACHE_DIR, PipelineCache, cache_key, write_frame
+from imputation import DEFAULT_GROUP_COLS, IMPUTATION_STRATEGIES, group_median, neighbor_median
+from multi_hot import MIN_TOKEN_FREQ, MULTI_HOT_COLS, MultiHotEncoder
+from text_features import N_TEXT_FEATURES, TEXT_COLS, TextHasher, clean_criteria
+from study_design import DESIGN_COLUMNS, parse_study_design
+from dtype_policy import DTYPE_POLICIES, category_codes, compact_numeric, frame_memory_mb, sparse_frame, to_categorical
+from partitioning import PARTITIONS_PER_WORKER, concat_partitions, map_partitions, partition_ids
 warnings.filterwarnings('ignore')
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
@@ -53,54 +65,323 @@ def unify_columns(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
+# Raw files and the columns each one contributes, keyed by lower-case header
+# name with the dtype to parse them as (None lets pandas infer it). Only these
+# columns are parsed; 'reduce' says how rows are collapsed per nct_id while
+# the file streams in: "first" keeps each trial's first row, "aggregate"
+# keeps the per-trial 'aggregates', each an output name mapped to
+# (function, source column) with function one of size, sum, max or nunique.
+# 'splittable' files have no quoted multi-line fields, so they can be cut
+# into byte ranges at line breaks and parsed in parallel.
+RAW_DATA_DIR = os.path.join("data", "raw")
+RAW_FILES = [
+    {
+        "name": "eligibilities.txt",
+        "delimiter": "|",
+        "columns": {"nct_id": "object", "criteria": "object"},
+        "reduce": "first",
+        "splittable": False,
+    },
+    {
+        "name": "drop_withdrawals.txt",
+        "delimiter": "|",
+        "columns": {"nct_id": "object", "count": "float64"},
+        "reduce": "aggregate",
+        "aggregates": {"withdrawal_count": ("sum", "count")},
+        "splittable": True,
+    },
+    {
+        "name": "facilities.txt",
+        "delimiter": "|",
+        "columns": {"nct_id": "object", "country": "object"},
+        "reduce": "aggregate",
+        "aggregates": {"facility_count": ("size", None), "country_count": ("nunique", "country")},
+        "splittable": True,
+    },
+    {
+        "name": "reported_events.txt",
+        "delimiter": "|",
+        "columns": {"nct_id": "object", "subjects_at_risk": "float64"},
+        "reduce": "aggregate",
+        "aggregates": {"event_count": ("size", None), "subjects_at_risk": ("max", "subjects_at_risk")},
+        "splittable": True,
+    },
+    {
+        "name": "usecase_3_.csv",
+        "delimiter": ",",
+        "columns": {
+            "nct number": "object",
+            "study title": "object",
+            "study status": "object",
+            "study design": "object",
+            "conditions": "object",
+            "interventions": "object",
+            "enrollment": None,
+        },
+        "reduce": "first",
+        "splittable": False,
+    },
+]
+
+# Per-trial aggregates produced by the "aggregate" files; trials without rows
+# in a file get 0
+AGGREGATE_FEATURES = {
+    name: aggregate
+    for spec in RAW_FILES
+    for name, aggregate in spec.get("aggregates", {}).items()
+}
+
+# Files above this size are split into byte ranges when loading in parallel
+SPLIT_MIN_BYTES = 32 * 1024 * 1024
+
+# Columns of the merged data that preprocessing keeps
+RELEVANT_COLS = [
+    "study_title",
+    "study_status",
+    "criteria",
+    "study_design",
+    "condition",
+    "intervention",
+    "enrollment"
+]
+
+PROCESSED_DIR = os.path.join("data", "processed")
+LABEL_ENCODERS_PATH = os.path.join(PROCESSED_DIR, "label_encoders.pkl")
+# Encoding of every feature column, read by the API to rebuild request features
+FEATURE_SPEC_PATH = os.path.join(PROCESSED_DIR, "feature_spec.json")
+# label: one row per intervention x condition; sparse: one row per trial with
+# multi-hot intervention and condition columns
+ENCODINGS = ('label', 'sparse')
+# label: criteria and study_title get label codes; hashed: hashed term vectors
+TEXT_ENCODINGS = ('label', 'hashed')
+# Records the cache key of the splits currently in PROCESSED_DIR
+PROCESSED_KEY_FILE = os.path.join(PROCESSED_DIR, "cache_key.txt")
+# Source files whose code shapes the cached datasets, merged frame and splits;
+# editing any of them invalidates the cache
+PIPELINE_SOURCES = [
+    os.path.abspath(__file__),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'imputation.py'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'multi_hot.py'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'text_features.py'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'study_design.py'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dtype_policy.py'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'partitioning.py'),
+]
+
+class ByteRangeFile(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file"""
+
+    def __init__(self, filepath, start, end):
+        self._file = open(filepath, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= read
+        return read
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def split_byte_ranges(filepath, parts):
+    """
+    Cut a file into about `parts` byte ranges that start and end on line
+    boundaries. The header line is excluded from every range.
+    """
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        bounds = [start]
+        step = max(1, (size - start) // parts)
+        for i in range(1, parts):
+            f.seek(max(start + i * step, bounds[-1]))
+            f.readline()
+            position = f.tell()
+            if position >= size:
+                break
+            if position > bounds[-1]:
+                bounds.append(position)
+        bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def iter_file_chunks(filepath,
+                     chunksize=10000,
+                     delimiter=',',
+                     usecols=None,
+                     dtype=None,
+                     byte_range=None,
+                     progress=True):
+    """
+    Stream a delimited file as unified chunks.
+    Only the header names listed in `usecols` (matched case-insensitively) are
+    parsed, `dtype` is keyed the same way, and progress is reported in bytes
+    read so the file is only scanned once. With `byte_range=(start, end)` only
+    the lines in that range are parsed, using the file's header for names.
+    """
+    header = pd.read_csv(filepath, delimiter=delimiter, encoding='utf-8', nrows=0).columns
+    if usecols is not None:
+        wanted = {c.lower() for c in usecols}
+        usecols = [c for c in header if c.lower() in wanted]
+    dtype = {c: dtype[c.lower()] for c in header
+             if dtype and dtype.get(c.lower()) is not None} or None
+
+    if byte_range is None:
+        f = open(filepath, 'rb')
+        start, total = 0, os.path.getsize(filepath)
+        header_kwargs = {}
+    else:
+        f = io.BufferedReader(ByteRangeFile(filepath, *byte_range))
+        start, total = byte_range[0], byte_range[1] - byte_range[0]
+        header_kwargs = {"header": None, "names": list(header)}
+
+    with f, tqdm(total=total, unit='B', unit_scale=True, disable=not progress,
+                 desc=f"Processing {filepath}") as pbar:
+        chunk_iter = pd.read_csv(
+            f,
+            chunksize=chunksize,
+            delimiter=delimiter,
+            encoding='utf-8',
+            usecols=usecols,
+            dtype=dtype,
+            **header_kwargs
+        )
+        for chunk in chunk_iter:
+            chunk.columns = [c.lower() for c in chunk.columns]
+            chunk = unify_columns(chunk)
+            pbar.update(f.tell() - start - pbar.n)
+            if not chunk.empty:
+                yield chunk
+
+def first_per_trial(chunks, key='nct_id'):
+    """Keep only the first row seen for each trial across a stream of chunks"""
+    seen = set()
+    for chunk in chunks:
+        if key not in chunk.columns:
+            yield chunk
+            continue
+        chunk = chunk.drop_duplicates(subset=key)
+        keys = chunk[key].to_numpy()
+        is_new = np.fromiter((k not in seen for k in keys), dtype=bool, count=len(keys))
+        seen.update(keys[is_new])
+        if is_new.any():
+            yield chunk[is_new]
+
+def _partial_aggregates(chunk, aggregates, keys):
+    """Per-row partial aggregates of a raw chunk; partial chunks pass through unchanged"""
+    partial = chunk[keys].copy()
+    for name, (func, column) in aggregates.items():
+        if func == 'nunique':
+            continue
+        if name in chunk.columns:
+            partial[name] = chunk[name]
+        elif func == 'size':
+            partial[name] = 1
+        else:
+            partial[name] = pd.to_numeric(chunk[column], errors='coerce')
+    return partial
+
+def aggregate_per_trial(chunks, aggregates, key='nct_id'):
+    """
+    Reduce a stream of chunks to partial per-trial aggregates.
+    Rows are hashed on the trial (and on the value of any nunique column) and
+    combined with sum/max, in order of first appearance. The partials can be
+    reduced again, so byte-range results combine exactly; finalize_aggregates
+    turns them into one row per trial.
+    """
+    keys = [key] + [column for func, column in aggregates.values() if func == 'nunique']
+    how = {name: 'max' if func == 'max' else 'sum'
+           for name, (func, column) in aggregates.items() if func != 'nunique'}
+
+    def combine(frames):
+        combined = pd.concat(frames, ignore_index=True)
+        if not how:
+            return combined.drop_duplicates(subset=keys)
+        return combined.groupby(keys, sort=False, dropna=False).agg(how).reset_index()
+
+    reduced, pending, pending_rows = None, [], 0
+    for chunk in chunks:
+        if key not in chunk.columns:
+            continue
+        pending.append(combine([_partial_aggregates(chunk, aggregates, keys)]))
+        pending_rows += len(pending[-1])
+        # Fold pending partials in once they outgrow the running result
+        if pending_rows > (len(reduced) if reduced is not None else 0):
+            reduced = combine(([reduced] if reduced is not None else []) + pending)
+            pending, pending_rows = [], 0
+    if pending:
+        reduced = combine(([reduced] if reduced is not None else []) + pending)
+    if reduced is not None and not reduced.empty:
+        yield reduced
+
+def finalize_aggregates(df, key='nct_id'):
+    """One row per trial from partial aggregates produced by aggregate_per_trial"""
+    grouped = df.groupby(key, sort=False)
+    columns = {}
+    for name, (func, column) in AGGREGATE_FEATURES.items():
+        if func == 'nunique' and column in df.columns:
+            columns[name] = grouped[column].nunique()
+        elif name in df.columns:
+            columns[name] = grouped[name].max() if func == 'max' else grouped[name].sum()
+    return pd.DataFrame(columns).reset_index()
+
+# Reducers applied to each file's chunk stream
+CHUNK_REDUCERS = {
+    "first": first_per_trial,
+    "aggregate": aggregate_per_trial,
+}
+
+def chunk_reducer(spec):
+    """The chunk stream reducer for a RAW_FILES entry, or None"""
+    if spec["reduce"] is None:
+        return None
+    if spec["reduce"] == "aggregate":
+        return functools.partial(aggregate_per_trial, aggregates=spec["aggregates"])
+    return CHUNK_REDUCERS[spec["reduce"]]
+
 def read_file_in_chunks(filepath,
                         chunksize=10000,
                         delimiter=',',
                         usecols=None,
                         dtype=None,
-                        low_memory=False):
+                        reduce=None):
     """
     Read large files in smaller chunks and unify columns. 
     For XLSX files, read directly. 
-    Avoid specifying usecols if columns aren't present in the file.
+    Text files are streamed: each chunk is projected to `usecols`, unified and
+    passed through the `reduce` step (a CHUNK_REDUCERS name or a callable)
+    before it is kept, so memory is bounded by the reduced result rather than
+    the file size.
     """
     if not os.path.exists(filepath):
         print(f"File not found: {filepath}")
         return None
 
     try:
-        chunks = []
         if filepath.endswith('.xlsx'):
             # Read Excel
             temp_df = pd.read_excel(filepath, dtype=dtype)
             temp_df.columns = [c.lower() for c in temp_df.columns]
-            temp_df = unify_columns(temp_df)
-            chunks.append(temp_df)
+            chunks = [unify_columns(temp_df)]
         else:
-            # Count total lines for progress
-            with open(filepath, 'r', encoding='utf-8') as f:
-                total_rows = sum(1 for _ in f)
-
-            # Read CSV/text in chunks
-            chunk_iter = pd.read_csv(
-                filepath,
-                chunksize=chunksize,
-                delimiter=delimiter,
-                encoding='utf-8',
-                usecols=None,
-                dtype=dtype,
-                low_memory=low_memory
-            )
-
-            with tqdm(total=max(1, total_rows // chunksize),
-                      desc=f"Processing {filepath}") as pbar:
-                for chunk in chunk_iter:
-                    chunk.columns = [c.lower() for c in chunk.columns]
-                    chunk = unify_columns(chunk)
-                    if not chunk.empty:
-                        chunks.append(chunk)
-                    gc.collect()
-                    pbar.update(1)
+            chunks = iter_file_chunks(filepath, chunksize=chunksize, delimiter=delimiter,
+                                      usecols=usecols, dtype=dtype)
+            if isinstance(reduce, str):
+                reduce = CHUNK_REDUCERS[reduce]
+            if reduce is not None:
+                chunks = reduce(chunks)
+            chunks = list(chunks)
 
         if chunks:
             result = pd.concat(chunks, ignore_index=True)
@@ -114,46 +395,124 @@ def read_file_in_chunks(filepath,
         print(f"Error reading {filepath}: {str(e)}")
         return None
 
-def load_data():
-    """ Load raw files,and return a list of DataFrames. """
-    files = [
-        # Force 'criteria' from eligibilities.txt
-        ("eligibilities.txt", "|"),
-        ("drop_withdrawals.txt", "|"),
-        ("facilities.txt", "|"),
-        ("reported_events.txt", "|"),
-        ("usecase_3_.csv", ","),
-    ]
-
-    dtypes = {
-        "nct_id": "object"
-    }
+def load_file(spec, raw_dir=RAW_DATA_DIR):
+    """Load one raw file described by a RAW_FILES entry"""
+    return read_file_in_chunks(
+        os.path.join(raw_dir, spec["name"]),
+        delimiter=spec["delimiter"],
+        usecols=list(spec["columns"]),
+        dtype=spec["columns"],
+        reduce=chunk_reducer(spec)
+    )
 
-    datasets = []
-    for fname, delim in files:
-        filepath = os.path.join("data", "raw", fname)
-        if delim:
-            kwargs = {
-                "delimiter": delim,
-                "usecols": None,
-                "dtype": dtypes,
-                "low_memory": False,
-            }
-        else:
-            # XLSX or no delimiter
-            kwargs = {
-                "usecols": None,
-                "dtype": dtypes,
-            }
-        df = read_file_in_chunks(filepath, **kwargs)
-        if df is not None and not df.empty:
-            datasets.append(df)
+def _load_byte_range(spec, filepath, byte_range):
+    """Worker task: parse and reduce one byte range of a splittable file"""
+    chunks = iter_file_chunks(filepath, delimiter=spec["delimiter"], usecols=list(spec["columns"]),
+                              dtype=spec["columns"], byte_range=byte_range, progress=False)
+    if spec["reduce"] is not None:
+        chunks = chunk_reducer(spec)(chunks)
+    chunks = list(chunks)
+    return pd.concat(chunks, ignore_index=True) if chunks else None
+
+def _load_file_quietly(spec, raw_dir):
+    """Worker task: load a whole file without a progress bar"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+        return load_file(spec, raw_dir)
+
+def load_data_parallel(raw_dir=RAW_DATA_DIR, workers=None, specs=RAW_FILES):
+    """
+    Load raw files on a process pool and return {file name: DataFrame}.
+    Large splittable files are parsed as several byte ranges; the range
+    results are concatenated in file order and reduced again, so the output
+    matches the sequential load_data.
+    """
+    workers = workers or os.cpu_count()
+    tasks = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for spec in specs:
+            filepath = os.path.join(raw_dir, spec["name"])
+            if not os.path.exists(filepath):
+                print(f"File not found: {filepath}")
+                continue
+            size = os.path.getsize(filepath)
+            if spec["splittable"] and workers > 1 and size > SPLIT_MIN_BYTES:
+                parts = min(workers, -(-size // SPLIT_MIN_BYTES))
+                ranges = split_byte_ranges(filepath, parts)
+                futures = [pool.submit(_load_byte_range, spec, filepath, r) for r in ranges]
+            else:
+                futures = [pool.submit(_load_file_quietly, spec, raw_dir)]
+            tasks.append((spec, futures))
+
+        datasets = {}
+        for spec, futures in tqdm(tasks, desc="Loading raw files"):
+            parts = [df for df in (future.result() for future in futures) if df is not None]
+            if not parts:
+                continue
+            if len(parts) > 1 and spec["reduce"] is not None:
+                parts = list(chunk_reducer(spec)(parts))
+            df = pd.concat(parts, ignore_index=True)
+            if not df.empty:
+                print(f"Loaded {len(df)} rows from {spec['name']} in {len(futures)} part(s)")
+                datasets[spec["name"]] = df
     return datasets
 
+def pipeline_cache_keys(cache, raw_dir=RAW_DATA_DIR, params=None):
+    """
+    Cache keys for every pipeline stage. Each loaded dataset is keyed by its
+    file content and RAW_FILES spec, the merged frame by the dataset keys, and
+    the splits by the merged key and preprocessing `params`; all of them
+    include the pipeline code.
+    """
+    code = [cache.file_digest(path) for path in PIPELINE_SOURCES]
+    datasets = {}
+    for spec in RAW_FILES:
+        filepath = os.path.join(raw_dir, spec["name"])
+        if os.path.exists(filepath):
+            datasets[spec["name"]] = cache_key("dataset", spec, cache.file_digest(filepath), code)
+    merged = cache_key("merged", datasets, code)
+    return {"datasets": datasets, "merged": merged, "splits": cache_key("splits", merged, code, params or {})}
+
+def load_data(raw_dir=RAW_DATA_DIR, workers=1, cache=None, cache_keys=None):
+    """ Load raw files,and return a list of DataFrames. 
+    With a cache, files whose content and spec are unchanged are read back
+    from it and only the others are parsed.
+    """
+    cache_keys = cache_keys or {}
+    loaded = {}
+    for name, key in cache_keys.items():
+        frames = cache.load_frames("datasets", key)
+        if frames is not None:
+            loaded[name] = frames["data"]
+            print(f"Loaded {len(loaded[name])} rows from {name} (cached)")
+
+    pending = [spec for spec in RAW_FILES if spec["name"] not in loaded]
+    if not pending:
+        parsed = {}
+    elif workers is None or workers > 1:
+        parsed = load_data_parallel(raw_dir, workers, pending)
+    else:
+        parsed = {spec["name"]: load_file(spec, raw_dir) for spec in pending}
+
+    for name, df in parsed.items():
+        if df is None or df.empty:
+            continue
+        loaded[name] = df
+        if cache is not None and name in cache_keys:
+            cache.save_frames("datasets", cache_keys[name], {"data": df})
+
+    return [loaded[spec["name"]] for spec in RAW_FILES if spec["name"] in loaded]
+
 def merge_datasets(datasets):
     """
-    Merge all datasets on 'nct_id', ensuring uniqueness and correct 'study_status'.
-    This way, 'criteria' from eligibilities.txt will be combined properly.
+    Join all datasets into one row per 'nct_id', ensuring correct 'study_status'.
+    1) Every source is reduced to one row per trial: aggregated sources are
+       finalized into per-trial aggregates, the others keep their first row.
+    2) Trials are indexed in order of first appearance, taking sources with
+       'study_status' first, and every source is placed by key lookup.
+    3) Attribute columns take the first non-missing value across sources, so
+       'criteria' from eligibilities.txt is combined with every trial.
+       Aggregates are 0 for trials a source has no rows for, and trials
+       without a status are 'not completed'.
     """
     if not datasets:
         return None
@@ -163,28 +522,49 @@ def merge_datasets(datasets):
 
     for idx, df in enumerate(datasets):
         # Drop unnamed columns
-        df.drop(columns=[col for col in df.columns if col.startswith('unnamed')], errors='ignore', inplace=True)
+        df = df.drop(columns=[col for col in df.columns if col.startswith('unnamed')])
 
         if "nct_id" not in df.columns:
             print(f"Dataset {idx + 1} is missing 'nct_id' column.")
             continue
 
-        initial_count = len(df)
-        df = df.drop_duplicates(subset="nct_id")
-        final_count = len(df)
-        duplicates_dropped = initial_count - final_count
-        if duplicates_dropped > 0:
-            print(f"Dropped {duplicates_dropped} duplicates in dataset {idx + 1}")
+        if any(name in df.columns for name in AGGREGATE_FEATURES):
+            df = finalize_aggregates(df)
+        else:
+            initial_count = len(df)
+            df = df.drop_duplicates(subset="nct_id")
+            duplicates_dropped = initial_count - len(df)
+            if duplicates_dropped > 0:
+                print(f"Dropped {duplicates_dropped} duplicates in dataset {idx + 1}")
 
         if "study_status" in df.columns:
             df["study_status"] = df["study_status"].astype(str).str.lower()
             datasets_with_status.append(df)
         else:
-            df["study_status"] = "not completed"
             datasets_without_status.append(df)
 
-    merged = pd.concat(datasets_with_status + datasets_without_status, ignore_index=True)
-    merged = merged.drop_duplicates(subset="nct_id")
+    sources = datasets_with_status + datasets_without_status
+    if not sources:
+        return None
+
+    # 2) One index entry per trial, in order of first appearance
+    trials = pd.Index(pd.concat([df["nct_id"] for df in sources], ignore_index=True).unique(), name="nct_id")
+    columns = {}
+    for df in sources:
+        df = df.set_index("nct_id")
+        for col in df.columns:
+            values = df[col].reindex(trials)
+            # 3) First non-missing value across sources
+            columns[col] = values if col not in columns else columns[col].where(columns[col].notna(), values)
+
+    merged = pd.DataFrame(columns, index=trials)
+    for name, (func, column) in AGGREGATE_FEATURES.items():
+        if name in merged.columns:
+            merged[name] = merged[name].fillna(0)
+            if func in ('size', 'nunique'):
+                merged[name] = merged[name].astype(np.int64)
+    merged["study_status"] = merged.get("study_status", pd.Series(index=trials, dtype=object)).fillna("not completed")
+    merged = merged.reset_index()
     print(f"Initialized merged dataset with {len(merged)} records.")
 
     return merged
@@ -192,113 +572,236 @@ def merge_datasets(datasets):
 def split_and_expand(df: pd.DataFrame, column: str, delimiter: str = '|') -> pd.DataFrame:
     """
     Splits the values in a column using a delimiter and expands them into multiple rows.
+    Expanded values keep their row's index, so each lines up with its own trial.
     """
     if column in df.columns:
-        expanded = df[column].str.split(delimiter).explode().reset_index(drop=True)
+        expanded = df[column].str.split(delimiter, regex=False).explode()
         df = df.drop(columns=[column]).join(expanded.to_frame(column))
     return df
 
-def preprocess_columns(df: pd.DataFrame) -> pd.DataFrame:
+def preprocess_columns(df: pd.DataFrame, expand: bool = True, categorical: bool = False) -> pd.DataFrame:
     """
     Preprocess columns like `intervention`, `study_design`, and `condition`
     by splitting and encoding them as subfeatures.
+    With `expand=False` the multi-valued columns stay one row per trial, for
+    multi-hot encoding. With `categorical=True` the other string columns
+    become categoricals before expanding, so the exploded rows repeat a code
+    rather than a string.
     """
     # Split and expand the specified columns
     # --- Process study_design ---
     if 'study_design' in df.columns:
-        design_subfeatures = ['Allocation', 'Intervention Model', 'Masking', 'Primary Purpose']
-        for feature in design_subfeatures:
-            df[feature] = df['study_design'].str.extract(f"{feature}: ([^|]*)")
-        df[design_subfeatures] = df[design_subfeatures].fillna('Unknown')
+        # One parse per distinct design string into categorical columns
+        df[DESIGN_COLUMNS] = parse_study_design(df['study_design'])
         # Drop the original 'study_design' column
         df.drop(columns=['study_design'], inplace=True)
-        # Rename columns
-        df.rename(columns={'Intervention Model': 'Intervention_Model', 'Primary Purpose': 'Primary_Purpose'}, inplace=True)
 
-    df = split_and_expand(df, 'intervention', '|')
-    df = split_and_expand(df, 'condition', '|')
+    # Cleaned once per trial, before its rows are repeated
+    if 'criteria' in df.columns:
+        df['criteria'] = clean_criteria(df['criteria'])
+
+    if categorical:
+        per_trial = [c for c in df.select_dtypes(include=["object", "string"]).columns
+                     if c not in ['study_status', 'intervention', 'condition']]
+        df = to_categorical(df, per_trial)
 
-    # Normalize the text (remove leading/trailing spaces)
-    for col in ['intervention', 'condition']:
-        if col in df.columns:
-            df[col] = df[col].str.strip()
+    if expand:
+        df = split_and_expand(df, 'intervention', '|')
+        df = split_and_expand(df, 'condition', '|')
 
-    if 'criteria' in df.columns:
-        df['criteria'] = df['criteria'].str.replace(r'[~\-#^*`]', '', regex=True).str.strip()
+        # Normalize the text (remove leading/trailing spaces)
+        for col in ['intervention', 'condition']:
+            if col in df.columns:
+                df[col] = df[col].str.strip()
     return df
 
-def impute_enrollment(df):
-    """Helper function to impute enrollment values using nearby known values"""
+def design_field(df: pd.DataFrame, column: str) -> pd.Series:
+    """A study_design sub-field such as 'Primary_Purpose', read from df if already extracted"""
+    if column in df.columns:
+        return df[column]
+    if 'study_design' not in df.columns:
+        return pd.Series('Unknown', index=df.index)
+    return parse_study_design(df['study_design'])[column]
+
+def impute_enrollment(df, strategy='neighbors', group_cols=None, fill_value=None):
+    """Helper function to impute enrollment values using nearby known values
+    'neighbors' fills each gap with the median of the known values from 3
+    rows before to 4 rows after it, by position; 'group' uses the median of
+    trials sharing `group_cols` (study design fields by default). Values
+    still missing get `fill_value`, the overall median by default.
+    """
+    if strategy not in IMPUTATION_STRATEGIES:
+        raise ValueError(f"Unknown imputation strategy: {strategy}")
+
     # Convert enrollment to numeric, marking 'Unknown' as NaN
-    df['enrollment'] = pd.to_numeric(df['enrollment'].replace('Unknown', np.nan))
-    
-    # Create a copy of the original index for reference
-    df['original_index'] = df.index
-    
-    # Sort by original index to maintain order
-    df = df.sort_values('original_index')
-    
-    # For each NaN value
-    for idx in df[df['enrollment'].isna()].index:
-        # Get 3 values before and 3 after
-        start_idx = max(0, idx - 3)
-        end_idx = min(len(df), idx + 4)
-        
-        # Get nearby known values
-        nearby_values = df.loc[start_idx:end_idx, 'enrollment'].dropna()
-        
-        if len(nearby_values) > 0:
-            # Impute with median of nearby values
-            df.loc[idx, 'enrollment'] = nearby_values.median()
-    
+    enrollment = pd.to_numeric(df['enrollment'].replace('Unknown', np.nan))
+
+    if strategy == 'group':
+        group_cols = group_cols or DEFAULT_GROUP_COLS
+        groups = pd.DataFrame({col: design_field(df, col) for col in group_cols})
+        imputed = group_median(enrollment, groups)
+    else:
+        imputed = neighbor_median(enrollment)
+
     # Fill any remaining NaN with overall median
-    overall_median = df['enrollment'].median()
-    df['enrollment'] = df['enrollment'].fillna(overall_median)
-    
-    # Remove helper column
-    df = df.drop('original_index', axis=1)
-    
+    imputed = pd.Series(imputed, index=df.index)
+    df['enrollment'] = imputed.fillna(imputed.median() if fill_value is None else fill_value)
     return df
 
-def preprocess_data(merged: pd.DataFrame) -> pd.DataFrame:
+def select_columns(merged: pd.DataFrame, aggregate_features=False) -> pd.DataFrame:
+    """Keep only the relevant columns, plus the per-trial aggregates if requested"""
+    relevant_cols = list(RELEVANT_COLS)
+    if aggregate_features:
+        relevant_cols += list(AGGREGATE_FEATURES)
+        for name in AGGREGATE_FEATURES:
+            if name not in merged.columns:
+                merged[name] = 0
+    return merged.reindex(columns=relevant_cols, fill_value="Unknown")
+
+def expand_columns(merged: pd.DataFrame, encoding='label', dtypes='compact') -> pd.DataFrame:
     """
-    Keep only relevant columns, handle missing values, encode categorical features.
+    Fill missing values and split study_design, exploding multi-valued fields
+    for encoding='label'. With dtypes='compact' the string features are
+    stored as categoricals: per-trial columns before the explode, the
+    exploded intervention/condition values after it.
     """
-    # 1) Keep only relevant columns
-    relevant_cols = [
-        "study_title",
-        "study_status",
-        "criteria",
-        "study_design",
-        "condition",
-        "intervention",
-        "enrollment"
-    ]
-    merged = merged.reindex(columns=relevant_cols, fill_value="Unknown")
-    
-    # 2) Impute enrollment values
-    merged = impute_enrollment(merged)
-
-    # 3) Fill missing values for other columns
     for col in merged.columns:
         if col != 'enrollment':  # Skip enrollment as it's already handled
             merged[col] = merged[col].fillna("Unknown")
+    expand = encoding != 'sparse' or not any(c in merged.columns for c in MULTI_HOT_COLS)
+    merged = preprocess_columns(merged, expand=expand, categorical=dtypes == 'compact')
+    if dtypes == 'compact':
+        strings = [c for c in merged.select_dtypes(include=["object", "string"]).columns if c != 'study_status']
+        merged = to_categorical(merged, strings)
+    return merged
 
-    merged = preprocess_columns(merged)
+def expand_partitioned(merged: pd.DataFrame, keys: pd.Series, encoding='label', dtypes='compact',
+                       partitions=None, workers=1) -> pd.DataFrame:
+    """
+    expand_columns on `partitions` hash partitions of the trials, on
+    `workers` processes (PARTITIONS_PER_WORKER per worker by default).
+    `keys`, the nct_id of every row, decides the partition, so a trial and
+    all its exploded rows stay in one. The expanded partitions are put back
+    in the original row order with the categories of the whole frame, so the
+    result equals expand_columns(merged).
+    """
+    partitions = partitions or workers * PARTITIONS_PER_WORKER
+    parts = map_partitions(merged, partition_ids(keys, partitions), expand_columns,
+                           (encoding, dtypes), workers=workers)
+    return concat_partitions(parts)
+
+def encode_features(merged: pd.DataFrame, encoding='label', min_token_freq=MIN_TOKEN_FREQ,
+                    text_encoding='label', text_features=N_TEXT_FEATURES, dtypes='compact') -> pd.DataFrame:
+    """
+    Encode every feature column and save the encoders: label codes for the
+    categoricals, sparse multi-hot blocks for encoding='sparse' and hashed
+    term vectors for text_encoding='hashed'. With dtypes='compact' label
+    codes come from the categories in the smallest unsigned width (the
+    same codes LabelEncoder assigns), and the other numeric columns are
+    downcast, floats to float32.
+    """
+    multi_hot_cols = [c for c in MULTI_HOT_COLS if c in merged.columns] if encoding == 'sparse' else []
+    text_cols = [c for c in TEXT_COLS if c in merged.columns] if text_encoding == 'hashed' else []
 
-    # 4) Encode categorical features except 'study_status' and 'enrollment'
+    # 1) Encode categorical features except 'study_status' and 'enrollment'
     label_encoders = {}
-    categorical_cols = [c for c in merged.select_dtypes(include=["object", "category"]).columns if c not in ["study_status", "enrollment"]]
+    categorical_cols = [c for c in merged.select_dtypes(include=["object", "string", "category"]).columns
+                        if c not in ["study_status", "enrollment"] + multi_hot_cols + text_cols]
     for col in categorical_cols:
         le = LabelEncoder()
-        merged[col] = le.fit_transform(merged[col].astype(str))
+        if dtypes == 'compact':
+            merged[col], le.classes_ = category_codes(merged[col])
+        else:
+            merged[col] = le.fit_transform(merged[col].astype(str))
         label_encoders[col] = le
 
-    # 5) Save label encoders
-    os.makedirs("data/processed", exist_ok=True)
-    with open("data/processed/label_encoders.pkl", "wb") as f:
+    # 2) Multi-hot encode multi-valued fields as sparse columns
+    multi_hot_encoders = {}
+    for col in multi_hot_cols:
+        encoder = MultiHotEncoder(col, min_freq=min_token_freq)
+        block = sparse_frame(
+            encoder.fit_transform(merged[col]).astype(np.float32),
+            index=merged.index, columns=encoder.feature_names()
+        )
+        merged = pd.concat([merged.drop(columns=[col]), block], axis=1)
+        multi_hot_encoders[col] = encoder
+        print(f"Multi-hot encoded {col}: {len(encoder.vocabulary)} tokens in at least {min_token_freq} trials")
+
+    # 3) Hash free text into fixed-size sparse term vectors
+    text_hashers = {}
+    for col in text_cols:
+        hasher = TextHasher(col, n_features=text_features)
+        block = sparse_frame(
+            hasher.transform(merged[col]), index=merged.index, columns=hasher.feature_names()
+        )
+        merged = pd.concat([merged.drop(columns=[col]), block], axis=1)
+        text_hashers[col] = hasher
+        print(f"Hashed {col} into {text_features} columns")
+
+    if dtypes == 'compact':
+        merged = compact_numeric(merged, exclude=['study_status'])
+
+    # 4) Save label encoders and the feature spec the API rebuilds features from
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    with open(LABEL_ENCODERS_PATH, "wb") as f:
         pickle.dump(label_encoders, f)
+    feature_spec = {
+        "encoding": encoding,
+        "multi_hot": {col: encoder.to_dict() for col, encoder in multi_hot_encoders.items()},
+        "text_hashing": {col: hasher.to_dict() for col, hasher in text_hashers.items()},
+    }
+    with open(FEATURE_SPEC_PATH, "w") as f:
+        json.dump(feature_spec, f, indent=2)
+
+    return merged
+
+def preprocess_data(merged: pd.DataFrame, imputation='neighbors', aggregate_features=False,
+                    encoding='label', min_token_freq=MIN_TOKEN_FREQ,
+                    text_encoding='label', text_features=N_TEXT_FEATURES, dtypes='compact',
+                    partitions=0, workers=1) -> pd.DataFrame:
+    """
+    Keep only relevant columns, handle missing values, encode categorical features.
+    `imputation` is the enrollment strategy passed to impute_enrollment;
+    `aggregate_features` keeps the per-trial source aggregates as features.
+    With encoding='label' every intervention and condition gets its own row
+    and a label code; with encoding='sparse' trials keep one row and those
+    fields become sparse multi-hot columns for tokens in at least
+    `min_token_freq` trials. text_encoding='hashed' turns criteria and
+    study_title into `text_features` sparse hashed columns each instead of
+    label codes. `dtypes` is the dtype policy (see dtype_policy.py); the
+    frame's memory is printed after every step.
+    With `partitions` > 1 the row-local text stages (design parsing,
+    criteria cleanup, splitting) run on that many nct_id partitions across
+    `workers` processes; imputation and encoder fitting see every trial
+    and stay in this process.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding: {encoding}")
+    if text_encoding not in TEXT_ENCODINGS:
+        raise ValueError(f"Unknown text encoding: {text_encoding}")
+    if dtypes not in DTYPE_POLICIES:
+        raise ValueError(f"Unknown dtype policy: {dtypes}")
+    print(f"Memory ({dtypes} dtypes): merged {frame_memory_mb(merged):.1f} MB")
+
+    # 1) Keep only relevant columns
+    keys = merged['nct_id'] if partitions > 1 and 'nct_id' in merged.columns else None
+    merged = select_columns(merged, aggregate_features)
 
+    # 2) Impute enrollment values
+    merged = impute_enrollment(merged, strategy=imputation)
+    print(f"Memory ({dtypes} dtypes): imputed {frame_memory_mb(merged):.1f} MB")
+
+    # 3) Fill missing values for other columns and split multi-valued ones
+    if keys is not None:
+        merged = expand_partitioned(merged, keys, encoding, dtypes=dtypes, partitions=partitions, workers=workers)
+    else:
+        merged = expand_columns(merged, encoding, dtypes=dtypes)
+    print(f"Memory ({dtypes} dtypes): expanded {frame_memory_mb(merged):.1f} MB, {len(merged)} rows")
+
+    # 4) Encode features and save the encoders
+    merged = encode_features(merged, encoding=encoding, min_token_freq=min_token_freq,
+                             text_encoding=text_encoding, text_features=text_features, dtypes=dtypes)
+    print(f"Memory ({dtypes} dtypes): encoded {frame_memory_mb(merged):.1f} MB")
     return merged
 
 def split_data(merged: pd.DataFrame):
@@ -322,44 +825,136 @@ def split_data(merged: pd.DataFrame):
     # No SMOTE applied here
     return X_train, X_test, y_train, y_test
 
-def save_processed_data(X_train, X_test, y_train, y_test):
-    """Save all processed datasets."""
-    os.makedirs('data/processed', exist_ok=True)
-    X_train.to_csv('data/processed/X_train.csv', index=False)
-    X_test.to_csv('data/processed/X_test.csv', index=False)
-    y_train.to_csv('data/processed/y_train.csv', index=False)
-    y_test.to_csv('data/processed/y_test.csv', index=False)
+def save_processed_data(X_train, X_test, y_train, y_test, cache_key=None):
+    """Save all processed datasets.
+    Each split is written as CSV and as Feather; training memory-maps the
+    Feather copies. Splits with sparse multi-hot columns are only written as
+    Feather, with the sparse columns in a CSR sidecar, since a dense CSV
+    would defeat them. `cache_key` marks which cached splits the files hold.
+    """
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    splits = {'X_train': X_train, 'X_test': X_test, 'y_train': y_train, 'y_test': y_test}
     print("\nSuccessfully saved all processed datasets:")
-    print("- data/processed/X_train.csv")
-    print("- data/processed/X_test.csv")
-    print("- data/processed/y_train.csv")
-    print("- data/processed/y_test.csv")
+    for name, split in splits.items():
+        split = split.to_frame() if isinstance(split, pd.Series) else split
+        csv_path = os.path.join(PROCESSED_DIR, f"{name}.csv")
+        write_frame(os.path.join(PROCESSED_DIR, f"{name}.feather"), split)
+        if any(isinstance(dtype, pd.SparseDtype) for dtype in split.dtypes):
+            if os.path.exists(csv_path):
+                os.remove(csv_path)
+            print(f"- {PROCESSED_DIR}/{name}.feather (sparse)")
+        else:
+            split.to_csv(csv_path, index=False)
+            print(f"- {csv_path} (+ .feather)")
+    with open(PROCESSED_KEY_FILE, 'w') as f:
+        f.write(cache_key or '')
 
-def main():
+def restore_cached_splits(cache, key):
+    """
+    Serve the splits from the cache when nothing changed since they were made.
+    Returns False on a cache miss.
+    """
+    processed_files = [os.path.join(PROCESSED_DIR, f"{name}.feather")
+                       for name in ('X_train', 'X_test', 'y_train', 'y_test')]
+    if os.path.exists(PROCESSED_KEY_FILE) and all(
+        os.path.exists(p) for p in processed_files + [LABEL_ENCODERS_PATH, FEATURE_SPEC_PATH]
+    ):
+        with open(PROCESSED_KEY_FILE) as f:
+            if f.read().strip() == key:
+                print(f"Processed data in {PROCESSED_DIR} is up to date")
+                return True
+
+    frames = cache.load_frames('splits', key)
+    if frames is None:
+        return False
+    print("Restoring processed data from cache")
+    cache.restore_files('splits', key, PROCESSED_DIR)
+    save_processed_data(frames['X_train'], frames['X_test'],
+                        frames['y_train'].iloc[:, 0], frames['y_test'].iloc[:, 0], cache_key=key)
+    return True
+
+def main(workers=1, use_cache=True, cache_dir=CACHE_DIR, imputation='neighbors', aggregate_features=False,
+         encoding='label', min_token_freq=MIN_TOKEN_FREQ, text_encoding='label', text_features=N_TEXT_FEATURES,
+         dtypes='compact', partitions=0):
     """Main data processing entry point."""
     try:
-        # 1) Load data
-        datasets = load_data()
-        if not datasets:
-            raise ValueError("No data loaded from any file.")
+        cache = PipelineCache(cache_dir) if use_cache else None
+        params = {'imputation': imputation, 'aggregate_features': aggregate_features,
+                  'encoding': encoding, 'min_token_freq': min_token_freq,
+                  'text_encoding': text_encoding, 'text_features': text_features, 'dtypes': dtypes}
+        keys = pipeline_cache_keys(cache, params=params) if cache else None
+
+        # 0) Nothing to do if the inputs and code match cached splits
+        if cache and restore_cached_splits(cache, keys['splits']):
+            return
 
-        # 2) Merge
-        merged = merge_datasets(datasets)
-        if merged is None or merged.empty:
-            raise ValueError("Merging resulted in no data.")
+        # 1) Load data
+        cached = cache.load_frames('merged', keys['merged']) if cache else None
+        if cached is not None:
+            merged = cached['merged']
+            print(f"Loaded merged dataset with {len(merged)} records (cached)")
+        else:
+            datasets = load_data(workers=workers, cache=cache,
+                                 cache_keys=keys['datasets'] if keys else None)
+            if not datasets:
+                raise ValueError("No data loaded from any file.")
+
+            # 2) Merge
+            merged = merge_datasets(datasets)
+            if merged is None or merged.empty:
+                raise ValueError("Merging resulted in no data.")
+            if cache:
+                cache.save_frames('merged', keys['merged'], {'merged': merged})
 
         # 3) Preprocess
-        merged = preprocess_data(merged)
+        merged = preprocess_data(merged, imputation=imputation, aggregate_features=aggregate_features,
+                                 encoding=encoding, min_token_freq=min_token_freq,
+                                 text_encoding=text_encoding, text_features=text_features, dtypes=dtypes,
+                                 partitions=partitions, workers=workers or os.cpu_count())
 
         # 4) Split
         X_train, X_test, y_train, y_test = split_data(merged)
 
         # 5) Save
-        save_processed_data(X_train, X_test, y_train, y_test)
+        save_processed_data(X_train, X_test, y_train, y_test,
+                            cache_key=keys['splits'] if keys else None)
+        if cache:
+            cache.save_frames('splits', keys['splits'],
+                              {'X_train': X_train, 'X_test': X_test,
+                               'y_train': y_train.to_frame(), 'y_test': y_test.to_frame()},
+                              files=[LABEL_ENCODERS_PATH, FEATURE_SPEC_PATH])
 
     except Exception as e:
         print(f"Error: {str(e)}")
         raise
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Clinical trial data processing pipeline")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes used to load raw files and preprocess partitions (0 = all cores, 1 = sequential)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="parse everything from the raw files and do not write the cache")
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help="directory for cached datasets, merged data and splits")
+    parser.add_argument('--imputation', choices=IMPUTATION_STRATEGIES, default='neighbors',
+                        help="enrollment imputation: nearby rows or study design group medians")
+    parser.add_argument('--aggregate-features', action='store_true',
+                        help="train on per-trial facility, event and withdrawal aggregates too")
+    parser.add_argument('--encoding', choices=ENCODINGS, default='label',
+                        help="intervention/condition encoding: exploded label codes or sparse multi-hot")
+    parser.add_argument('--min-token-freq', type=int, default=MIN_TOKEN_FREQ,
+                        help="trials a token must appear in to get its own multi-hot column")
+    parser.add_argument('--text-encoding', choices=TEXT_ENCODINGS, default='label',
+                        help="criteria/study_title encoding: label codes or hashed term vectors")
+    parser.add_argument('--text-features', type=int, default=N_TEXT_FEATURES,
+                        help="hashed columns per text field")
+    parser.add_argument('--dtypes', choices=DTYPE_POLICIES, default='compact',
+                        help="compact: categorical strings, smallest integer codes, float32; wide: previous dtypes")
+    parser.add_argument('--partitions', type=int, default=0,
+                        help="preprocess the trials in this many nct_id hash partitions (0 = one frame)")
+    args = parser.parse_args()
+    main(workers=args.workers or None, use_cache=not args.no_cache, cache_dir=args.cache_dir,
+         imputation=args.imputation, aggregate_features=args.aggregate_features,
+         encoding=args.encoding, min_token_freq=args.min_token_freq,
+         text_encoding=args.text_encoding, text_features=args.text_features, dtypes=args.dtypes,
+         partitions=args.partitions)
@@ -0,0 +1,87 @@
+from typing import Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+# compact: categorical strings, smallest integer codes and float32 features;
+# wide: object strings, int64 codes and float64, as the pipeline used to produce
+DTYPE_POLICIES = ('compact', 'wide')
+CODE_DTYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+def smallest_code_dtype(n_classes: int) -> np.dtype:
+    """Smallest unsigned type holding codes 0..n_classes, so the unknown code len(classes) fits too"""
+    for dtype in CODE_DTYPES:
+        if n_classes <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError(f"Too many classes: {n_classes}")
+
+def to_categorical(df: pd.DataFrame, columns: Iterable[str]) -> pd.DataFrame:
+    """Store string columns as pandas categoricals: one copy of each distinct value plus a code per row"""
+    for col in columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+def category_codes(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Codes and classes of a column, identical to LabelEncoder.fit_transform on
+    its string values. The codes come from the column's categories: only the
+    distinct values are sorted, instead of np.unique sorting every row.
+    """
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype('category')
+    values = values.cat.remove_unused_categories()
+    categories = values.cat.categories
+    if not all(isinstance(value, str) for value in categories):
+        values = values.cat.rename_categories([str(value) for value in categories])
+    classes = np.asarray(sorted(values.cat.categories), dtype=object)
+    codes = values.cat.set_categories(classes).cat.codes.to_numpy()
+    return codes.astype(smallest_code_dtype(len(classes))), classes
+
+def compact_numeric(df: pd.DataFrame, exclude: Iterable[str] = ()) -> pd.DataFrame:
+    """Downcast dense integer columns to their smallest width and float64 columns to float32"""
+    exclude = set(exclude)
+    for col in df.columns:
+        dtype = df[col].dtype
+        if col in exclude or isinstance(dtype, (pd.SparseDtype, pd.CategoricalDtype)):
+            continue
+        if pd.api.types.is_integer_dtype(dtype):
+            downcast = 'unsigned' if len(df) == 0 or df[col].min() >= 0 else 'integer'
+            df[col] = pd.to_numeric(df[col], downcast=downcast)
+        elif pd.api.types.is_float_dtype(dtype) and dtype != np.float32:
+            df[col] = df[col].astype(np.float32)
+    return df
+
+def frame_memory_mb(df: pd.DataFrame) -> float:
+    """Memory held by a frame, counting the Python strings of object columns"""
+    return float(df.memory_usage(index=True, deep=True).sum()) / 2**20
+
+def as_float32_frame(X: pd.DataFrame) -> pd.DataFrame:
+    """
+    Dense features as one float32 block. scikit-learn trains on it without
+    another conversion or copy (it reads the block as a column-major array,
+    one contiguous run per feature) and still records the column names.
+    The block is filled a column at a time and wrapped as it is, since
+    X.to_numpy and the DataFrame constructor would each copy the whole frame.
+    """
+    block = np.empty(X.shape, dtype=np.float32, order='F')
+    for i in range(X.shape[1]):
+        block[:, i] = X.iloc[:, i].to_numpy(dtype=np.float32, na_value=np.nan)
+    return pd.DataFrame(block, index=X.index, columns=X.columns, copy=False)
+
+def sparse_frame(matrix, index=None, columns=None) -> pd.DataFrame:
+    """
+    Sparse columns of a scipy matrix, with 0 as the fill value. Under pandas 3
+    DataFrame.sparse.from_spmatrix fills float columns with NaN, so every
+    absent entry would read back as missing; the columns keep its arrays and
+    only their fill value changes.
+    """
+    frame = pd.DataFrame.sparse.from_spmatrix(matrix, index=index, columns=columns)
+    dtype = pd.SparseDtype(matrix.dtype, 0)
+    if all(frame_dtype == dtype for frame_dtype in frame.dtypes):
+        return frame
+    arrays = {
+        col: pd.arrays.SparseArray(array.sp_values, sparse_index=array.sp_index, dtype=dtype)
+        for col, array in ((col, frame[col].array) for col in frame.columns)
+    }
+    return pd.DataFrame(arrays, index=frame.index, columns=frame.columns)
@@ -0,0 +1,181 @@
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+
+# Arrays written by export_forest, one .npy file each
+ARRAY_NAMES = ['feature', 'threshold', 'left', 'right', 'missing_left', 'leaf_proba', 'roots']
+META_FILE = 'meta.json'
+# Rows evaluated together; bounds the (rows x trees) working arrays
+PREDICT_CHUNK_ROWS = 4096
+
+def source_fingerprint(path: str) -> str:
+    """Size and mtime of the pickled model a compiled forest was exported from"""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def _leaf_probabilities(tree, n_classes: int) -> np.ndarray:
+    """Per-node class probabilities exactly as DecisionTreeClassifier.predict_proba computes them"""
+    value = tree.value[:, 0, :n_classes]
+    totals = value.sum(axis=1)
+    if np.allclose(totals, 1.0):
+        # scikit-learn >= 1.4 stores class fractions and returns them as-is
+        return np.array(value, dtype=np.float64)
+    # Older releases store weighted counts and normalise at predict time
+    normalizer = totals[:, np.newaxis].copy()
+    normalizer[normalizer == 0.0] = 1.0
+    return value / normalizer
+
+def export_forest(model, out_dir: str, source_path: str | None = None):
+    """
+    Write a fitted RandomForestClassifier as flat arrays that can be memory-mapped.
+    All trees are concatenated into one node table; leaves point to themselves
+    with an infinite threshold so every row can take the same number of steps.
+    """
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError("Only single-output forests can be compiled")
+
+    n_classes = len(model.classes_)
+    feature, threshold, left, right, missing_left, leaf_proba, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        node_ids = np.arange(tree.node_count, dtype=np.int64)
+        is_leaf = tree.children_left == -1
+
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+        left.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        right.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+        if hasattr(tree, 'missing_go_to_left'):
+            missing_left.append(np.asarray(tree.missing_go_to_left, dtype=bool) & ~is_leaf)
+        else:
+            missing_left.append(np.zeros(tree.node_count, dtype=bool))
+        leaf_proba.append(_leaf_probabilities(tree, n_classes))
+        roots.append(offset)
+
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': np.concatenate(threshold).astype(np.float64),
+        'left': np.concatenate(left).astype(np.int32),
+        'right': np.concatenate(right).astype(np.int32),
+        'missing_left': np.concatenate(missing_left),
+        'leaf_proba': np.ascontiguousarray(np.concatenate(leaf_proba)),
+        'roots': np.asarray(roots, dtype=np.int32),
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name in ARRAY_NAMES:
+        np.save(os.path.join(out_dir, f"{name}.npy"), arrays[name])
+
+    feature_names = getattr(model, 'feature_names_in_', None)
+    meta = {
+        'n_trees': len(model.estimators_),
+        'n_nodes': int(offset),
+        'max_depth': int(max_depth),
+        'n_features': int(model.n_features_in_),
+        'feature_names': list(map(str, feature_names)) if feature_names is not None else None,
+        'classes': model.classes_.tolist(),
+        'source_fingerprint': source_fingerprint(source_path) if source_path else None,
+    }
+    with open(os.path.join(out_dir, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+    print(f"Compiled {meta['n_trees']} trees ({meta['n_nodes']} nodes) to {out_dir}")
+
+class CompiledForest:
+    """
+    Vectorized inference over a forest exported by export_forest.
+    Every tree is walked for a whole batch of rows at once, and the per-tree
+    probabilities are summed in estimator order, so predict_proba is
+    bit-identical to RandomForestClassifier.predict_proba with n_jobs=1.
+    Arrays are memory-mapped by default, so worker processes share the pages.
+    """
+
+    def __init__(self, arrays, meta):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.missing_left = arrays['missing_left']
+        self.leaf_proba = arrays['leaf_proba']
+        self.roots = arrays['roots']
+        self.meta = meta
+        self.classes_ = np.asarray(meta['classes'], dtype=object)
+        self.feature_names_in_ = meta['feature_names']
+        self.n_features_in_ = meta['n_features']
+
+    @classmethod
+    def load(cls, model_dir: str, mmap: bool = True) -> "CompiledForest":
+        with open(os.path.join(model_dir, META_FILE)) as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        arrays = {
+            name: np.load(os.path.join(model_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAY_NAMES
+        }
+        return cls(arrays, meta)
+
+    def is_compiled_from(self, source_path: str) -> bool:
+        """Whether this forest was exported from the current version of source_path"""
+        try:
+            return self.meta.get('source_fingerprint') == source_fingerprint(source_path)
+        except OSError:
+            return False
+
+    def _as_matrix(self, X) -> np.ndarray:
+        if hasattr(X, 'columns') and self.feature_names_in_ is not None:
+            X = X[self.feature_names_in_]
+        # Trees compare float32 inputs against float64 thresholds, as in scikit-learn
+        return np.asarray(X, dtype=np.float32)
+
+    def apply(self, X) -> np.ndarray:
+        """Global leaf node index of every row in every tree, shape (rows, trees)"""
+        X = self._as_matrix(X)
+        n_rows, n_trees = X.shape[0], len(self.roots)
+        flat_X = X.ravel()
+        # Tree-major order keeps each tree's nodes together in the gathers below
+        nodes = np.repeat(self.roots, n_rows)
+        row_offsets = np.tile(np.arange(n_rows, dtype=np.int64) * X.shape[1], n_trees)
+        # Walk all (tree, row) pairs one level per step, dropping pairs that reached a leaf
+        active = np.arange(len(nodes))
+        for _ in range(self.meta['max_depth']):
+            current = nodes[active]
+            internal = self.left.take(current) != current
+            active, current = active[internal], current[internal]
+            if not len(active):
+                break
+            values = flat_X.take(row_offsets.take(active) + self.feature.take(current))
+            go_left = (values <= self.threshold.take(current)) | (
+                np.isnan(values) & self.missing_left.take(current)
+            )
+            nodes[active] = np.where(go_left, self.left.take(current), self.right.take(current))
+        return nodes.reshape(n_trees, n_rows).T
+
+    def predict_proba(self, X) -> np.ndarray:
+        X = np.ascontiguousarray(self._as_matrix(X))
+        proba = np.zeros((len(X), len(self.classes_)), dtype=np.float64)
+        for start in range(0, len(X), PREDICT_CHUNK_ROWS):
+            stop = start + PREDICT_CHUNK_ROWS
+            leaves = self.apply(X[start:stop])
+            out = proba[start:stop]
+            for t in range(leaves.shape[1]):
+                out += self.leaf_proba[leaves[:, t]]
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+if __name__ == "__main__":
+    # Usage: python src/forest_compiler.py [model.pkl] [output_dir]
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'models/random_forest_model.pkl'
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else 'models/random_forest_compiled'
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    export_forest(model, out_dir, source_path=model_path)
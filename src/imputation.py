@@ -0,0 +1,72 @@
+import numba
+import numpy as np
+import pandas as pd
+
+# Neighbour window of the original imputation loop: df.loc[idx - 3:idx + 4]
+# is label-inclusive, so it spans 3 rows before and 4 rows after each gap
+WINDOW_BEFORE = 3
+WINDOW_AFTER = 4
+
+# Supported strategies:
+#   neighbors  median of the known values in the window around each row,
+#              filling rows in order so earlier imputations feed later ones
+#   group      median of the known values in the row's group, falling back
+#              to coarser groups (dropping the last column) when it has none
+IMPUTATION_STRATEGIES = ('neighbors', 'group')
+DEFAULT_GROUP_COLS = ['Primary_Purpose', 'Allocation']
+
+@numba.njit(cache=True)
+def _sequential_median_fill(values: np.ndarray, before: int, after: int) -> np.ndarray:
+    """One in-order pass over every row; the window is kept sorted by insertion"""
+    imputed = values.copy()
+    n = len(values)
+    window = np.empty(before + after + 1)
+    for row in range(n):
+        if not np.isnan(values[row]):
+            continue
+        count = 0
+        for position in range(max(row - before, 0), min(row + after + 1, n)):
+            value = imputed[position]
+            if np.isnan(value):
+                continue
+            i = count
+            while i > 0 and window[i - 1] > value:
+                window[i] = window[i - 1]
+                i -= 1
+            window[i] = value
+            count += 1
+        if count:
+            imputed[row] = (window[(count - 1) // 2] + window[count // 2]) / 2
+    return imputed
+
+def neighbor_median(values, before=WINDOW_BEFORE, after=WINDOW_AFTER) -> np.ndarray:
+    """
+    Fill NaNs with the median of the known values from `before` rows behind
+    to `after` rows ahead, by position. Gaps are filled in order, so a gap
+    sees the imputed values behind it, as the original loop did. That makes
+    every gap depend on the ones before it: a run of NaNs settles on one
+    value and can carry it past single known values to the end of the data,
+    so the fill is one compiled pass rather than numpy passes over the gaps.
+    Rows whose window never holds a known value are left as NaN.
+    """
+    original = np.asarray(values, dtype=np.float64)
+    if not np.isnan(original).any():
+        return original.copy()
+    return _sequential_median_fill(original, before, after)
+
+def group_median(values, groups: pd.DataFrame) -> np.ndarray:
+    """
+    Fill NaNs with the median of the known values in the same group of
+    `groups` columns. Groups without known values fall back to the median of
+    the coarser grouping that drops the last column.
+    """
+    values = pd.Series(np.asarray(values, dtype=np.float64))
+    imputed = values.copy()
+    for depth in range(groups.shape[1], 0, -1):
+        missing = imputed.isna()
+        if not missing.any():
+            break
+        keys = [groups.iloc[:, i].reset_index(drop=True) for i in range(depth)]
+        medians = values.groupby(keys, dropna=False, observed=True).transform('median')
+        imputed[missing] = medians[missing]
+    return imputed.to_numpy()
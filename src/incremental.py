@@ -0,0 +1,347 @@
+import argparse
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from data_processing import (AGGREGATE_FEATURES, FEATURE_SPEC_PATH, LABEL_ENCODERS_PATH, PROCESSED_DIR,
+                             RELEVANT_COLS, impute_enrollment, load_data, merge_datasets,
+                             preprocess_columns, save_processed_data)
+from dtype_policy import sparse_frame
+from forest_compiler import export_forest
+from imputation import IMPUTATION_STRATEGIES
+from model_registry import CANARY_ROWS, ModelRegistry
+from model_training import (COMPILED_MODEL_DIR, MODEL_SAVE_PATH, X_TEST_PATH, X_TRAIN_PATH,
+                            Y_TEST_PATH, Y_TRAIN_PATH, as_model_input, read_split)
+from multi_hot import NAME_SEPARATOR as MULTI_HOT_SEPARATOR, MultiHotEncoder
+from text_features import NAME_SEPARATOR as TEXT_SEPARATOR, TEXT_COLS, TextHasher
+
+# Raw files of newly arrived trials, laid out like data/raw
+INCOMING_DIR = os.path.join("data", "incoming")
+# nct_ids already appended by incremental runs, one per line
+APPENDED_IDS_PATH = os.path.join(PROCESSED_DIR, "incremental_ids.txt")
+REPORT_PATH = os.path.join("models", "incremental_report.json")
+# add: grow the forest by new trees; window: replace the oldest trees
+UPDATE_MODES = ('add', 'window')
+PSI_BINS = 10
+# Most frequent reference classes of a label-encoded column compared one by
+# one; the rest are pooled, since PSI over thousands of small classes only
+# measures how few of them a small batch can contain
+CATEGORY_BUCKETS = 10
+# A feature drifting above this PSI, or held-out accuracy falling by more
+# than this, means the model should be retrained from scratch
+PSI_RETRAIN = 0.25
+ACCURACY_DROP_RETRAIN = 0.05
+
+def extend_label_encoder(encoder, appended, values: pd.Series):
+    """
+    Encode `values` with a fitted LabelEncoder plus `appended`, the classes
+    added to it by earlier runs in code order. Unseen values are added to
+    the end of `appended`, so every existing code keeps its number. The
+    encoder itself is left as fitted: LabelEncoder.transform needs
+    `classes_` sorted, and sorting new classes in would renumber the codes
+    the model was trained on.
+    Returns (codes, number of classes added).
+    """
+    codes = {value: code for code, value in enumerate(encoder.classes_)}
+    codes.update({value: len(encoder.classes_) + i for i, value in enumerate(appended)})
+    added = [value for value in pd.unique(values) if value not in codes]
+    if added:
+        codes.update({value: len(codes) + i for i, value in enumerate(added)})
+        appended.extend(added)
+    return values.map(codes).to_numpy(dtype=np.int64), len(added)
+
+def encode_records(merged, label_encoders, feature_spec, columns, imputation='neighbors',
+                   enrollment_fill=None):
+    """
+    Preprocess newly merged records into the stored feature `columns` the way
+    preprocess_data does, but with the stored encoders: label classes are
+    extended through feature_spec['appended_classes'], multi-hot vocabularies
+    and text hashing are reused as they are.
+    Enrollment the batch cannot impute gets `enrollment_fill` (the stored
+    median), not the median of a small batch.
+    Returns (frame with 'study_status' and `columns`, classes added per column).
+    """
+    relevant_cols = RELEVANT_COLS + [name for name in AGGREGATE_FEATURES if name in columns]
+    for name in AGGREGATE_FEATURES:
+        if name in relevant_cols and name not in merged.columns:
+            merged[name] = 0
+    merged = merged.reindex(columns=relevant_cols, fill_value="Unknown")
+    merged = impute_enrollment(merged, strategy=imputation, fill_value=enrollment_fill)
+    for col in merged.columns:
+        if col != 'enrollment':
+            merged[col] = merged[col].fillna("Unknown")
+
+    multi_hot = {col: MultiHotEncoder.from_dict(spec) for col, spec in feature_spec.get("multi_hot", {}).items()}
+    hashers = {col: TextHasher.from_dict(spec) for col, spec in feature_spec.get("text_hashing", {}).items()}
+    merged = preprocess_columns(merged, expand=not multi_hot)
+
+    added = {}
+    appended = feature_spec.setdefault("appended_classes", {})
+    for col, encoder in label_encoders.items():
+        if col in merged.columns:
+            merged[col], added[col] = extend_label_encoder(encoder, appended.setdefault(col, []),
+                                                           merged[col].astype(str))
+
+    blocks = [merged.drop(columns=list(multi_hot) + list(hashers))]
+    for col, encoder in list(multi_hot.items()) + list(hashers.items()):
+        matrix = encoder.transform(merged[col]).astype(np.float32)
+        blocks.append(sparse_frame(matrix, index=merged.index, columns=encoder.feature_names()))
+    merged = pd.concat(blocks, axis=1)
+    return merged[['study_status'] + list(columns)], added
+
+def _psi(expected, actual):
+    expected = np.clip(expected, 1e-6, None)
+    actual = np.clip(actual, 1e-6, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+def population_stability(reference, current, bins=PSI_BINS):
+    """Population stability index of `current` against `reference`, on quantile bins of the reference"""
+    reference = np.asarray(reference, dtype=np.float64)
+    current = np.asarray(current, dtype=np.float64)
+    edges = np.unique(np.quantile(reference, np.linspace(0, 1, bins + 1)[1:-1]))
+    expected = np.bincount(np.searchsorted(edges, reference, side='right'), minlength=len(edges) + 1)
+    actual = np.bincount(np.searchsorted(edges, current, side='right'), minlength=len(edges) + 1)
+    return _psi(expected / len(reference), actual / len(current))
+
+def category_stability(reference, current, n_known, buckets=CATEGORY_BUCKETS):
+    """
+    PSI between the class shares of a label-encoded column. The `buckets`
+    most frequent reference classes are compared one by one, the other known
+    classes are pooled, and codes from `n_known` on (classes the model has
+    not seen) form an unseen bucket. The unseen bucket's reference share is
+    the Good-Turing estimate of drawing a class not seen before: the share
+    of reference rows whose class occurs once.
+    Returns (psi, share of `current` rows in an unseen class).
+    """
+    reference = np.asarray(reference, dtype=np.int64)
+    current = np.asarray(current, dtype=np.int64)
+    counts = np.bincount(reference, minlength=n_known)[:n_known]
+    unseen_rate = float(np.mean(current >= n_known)) if len(current) else 0.0
+    top = np.argsort(-counts, kind='stable')[:buckets]
+    # Bucket per code: its top position, else 'other known', else 'unseen'
+    bucket_of = np.full(n_known, len(top), dtype=np.int64)
+    bucket_of[top] = np.arange(len(top))
+    other, unseen = len(top), len(top) + 1
+    expected = np.bincount(bucket_of[reference], minlength=unseen + 1) / len(reference)
+    novelty = np.count_nonzero(counts == 1) / len(reference)
+    expected = expected * (1 - novelty)
+    expected[unseen] = novelty
+    current_buckets = np.where(current < n_known, bucket_of[np.minimum(current, n_known - 1)], unseen)
+    actual = np.bincount(current_buckets, minlength=unseen + 1) / max(len(current), 1)
+    return _psi(expected, actual), unseen_rate
+
+def token_stability(reference, current):
+    """PSI between the token (column) shares of two sparse blocks of one field"""
+    expected = np.asarray(reference.sparse.to_coo().sum(axis=0)).ravel()
+    actual = np.asarray(current.sparse.to_coo().sum(axis=0)).ravel()
+    return _psi(expected / max(expected.sum(), 1), actual / max(actual.sum(), 1))
+
+def drift_report(X_reference, X_new, feature_spec, known_classes):
+    """
+    Drift of the new rows against the reference rows.
+    Numeric features get binned PSI and multi-hot or hashed fields PSI over
+    their token shares. Label-encoded features, `known_classes` giving the
+    number of classes each had before the new rows were encoded, get PSI
+    over class shares and their unseen-class rate. Label-encoded free text
+    is unique to almost every trial, so it only gets the unseen rate.
+    Returns (PSI per feature or field largest first, unseen rate per label-encoded feature).
+    """
+    fields = {}
+    for col, separator in [(c, MULTI_HOT_SEPARATOR) for c in feature_spec.get("multi_hot", {})] + \
+                          [(c, TEXT_SEPARATOR) for c in feature_spec.get("text_hashing", {})]:
+        fields[col] = [name for name in X_reference.columns if name.startswith(f"{col}{separator}")]
+    sparse_columns = {name for names in fields.values() for name in names}
+
+    drift, unseen = {}, {}
+    for col in X_reference.columns:
+        if col in sparse_columns:
+            continue
+        if col in known_classes:
+            psi, unseen[col] = category_stability(X_reference[col], X_new[col], known_classes[col])
+            if col not in TEXT_COLS:
+                drift[col] = psi
+        else:
+            drift[col] = population_stability(X_reference[col], X_new[col])
+    drift.update({col: token_stability(X_reference[names], X_new[names]) for col, names in fields.items()})
+    return dict(sorted(drift.items(), key=lambda item: -item[1])), unseen
+
+def update_forest(model, X, y, mode='add', n_trees=50):
+    """
+    Fit `n_trees` new trees on (X, y) with warm_start. mode='add' keeps
+    every existing tree; mode='window' then drops the oldest `n_trees`, so
+    the forest keeps its size and forgets the oldest data first.
+    """
+    missing = set(model.classes_) - set(np.unique(y))
+    if missing:
+        raise ValueError(f"Update data has no rows of class {sorted(missing)}; add replay rows or wait for more trials")
+    n_existing = len(model.estimators_)
+    model.set_params(warm_start=True, n_estimators=n_existing + n_trees)
+    model.fit(X, y)
+    if mode == 'window':
+        model.estimators_ = model.estimators_[n_trees:]
+        model.set_params(n_estimators=len(model.estimators_))
+    model.set_params(warm_start=False)
+    return model
+
+def split_trials(new, holdout, random_state=42):
+    """Split encoded rows into (update, held-out) by trial, so exploded rows of a trial stay together"""
+    trials = new.groupby(level=0)['study_status'].first()
+    if holdout <= 0 or len(trials) < 2:
+        return new, new.iloc[:0]
+    stratify = trials if trials.value_counts().min() >= 2 else None
+    fit_ids, holdout_ids = train_test_split(trials.index, test_size=holdout,
+                                            random_state=random_state, stratify=stratify)
+    return new.loc[new.index.isin(fit_ids)], new.loc[new.index.isin(holdout_ids)]
+
+def accuracy(model, X, y):
+    if len(y) == 0:
+        return None
+    return float(np.mean(model.predict(as_model_input(X)) == np.asarray(y)))
+
+def main(new_dir=INCOMING_DIR, mode='add', n_trees=50, replay=1.0, holdout=0.2,
+         imputation='neighbors', random_state=42, activate=True):
+    """
+    Append newly arrived trials to the processed store and update the model.
+    1) Load and merge the raw files in `new_dir`, skipping appended trials
+    2) Encode them with the stored encoders, appending unseen label classes
+    3) Split off a held-out share by trial and measure drift
+    4) Fit new trees on the rest plus `replay` x as many stored training rows
+    5) Report accuracy before and after on the stored test set and the new
+       held-out trials, then save the store, encoders and model, and
+       register the model as a new version
+    """
+    try:
+        # 1) Newly arrived trials
+        datasets = load_data(raw_dir=new_dir)
+        if not datasets:
+            raise ValueError(f"No data loaded from {new_dir}.")
+        merged = merge_datasets(datasets)
+        appended_ids = set()
+        if os.path.exists(APPENDED_IDS_PATH):
+            with open(APPENDED_IDS_PATH) as f:
+                appended_ids = set(f.read().split())
+        merged = merged[~merged['nct_id'].isin(appended_ids)].reset_index(drop=True)
+        if merged.empty:
+            print("No new trials to append.")
+            return None
+        trial_ids = merged['nct_id'].tolist()
+
+        # 2) Stored data, encoders and model
+        X_train, X_test = read_split(X_TRAIN_PATH), read_split(X_TEST_PATH)
+        # Labels are stored row-aligned with their features, maybe as CSV without the index
+        y_train = read_split(Y_TRAIN_PATH).iloc[:, 0].set_axis(X_train.index)
+        y_test = read_split(Y_TEST_PATH).iloc[:, 0].set_axis(X_test.index)
+        with open(LABEL_ENCODERS_PATH, 'rb') as f:
+            label_encoders = pickle.load(f)
+        with open(FEATURE_SPEC_PATH) as f:
+            feature_spec = json.load(f)
+        with open(MODEL_SAVE_PATH, 'rb') as f:
+            model = pickle.load(f)
+
+        appended = feature_spec.get("appended_classes", {})
+        known_classes = {col: len(encoder.classes_) + len(appended.get(col, []))
+                         for col, encoder in label_encoders.items() if col in X_train.columns}
+        new, added = encode_records(merged, label_encoders, feature_spec, X_train.columns, imputation,
+                                    enrollment_fill=X_train['enrollment'].median())
+        # Continue the stored row numbering so appended rows keep unique labels
+        new.index = new.index + max(X_train.index.max(), X_test.index.max()) + 1
+        print(f"Encoded {len(trial_ids)} new trials into {len(new)} rows")
+        for col, count in added.items():
+            if count:
+                print(f"  {col}: {count} new classes appended to its codes")
+
+        # 3) Held-out trials and drift against the stored training data
+        fit_rows, holdout_rows = split_trials(new, holdout, random_state)
+        drift, unseen = drift_report(X_train, new[X_train.columns], feature_spec, known_classes)
+        for col, psi in list(drift.items())[:5]:
+            print(f"  drift {col}: PSI {psi:.3f}")
+        for col, rate in unseen.items():
+            if rate:
+                print(f"  unseen {col}: {rate:.1%} of new rows")
+
+        before = {"test": accuracy(model, X_test, y_test),
+                  "new_holdout": accuracy(model, holdout_rows[X_train.columns], holdout_rows['study_status'])}
+
+        # 4) New trees on the new rows plus a replay sample of stored rows
+        n_replay = min(len(X_train), int(round(replay * len(fit_rows))))
+        replay_idx = X_train.sample(n=n_replay, random_state=random_state).index
+        X_fit = pd.concat([X_train.loc[replay_idx], fit_rows[X_train.columns]])
+        y_fit = pd.concat([y_train.loc[replay_idx], fit_rows['study_status']])
+        print(f"Fitting {n_trees} trees ({mode}) on {len(fit_rows)} new and {n_replay} replayed rows")
+        model = update_forest(model, as_model_input(X_fit), y_fit.to_numpy(), mode=mode, n_trees=n_trees)
+
+        # 5) Report, then persist
+        after = {"test": accuracy(model, X_test, y_test),
+                 "new_holdout": accuracy(model, holdout_rows[X_train.columns], holdout_rows['study_status'])}
+        reasons = [f"{col} drifted (PSI {psi:.3f})" for col, psi in drift.items() if psi > PSI_RETRAIN]
+        for name in ("test", "new_holdout"):
+            if before[name] is not None and before[name] - after[name] > ACCURACY_DROP_RETRAIN:
+                reasons.append(f"{name} accuracy fell from {before[name]:.4f} to {after[name]:.4f}")
+        report = {
+            "new_trials": len(trial_ids),
+            "appended_rows": {"train": len(fit_rows), "test": len(holdout_rows)},
+            "new_classes": added,
+            "mode": mode,
+            "n_estimators": len(model.estimators_),
+            "accuracy_before": before,
+            "accuracy_after": after,
+            "drift_psi": drift,
+            "unseen_class_rate": unseen,
+            "full_retrain_recommended": bool(reasons),
+            "reasons": reasons,
+        }
+        for name in ("test", "new_holdout"):
+            if after[name] is not None:
+                print(f"Accuracy on {name}: {before[name]:.4f} -> {after[name]:.4f}")
+        print("Full retrain recommended: " + ("; ".join(reasons) if reasons else "no"))
+
+        save_processed_data(pd.concat([X_train, fit_rows[X_train.columns]]),
+                            pd.concat([X_test, holdout_rows[X_train.columns]]),
+                            pd.concat([y_train, fit_rows['study_status']]),
+                            pd.concat([y_test, holdout_rows['study_status']]))
+        # The label encoders are unchanged; appended classes live in the feature spec
+        with open(FEATURE_SPEC_PATH, 'w') as f:
+            json.dump(feature_spec, f, indent=2)
+        with open(MODEL_SAVE_PATH, 'wb') as f:
+            pickle.dump(model, f)
+        export_forest(model, COMPILED_MODEL_DIR, source_path=MODEL_SAVE_PATH)
+        report["version"] = ModelRegistry().publish(
+            model, LABEL_ENCODERS_PATH, FEATURE_SPEC_PATH,
+            metrics={"accuracy": after["test"], "new_holdout_accuracy": after["new_holdout"]},
+            training={"incremental": {key: report[key] for key in ("new_trials", "appended_rows", "mode")}},
+            canary=as_model_input(X_test.iloc[:CANARY_ROWS]), activate=activate
+        )
+        with open(APPENDED_IDS_PATH, 'a') as f:
+            f.writelines(f"{nct_id}\n" for nct_id in trial_ids)
+        with open(REPORT_PATH, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {REPORT_PATH}")
+        return report
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append newly arrived trials and update the model")
+    parser.add_argument('--new-dir', default=INCOMING_DIR,
+                        help="directory with the new raw files, named like data/raw")
+    parser.add_argument('--mode', choices=UPDATE_MODES, default='add',
+                        help="add new trees, or replace the oldest trees with them")
+    parser.add_argument('--trees', type=int, default=50,
+                        help="trees fitted on the new data")
+    parser.add_argument('--replay', type=float, default=1.0,
+                        help="stored training rows mixed in per new row")
+    parser.add_argument('--holdout', type=float, default=0.2,
+                        help="share of new trials held out for the accuracy report")
+    parser.add_argument('--imputation', choices=IMPUTATION_STRATEGIES, default='neighbors',
+                        help="enrollment imputation for the new trials")
+    parser.add_argument('--no-activate', action='store_true',
+                        help="register the updated model without making it the version the API serves")
+    args = parser.parse_args()
+    main(new_dir=args.new_dir, mode=args.mode, n_trees=args.trees, replay=args.replay,
+         holdout=args.holdout, imputation=args.imputation, activate=not args.no_activate)
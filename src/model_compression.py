@@ -0,0 +1,352 @@
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import shap
+from scipy import sparse
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, roc_auc_score
+from sklearn.model_selection import train_test_split
+from sklearn.tree._tree import Tree
+
+from data_processing import FEATURE_SPEC_PATH, LABEL_ENCODERS_PATH
+from forest_compiler import CompiledForest, export_forest
+from model_registry import ModelRegistry
+from model_training import (MODEL_SAVE_PATH, X_TEST_PATH, X_TRAIN_PATH, Y_TEST_PATH, Y_TRAIN_PATH,
+                            as_model_input, read_split)
+
+COMPRESSED_MODEL_PATH = 'models/compressed_model.pkl'
+REPORT_PATH = os.path.join('reports', 'compression_report.json')
+# Candidate forest sizes for greedy pruning and depth caps; each size is combined with each cap
+PRUNE_SIZES = (10, 25, 50, 100)
+DEPTHS = (8, 12, 16)
+# Ship the smallest candidate whose test AUC is at most this far below the original's
+AUC_TOLERANCE = 0.005
+VALIDATION_MODES = ('auto', 'oob', 'holdout')
+# Training rows scored out-of-bag when pruning
+VALIDATION_ROWS = 20000
+# Rows timed one at a time, rows in the timed batch, rows explained one at a time
+LATENCY_ROWS = 50
+BATCH_ROWS = 1000
+SHAP_ROWS = 20
+DISTILL_ROWS = 100000
+# Sklearn's markers for leaf nodes
+TREE_LEAF = -1
+TREE_UNDEFINED = -2
+
+def as_tree_input(X):
+    """The array the fitted trees of a forest expect: float32, CSR when sparse, without column names"""
+    if any(isinstance(dtype, pd.SparseDtype) for dtype in getattr(X, 'dtypes', [])):
+        return sparse.csr_matrix(X.sparse.to_coo(), dtype=np.float32)
+    return np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+
+def tree_probabilities(model, X) -> np.ndarray:
+    """Positive-class probability of every tree on every row, shape (trees, rows)"""
+    X = as_tree_input(X)
+    return np.stack([estimator.predict_proba(X)[:, 1] for estimator in model.estimators_]).astype(np.float32)
+
+def oob_masks(model, n_train: int, rows: np.ndarray):
+    """
+    Which of the training `rows` each tree did not draw, shape (trees, rows),
+    or None when the forest was not bootstrapped on an n_train-row split
+    """
+    if not model.bootstrap:
+        return None
+    # Bootstrap indices are positions in the rows the forest was fitted on
+    if getattr(model, '_n_samples', None) != n_train:
+        return None
+    samples = model.estimators_samples_
+    masks = np.empty((len(samples), len(rows)), dtype=bool)
+    for t, drawn in enumerate(samples):
+        in_bag = np.zeros(n_train, dtype=bool)
+        in_bag[drawn] = True
+        masks[t] = ~in_bag[rows]
+    return masks
+
+def greedy_prune(P: np.ndarray, y: np.ndarray, max_trees: int, masks=None):
+    """
+    Forward selection of trees: each step adds the tree whose inclusion gives
+    the lowest Brier score of the averaged probability on the validation rows.
+    With `masks` a row is only scored by the selected trees that did not
+    train on it (rows no selected tree left out get the base rate).
+    Returns the selection order and the Brier score after each step.
+    """
+    weights = np.ones_like(P) if masks is None else masks.astype(np.float32)
+    weighted = P * weights
+    prior = float(y.mean())
+    total, count = np.zeros(P.shape[1], dtype=np.float32), np.zeros(P.shape[1], dtype=np.float32)
+    remaining = np.arange(len(P))
+    order, scores = [], []
+    for _ in range(min(max_trees, len(P))):
+        num = total + weighted[remaining]
+        cnt = count + weights[remaining]
+        p = np.where(cnt > 0, num / np.maximum(cnt, 1), prior)
+        brier = ((p - y) ** 2).mean(axis=1)
+        best = int(np.argmin(brier))
+        tree = int(remaining[best])
+        order.append(tree)
+        scores.append(float(brier[best]))
+        total += weighted[tree]
+        count += weights[tree]
+        remaining = np.delete(remaining, best)
+    return order, scores
+
+def subset_forest(model, indices):
+    """The forest restricted to the trees at `indices`; the trees themselves are shared"""
+    subset = copy.copy(model)
+    subset.estimators_ = [model.estimators_[i] for i in indices]
+    subset.n_estimators = len(subset.estimators_)
+    return subset
+
+def cap_tree_depth(estimator, max_depth: int):
+    """
+    A copy of a fitted tree with every node at `max_depth` turned into a leaf.
+    The new leaf keeps the node's stored value, which is the class
+    distribution of the training samples that reached it, so the capped
+    tree predicts what a tree grown to that depth with the same splits would.
+    """
+    tree = estimator.tree_
+    if tree.max_depth <= max_depth:
+        return estimator
+    state = tree.__getstate__()
+    nodes, values = state['nodes'], state['values']
+
+    # Depth of every node; parents always precede their children
+    depth = np.zeros(tree.node_count, dtype=np.int64)
+    keep = np.zeros(tree.node_count, dtype=bool)
+    keep[0] = True
+    for node in range(tree.node_count):
+        if not keep[node] or depth[node] >= max_depth:
+            continue
+        for child in (nodes['left_child'][node], nodes['right_child'][node]):
+            if child != TREE_LEAF:
+                depth[child] = depth[node] + 1
+                keep[child] = True
+
+    kept = np.flatnonzero(keep)
+    new_ids = np.full(tree.node_count, TREE_LEAF, dtype=np.int64)
+    new_ids[kept] = np.arange(len(kept))
+    new_nodes = nodes[kept].copy()
+    cut = depth[kept] >= max_depth
+    for field in ('left_child', 'right_child'):
+        children = new_nodes[field]
+        new_nodes[field] = np.where((children == TREE_LEAF) | cut, TREE_LEAF, new_ids[np.maximum(children, 0)])
+    is_leaf = new_nodes['left_child'] == TREE_LEAF
+    new_nodes['feature'][is_leaf] = TREE_UNDEFINED
+    new_nodes['threshold'][is_leaf] = TREE_UNDEFINED
+    new_nodes['missing_go_to_left'][is_leaf] = 0
+
+    capped = Tree(tree.n_features, np.asarray(tree.n_classes, dtype=np.intp), tree.n_outputs)
+    capped.__setstate__({'max_depth': int(depth[kept].max()), 'node_count': len(kept),
+                         'nodes': new_nodes, 'values': np.ascontiguousarray(values[kept])})
+    result = copy.copy(estimator)
+    result.tree_ = capped
+    result.max_depth = max_depth
+    return result
+
+def cap_forest_depth(model, max_depth: int):
+    capped = copy.copy(model)
+    capped.estimators_ = [cap_tree_depth(estimator, max_depth) for estimator in model.estimators_]
+    capped.max_depth = max_depth
+    return capped
+
+def distill(teacher, X, n_trees: int, max_depth, rows: int, random_state: int = 42):
+    """
+    A smaller forest trained on the teacher's probabilities instead of the
+    labels: every transfer row appears once per class, weighted by the
+    teacher's probability of that class, so the student stays a classifier
+    the API, the compiled forest and TreeSHAP handle unchanged.
+    """
+    if rows and len(X) > rows:
+        X = X.iloc[np.sort(np.random.default_rng(random_state).choice(len(X), rows, replace=False))]
+    proba = teacher.predict_proba(X)
+    classes = teacher.classes_
+    X_soft = pd.concat([X] * len(classes), ignore_index=True)
+    y_soft = np.repeat(classes, len(X))
+    weights = proba.T.ravel()
+    student = RandomForestClassifier(n_estimators=n_trees, max_depth=max_depth,
+                                     random_state=random_state, n_jobs=teacher.n_jobs)
+    return student.fit(X_soft, y_soft, sample_weight=weights)
+
+def _median_ms(fn, items) -> float:
+    times = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+def measure(model, X, y, latency_rows=LATENCY_ROWS, batch_rows=BATCH_ROWS, shap_rows=SHAP_ROWS):
+    """Size, latency and accuracy of one candidate on the evaluation rows"""
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    proba = model.predict_proba(X)
+    rows = [X.iloc[[i]] for i in range(min(latency_rows, len(X)))]
+
+    # The API scores small batches with the compiled forest
+    with tempfile.TemporaryDirectory() as compiled_dir, contextlib.redirect_stdout(io.StringIO()):
+        export_forest(model, compiled_dir)
+        compiled = CompiledForest.load(compiled_dir, mmap=False)
+        compiled_single_ms = _median_ms(compiled.predict_proba, rows)
+
+    batch = X.iloc[:batch_rows]
+    start = time.perf_counter()
+    model.predict_proba(batch)
+    batch_ms = (time.perf_counter() - start) * 1000 / len(batch)
+
+    start = time.perf_counter()
+    explainer = shap.TreeExplainer(model)
+    explainer_ms = (time.perf_counter() - start) * 1000
+    return {
+        "n_trees": len(trees),
+        "max_depth": int(max(tree.max_depth for tree in trees)),
+        "n_nodes": int(sum(tree.node_count for tree in trees)),
+        "pickle_mb": round(len(pickle.dumps(model)) / 2**20, 3),
+        "single_row_ms": round(_median_ms(model.predict_proba, rows), 3),
+        "compiled_single_row_ms": round(compiled_single_ms, 3),
+        "batch_per_row_ms": round(batch_ms, 4),
+        "shap_explainer_ms": round(explainer_ms, 1),
+        "shap_single_row_ms": round(_median_ms(explainer.shap_values, rows[:shap_rows]), 3),
+        "accuracy": float(accuracy_score(y, model.classes_.take(np.argmax(proba, axis=1)))),
+        "auc_roc": float(roc_auc_score(y, proba[:, 1])),
+    }
+
+def main(model_path=MODEL_SAVE_PATH, prune_sizes=PRUNE_SIZES, depths=DEPTHS, tolerance=AUC_TOLERANCE,
+         validation='auto', validation_rows=VALIDATION_ROWS, distill_trees=None, distill_depth=12,
+         distill_rows=DISTILL_ROWS, output=REPORT_PATH, save_path=COMPRESSED_MODEL_PATH,
+         register=False, activate=False, random_state=42):
+    """
+    1) Score every tree on validation rows: out-of-bag training rows when the
+       forest was bootstrapped on the stored split, otherwise half of X_test
+    2) Greedy pruning to each size, each combined with each depth cap
+    3) Optionally distill into a smaller forest
+    4) Measure every candidate on the evaluation rows and keep the smallest
+       within `tolerance` of the original AUC
+    """
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    X_train = as_model_input(read_split(X_TRAIN_PATH, zero_copy=True))
+    y_train = read_split(Y_TRAIN_PATH).values.ravel()
+    X_test = as_model_input(read_split(X_TEST_PATH, zero_copy=True))
+    y_test = read_split(Y_TEST_PATH).values.ravel()
+    positive = model.classes_[1]
+
+    # 1) Validation rows
+    rng = np.random.default_rng(random_state)
+    rows = np.sort(rng.choice(len(X_train), min(validation_rows, len(X_train)), replace=False))
+    masks = oob_masks(model, len(X_train), rows) if validation in ('auto', 'oob') else None
+    if masks is None and validation == 'oob':
+        raise ValueError(f"{model_path} was not bootstrapped on {X_TRAIN_PATH}; use --validation holdout")
+    if masks is not None:
+        X_val, y_val, X_eval, y_eval = X_train.iloc[rows], y_train[rows], X_test, y_test
+        evaluation = "X_test"
+        print(f"Validating on {len(rows)} training rows, each scored by the trees that did not draw it")
+    else:
+        val_idx, eval_idx = train_test_split(np.arange(len(X_test)), test_size=0.5,
+                                             random_state=random_state, stratify=y_test)
+        X_val, y_val = X_test.iloc[val_idx], y_test[val_idx]
+        X_eval, y_eval = X_test.iloc[eval_idx], y_test[eval_idx]
+        evaluation = "half of X_test (the other half is the validation fold)"
+        print(f"Validating on {len(val_idx)} X_test rows; evaluating on the other {len(eval_idx)}")
+
+    # 2) Pruned and depth-capped candidates
+    P = tree_probabilities(model, X_val)
+    sizes = sorted(size for size in prune_sizes if size < len(model.estimators_))
+    order, brier = greedy_prune(P, (y_val == positive).astype(np.float32), max(sizes, default=0), masks)
+    candidates = {"original": model}
+    for size in sizes + [None]:
+        base = subset_forest(model, order[:size]) if size else model
+        name = f"pruned-{size}" if size else "all-trees"
+        if size:
+            print(f"  {size} trees: validation Brier {brier[size - 1]:.4f}")
+            candidates[name] = base
+        for depth in depths:
+            # A cap at or above the deepest tree changes nothing
+            if depth >= max(estimator.tree_.max_depth for estimator in base.estimators_):
+                continue
+            candidates[f"{name}+depth-{depth}" if size else f"depth-{depth}"] = cap_forest_depth(base, depth)
+
+    # 3) Distilled student
+    if distill_trees:
+        print(f"Distilling into {distill_trees} trees of depth {distill_depth}")
+        candidates[f"distilled-{distill_trees}x{distill_depth}"] = distill(
+            model, X_train, distill_trees, distill_depth, distill_rows, random_state
+        )
+
+    # 4) Report and selection
+    results = {}
+    for name, candidate in candidates.items():
+        results[name] = measure(candidate, X_eval, y_eval)
+        r = results[name]
+        print(f"{name:24s} trees={r['n_trees']:4d} depth={r['max_depth']:3d} size={r['pickle_mb']:9.2f}MB "
+              f"single={r['single_row_ms']:7.2f}ms compiled={r['compiled_single_row_ms']:6.2f}ms "
+              f"shap={r['shap_single_row_ms']:8.2f}ms auc={r['auc_roc']:.4f} acc={r['accuracy']:.4f}")
+    floor = results["original"]["auc_roc"] - tolerance
+    eligible = [name for name, r in results.items() if r["auc_roc"] >= floor]
+    selected = min(eligible, key=lambda name: (results[name]["pickle_mb"], results[name]["single_row_ms"]))
+    print(f"Selected {selected}: {results[selected]['pickle_mb']:.2f} MB, AUC {results[selected]['auc_roc']:.4f} "
+          f"(original {results['original']['auc_roc']:.4f}, tolerance {tolerance})")
+
+    report = {
+        "model": model_path,
+        "validation": "out-of-bag training rows" if masks is not None else "half of X_test",
+        "validation_rows": len(y_val),
+        "evaluation": evaluation,
+        "evaluation_rows": len(y_eval),
+        "auc_tolerance": tolerance,
+        "prune_order": order,
+        "prune_brier": brier,
+        "candidates": results,
+        "selected": selected,
+    }
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {output}")
+
+    compressed = candidates[selected]
+    os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+    with open(save_path, 'wb') as f:
+        pickle.dump(compressed, f)
+    print(f"Compressed model saved to {save_path}")
+    if register:
+        metrics = {key: results[selected][key] for key in ("accuracy", "auc_roc")}
+        ModelRegistry().publish(compressed, LABEL_ENCODERS_PATH, FEATURE_SPEC_PATH, metrics=metrics,
+                                training={"compression": {"source": model_path, "candidate": selected,
+                                                          "auc_tolerance": tolerance}},
+                                canary=X_test, activate=activate)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prune, depth-cap or distill the trained forest and report the trade-offs")
+    parser.add_argument('--model', default=MODEL_SAVE_PATH)
+    parser.add_argument('--prune-sizes', type=int, nargs='*', default=list(PRUNE_SIZES),
+                        help="forest sizes kept by greedy pruning")
+    parser.add_argument('--depths', type=int, nargs='*', default=list(DEPTHS),
+                        help="depth caps, applied to the full and every pruned forest")
+    parser.add_argument('--tolerance', type=float, default=AUC_TOLERANCE,
+                        help="largest AUC loss allowed for the selected model")
+    parser.add_argument('--validation', choices=VALIDATION_MODES, default='auto',
+                        help="oob: out-of-bag training rows; holdout: half of X_test; auto: oob when possible")
+    parser.add_argument('--validation-rows', type=int, default=VALIDATION_ROWS)
+    parser.add_argument('--distill-trees', type=int, default=None,
+                        help="also distill into a forest of this many trees")
+    parser.add_argument('--distill-depth', type=int, default=12)
+    parser.add_argument('--distill-rows', type=int, default=DISTILL_ROWS,
+                        help="training rows the teacher labels for distillation (0 = all)")
+    parser.add_argument('--output', default=REPORT_PATH)
+    parser.add_argument('--save', default=COMPRESSED_MODEL_PATH, help="where the selected model is pickled")
+    parser.add_argument('--register', action='store_true', help="register the selected model as a new version")
+    parser.add_argument('--activate', action='store_true', help="with --register: make it the served version")
+    args = parser.parse_args()
+    main(model_path=args.model, prune_sizes=args.prune_sizes, depths=args.depths, tolerance=args.tolerance,
+         validation=args.validation, validation_rows=args.validation_rows, distill_trees=args.distill_trees,
+         distill_depth=args.distill_depth, distill_rows=args.distill_rows, output=args.output,
+         save_path=args.save, register=args.register, activate=args.activate)
@@ -0,0 +1,172 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from forest_compiler import export_forest
+
+REGISTRY_DIR = os.path.join('models', 'registry')
+# Name of the version the API serves, replaced atomically on activation
+CURRENT_FILE = 'CURRENT'
+METADATA_FILE = 'metadata.json'
+MODEL_FILE = 'model.pkl'
+COMPILED_DIR = 'compiled'
+LABEL_ENCODERS_FILE = 'label_encoders.pkl'
+FEATURE_SPEC_FILE = 'feature_spec.json'
+# Encoded rows with the probabilities the model gave them when it was published
+CANARY_FILE = 'canary.npz'
+CANARY_ROWS = 32
+
+def _json_safe(value: Any) -> Any:
+    """Model parameters as JSON values; anything else is stored as its repr"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+class ModelRegistry:
+    """
+    Versioned models under models/registry/<version>/, each directory holding
+    everything needed to serve it:
+      model.pkl           the fitted forest
+      compiled/           its export_forest arrays
+      label_encoders.pkl  and feature_spec.json, as preprocessing wrote them
+      canary.npz          a few encoded rows and their expected probabilities
+      metadata.json       feature order, importances, parameters and metrics
+    Versions are written under a temporary name and renamed into place, so a
+    version directory is always complete. CURRENT names the served version.
+    """
+
+    def __init__(self, root: str = REGISTRY_DIR):
+        self.root = root
+
+    def path(self, version: str, *names: str) -> str:
+        return os.path.join(self.root, version, *names)
+
+    def versions(self) -> List[str]:
+        """Published versions, oldest first (names start with their UTC timestamp)"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.exists(self.path(name, METADATA_FILE)))
+
+    def current(self) -> Optional[str]:
+        """The version CURRENT points to, or None before the first activation"""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set_current(self, version: str):
+        if not os.path.exists(self.path(version, METADATA_FILE)):
+            raise ValueError(f"Unknown model version: {version}")
+        tmp_path = os.path.join(self.root, f"{CURRENT_FILE}.tmp")
+        with open(tmp_path, 'w') as f:
+            f.write(version + "\n")
+        os.replace(tmp_path, os.path.join(self.root, CURRENT_FILE))
+        print(f"Model version {version} is now current")
+
+    def metadata(self, version: Optional[str] = None) -> Dict[str, Any]:
+        """Metadata sidecar of a version, the current one by default"""
+        version = version or self.current()
+        if version is None:
+            raise FileNotFoundError(f"No current model version in {self.root}")
+        with open(self.path(version, METADATA_FILE)) as f:
+            return json.load(f)
+
+    def publish(self, model, label_encoders_path: str, feature_spec_path: Optional[str] = None,
+                metrics: Optional[Dict[str, Any]] = None, training: Optional[Dict[str, Any]] = None,
+                canary: Optional[pd.DataFrame] = None, activate: bool = True) -> str:
+        """
+        Store a fitted model with its encoders as a new version and return
+        the version name. `canary` rows (encoded, in feature order) are kept
+        with their predicted probabilities so a loader can check the model.
+        """
+        payload = pickle.dumps(model)
+        model_sha256 = hashlib.sha256(payload).hexdigest()
+        created = datetime.datetime.now(datetime.timezone.utc)
+        version = f"{created:%Y%m%d-%H%M%S}-{model_sha256[:8]}"
+        tmp_dir = self.path(f".{version}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            # 1) Model, its compiled arrays and the encoders it was trained with
+            model_path = os.path.join(tmp_dir, MODEL_FILE)
+            with open(model_path, 'wb') as f:
+                f.write(payload)
+            export_forest(model, os.path.join(tmp_dir, COMPILED_DIR), source_path=model_path)
+            shutil.copy2(label_encoders_path, os.path.join(tmp_dir, LABEL_ENCODERS_FILE))
+            if feature_spec_path and os.path.exists(feature_spec_path):
+                shutil.copy2(feature_spec_path, os.path.join(tmp_dir, FEATURE_SPEC_FILE))
+
+            # 2) Canary rows and the probabilities they must keep getting
+            feature_order = [str(name) for name in getattr(model, 'feature_names_in_', [])]
+            if canary is not None and len(canary):
+                rows = canary.iloc[:CANARY_ROWS]
+                X = pd.DataFrame(rows.to_numpy(dtype=np.float32), columns=rows.columns)
+                np.savez(os.path.join(tmp_dir, CANARY_FILE), X=X.to_numpy(),
+                         columns=np.asarray(X.columns, dtype=str), proba=model.predict_proba(X))
+
+            # 3) Metadata sidecar, read by the API and scripts without unpickling the forest
+            importances = getattr(model, 'feature_importances_', None)
+            metadata = {
+                "version": version,
+                "created": created.isoformat(timespec='seconds'),
+                "model_sha256": model_sha256,
+                "model_class": type(model).__name__,
+                "sklearn_version": sklearn.__version__,
+                "n_estimators": len(getattr(model, 'estimators_', [])),
+                "params": {key: _json_safe(value) for key, value in model.get_params().items()},
+                "classes": [_json_safe(c) for c in model.classes_],
+                "feature_order": feature_order,
+                "feature_importances": dict(sorted(
+                    zip(feature_order, map(float, importances)), key=lambda item: -item[1]
+                )) if importances is not None else {},
+                "metrics": metrics or {},
+                "training": training or {},
+                "files": sorted(os.listdir(tmp_dir)),
+            }
+            with open(os.path.join(tmp_dir, METADATA_FILE), 'w') as f:
+                json.dump(metadata, f, indent=2)
+            os.rename(tmp_dir, self.path(version))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        print(f"Model registered as version {version} in {self.root}")
+
+        if activate:
+            self.set_current(version)
+        return version
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List, inspect and activate registered model versions")
+    parser.add_argument('command', choices=('list', 'show', 'activate'))
+    parser.add_argument('version', nargs='?', help="version to show or activate (show: current by default)")
+    parser.add_argument('--registry', default=REGISTRY_DIR)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    if args.command == 'list':
+        current = registry.current()
+        for version in registry.versions():
+            metrics = registry.metadata(version).get('metrics', {})
+            accuracy = f"accuracy {metrics['accuracy']:.4f}" if metrics.get('accuracy') is not None else ""
+            print(f"{'*' if version == current else ' '} {version}  {accuracy}")
+    elif args.command == 'show':
+        metadata = registry.metadata(args.version)
+        metadata.get('metrics', {}).pop('report', None)
+        print(json.dumps(metadata, indent=2))
+    else:
+        if not args.version:
+            parser.error("activate needs a version")
+        registry.set_current(args.version)
@@ -0,0 +1,93 @@
+import itertools
+import math
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+def as_float32_matrix(X):
+    """
+    Convert training data once into the float32 layout the trees read, so
+    fits never copy it: dense arrays stay C-contiguous, sparse data becomes CSC.
+    """
+    if isinstance(X, pd.DataFrame) and any(isinstance(dtype, pd.SparseDtype) for dtype in X.dtypes):
+        X = X.sparse.to_coo()
+    if sparse.issparse(X):
+        return sparse.csc_matrix(X, dtype=np.float32)
+    return np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+
+def make_folds(X, y, cv=3, random_state=42):
+    """Train/validation matrices for each stratified fold, sliced once and reused by every candidate"""
+    X = as_float32_matrix(X)
+    y = np.asarray(y)
+    folds = []
+    for train_idx, test_idx in StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state).split(
+        np.zeros(len(y)), y
+    ):
+        X_fit, X_val = X[train_idx], X[test_idx]
+        if sparse.issparse(X):
+            # Trees are grown from CSC and predict from CSR
+            X_fit, X_val = X_fit.tocsc(), X_val.tocsr()
+        folds.append((X_fit, y[train_idx], X_val, y[test_idx]))
+    return folds
+
+def tree_schedule(n_candidates, min_trees, max_trees, factor):
+    """Tree counts per rung: from min_trees up to max_trees, one rung per halving"""
+    n_rungs = max(1, math.ceil(math.log(max(n_candidates, 1), factor)) + 1)
+    if n_rungs == 1 or min_trees >= max_trees:
+        return [max_trees]
+    rungs = np.geomspace(min_trees, max_trees, n_rungs).round().astype(int)
+    return sorted(set(rungs.tolist()))
+
+def successive_halving(X, y, param_grid, min_trees=25, max_trees=300, factor=3,
+                       cv=3, random_state=42, n_jobs=-1):
+    """
+    Successive halving over `param_grid` with the number of trees as the budget.
+    Every candidate starts with `min_trees` trees per fold. After each rung
+    only the best 1/`factor` candidates (by mean validation accuracy) stay,
+    and their forests are grown to the next rung with warm_start instead of
+    being refit. Returns (best_params, best_score, history).
+    """
+    param_names = sorted(param_grid)
+    candidates = [dict(zip(param_names, values))
+                  for values in itertools.product(*(param_grid[name] for name in param_names))]
+    folds = make_folds(X, y, cv=cv, random_state=random_state)
+    rungs = tree_schedule(len(candidates), min_trees, max_trees, factor)
+    print(f"Successive halving: {len(candidates)} candidates, {cv} folds, trees per rung {rungs}")
+
+    # One warm-started forest per candidate and fold
+    forests = {
+        i: [RandomForestClassifier(warm_start=True, random_state=random_state, n_jobs=n_jobs, **params)
+            for _ in folds]
+        for i, params in enumerate(candidates)
+    }
+    alive = list(forests)
+    history = []
+    scores = {}
+    for rung, n_trees in enumerate(rungs):
+        for i in alive:
+            start = time.perf_counter()
+            fold_scores = []
+            for forest, (X_fit, y_fit, X_val, y_val) in zip(forests[i], folds):
+                forest.set_params(n_estimators=n_trees)
+                forest.fit(X_fit, y_fit)
+                fold_scores.append(float(np.mean(forest.predict(X_val) == y_val)))
+            seconds = time.perf_counter() - start
+            scores[i] = float(np.mean(fold_scores))
+            history.append({"rung": rung, "n_estimators": n_trees, "params": candidates[i],
+                            "mean_accuracy": scores[i], "fit_seconds": seconds})
+            print(f"  rung {rung} trees={n_trees:4d} {candidates[i]} "
+                  f"accuracy={scores[i]:.4f} fit={seconds:.2f}s")
+
+        if rung < len(rungs) - 1:
+            keep = max(1, math.ceil(len(alive) / factor))
+            # Stable sort keeps the grid order among ties
+            alive = sorted(alive, key=lambda i: -scores[i])[:keep]
+            for i in set(forests) - set(alive):
+                forests[i] = []
+
+    best = max(alive, key=lambda i: scores[i])
+    return dict(candidates[best], n_estimators=rungs[-1]), scores[best], history
@@ -1,9 +1,18 @@
 import pandas as pd
+import numpy as np
+import argparse
 import pickle
 import os
+import time
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score, roc_auc_score
 from sklearn.model_selection import GridSearchCV
+from forest_compiler import export_forest
+from pipeline_cache import read_frame
+from dtype_policy import as_float32_frame
+from model_search import successive_halving
+from model_registry import ModelRegistry
+from data_processing import FEATURE_SPEC_PATH, LABEL_ENCODERS_PATH
 
 # Define paths for processed data
 X_TRAIN_PATH = 'data/processed/X_train.csv'
@@ -12,13 +21,40 @@ Y_TRAIN_PATH = 'data/processed/y_train.csv'
 Y_TEST_PATH = 'data/processed/y_test.csv'
 
 MODEL_SAVE_PATH = 'models/random_forest_model.pkl'
+# Flat, memory-mappable copy of the forest used by the API for fast inference
+COMPILED_MODEL_DIR = 'models/random_forest_compiled'
+
+def read_split(csv_path, zero_copy=False):
+    """
+    Read one processed split, memory-mapping its Feather copy when it is at
+    least as new as the CSV and falling back to parsing the CSV otherwise.
+    zero_copy is passed to read_frame: the split's columns stay views of the
+    mapped file, for splits that are only read.
+    """
+    feather_path = os.path.splitext(csv_path)[0] + '.feather'
+    if os.path.exists(feather_path) and (
+        not os.path.exists(csv_path) or os.path.getmtime(feather_path) >= os.path.getmtime(csv_path)
+    ):
+        return read_frame(feather_path, zero_copy=zero_copy)
+    return pd.read_csv(csv_path)
+
+def as_model_input(X):
+    """
+    Frames with sparse multi-hot columns are made entirely sparse, which
+    scikit-learn trains on as one CSR matrix while keeping the column names.
+    Dense frames become one contiguous float32 block, the dtype the trees use.
+    """
+    if any(isinstance(dtype, pd.SparseDtype) for dtype in X.dtypes):
+        return X.astype(pd.SparseDtype(np.float32, 0))
+    return as_float32_frame(X)
 
 # Load processed data
 def load_data():
-    X_train = pd.read_csv(X_TRAIN_PATH)
-    X_test = pd.read_csv(X_TEST_PATH)
-    y_train = pd.read_csv(Y_TRAIN_PATH).values.ravel()  # Flatten the target column
-    y_test = pd.read_csv(Y_TEST_PATH).values.ravel()  # Flatten the target column
+    # The splits are mapped, not copied: as_model_input makes the only in-memory copy
+    X_train = as_model_input(read_split(X_TRAIN_PATH, zero_copy=True))
+    X_test = as_model_input(read_split(X_TEST_PATH, zero_copy=True))
+    y_train = read_split(Y_TRAIN_PATH).values.ravel()  # Flatten the target column
+    y_test = read_split(Y_TEST_PATH).values.ravel()  # Flatten the target column
 
     print("Data loaded successfully.")
     print(f"Training set: {X_train.shape[0]} samples, {X_train.shape[1]} features.")
@@ -26,25 +62,46 @@ def load_data():
 
     return X_train, X_test, y_train, y_test
 
+# Parameter tuning grid; the halving search treats n_estimators as its budget
+PARAM_GRID = {
+    'n_estimators': [100, 200, 300],
+    'max_depth': [10, 20, None],
+    'min_samples_split': [2, 5, 10]
+}
+SEARCH_MODES = ('grid', 'halving')
+
 # Train the model
-def train_model(X_train, y_train):
+def train_model(X_train, y_train, search='grid', min_trees=25, max_trees=None, factor=3):
+    """
+    Tune and fit the forest. search='grid' runs the exhaustive GridSearchCV;
+    search='halving' runs successive halving over the other parameters,
+    growing forests from `min_trees` to `max_trees` (the largest grid value
+    by default) and keeping the best 1/`factor` candidates per rung.
+    """
     print("Training Random Forest model...")
-
-    # Initial model setup
-    rf = RandomForestClassifier(random_state=42)
-
-    # Parameter tuning (Grid Search)
-    param_grid = {
-        'n_estimators': [100, 200, 300],
-        'max_depth': [10, 20, None],
-        'min_samples_split': [2, 5, 10]
-    }
-
-    grid_search = GridSearchCV(estimator=rf, param_grid=param_grid, cv=3, n_jobs=-1, verbose=2)
-    grid_search.fit(X_train, y_train)
-
-    print("Best parameters found:", grid_search.best_params_)
-    best_rf_model = grid_search.best_estimator_
+    start = time.perf_counter()
+
+    if search == 'halving':
+        grid = {name: values for name, values in PARAM_GRID.items() if name != 'n_estimators'}
+        best_params, best_score, _ = successive_halving(
+            X_train, y_train, grid,
+            min_trees=min_trees, max_trees=max_trees or max(PARAM_GRID['n_estimators']),
+            factor=factor, cv=3, random_state=42
+        )
+        print(f"Best parameters found: {best_params} (cv accuracy {best_score:.4f})")
+        best_rf_model = RandomForestClassifier(random_state=42, n_jobs=-1, **best_params)
+        best_rf_model.fit(X_train, y_train)
+    else:
+        # Initial model setup
+        rf = RandomForestClassifier(random_state=42)
+
+        # Parameter tuning (Grid Search)
+        grid_search = GridSearchCV(estimator=rf, param_grid=PARAM_GRID, cv=3, n_jobs=-1, verbose=2)
+        grid_search.fit(X_train, y_train)
+
+        print("Best parameters found:", grid_search.best_params_)
+        best_rf_model = grid_search.best_estimator_
+    print(f"Search and fit took {time.perf_counter() - start:.1f}s")
 
     # Save the trained model
     os.makedirs('models', exist_ok=True)
@@ -72,15 +129,39 @@ def evaluate_model(model, X_test, y_test):
 
     print(f"Accuracy: {accuracy:.4f}")
     print(f"AUC-ROC: {auc_roc:.4f}")
+    return {"accuracy": float(accuracy), "auc_roc": float(auc_roc),
+            "report": classification_report(y_test, y_pred, output_dict=True)}
 
 # Main function
-def main():
+def main(search='grid', min_trees=25, max_trees=None, factor=3, activate=True):
     try:
         X_train, X_test, y_train, y_test = load_data()
-        model = train_model(X_train, y_train)
-        evaluate_model(model, X_test, y_test)
+        model = train_model(X_train, y_train, search=search,
+                            min_trees=min_trees, max_trees=max_trees, factor=factor)
+        export_forest(model, COMPILED_MODEL_DIR, source_path=MODEL_SAVE_PATH)
+        metrics = evaluate_model(model, X_test, y_test)
+
+        # Versioned copy with encoders and metadata; the API picks up the new CURRENT
+        ModelRegistry().publish(
+            model, LABEL_ENCODERS_PATH, FEATURE_SPEC_PATH, metrics=metrics,
+            training={"search": search, "train_rows": int(X_train.shape[0]), "test_rows": int(X_test.shape[0])},
+            canary=X_test, activate=activate
+        )
     except Exception as e:
         print(f"Error: {str(e)}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train the trial completion model")
+    parser.add_argument('--search', choices=SEARCH_MODES, default='grid',
+                        help="exhaustive grid search or successive halving")
+    parser.add_argument('--min-trees', type=int, default=25,
+                        help="halving: trees per candidate in the first rung")
+    parser.add_argument('--max-trees', type=int, default=None,
+                        help="halving: trees in the last rung and the final model")
+    parser.add_argument('--factor', type=int, default=3,
+                        help="halving: keep 1/factor of the candidates after each rung")
+    parser.add_argument('--no-activate', action='store_true',
+                        help="register the model without making it the version the API serves")
+    args = parser.parse_args()
+    main(search=args.search, min_trees=args.min_trees, max_trees=args.max_trees, factor=args.factor,
+         activate=not args.no_activate)
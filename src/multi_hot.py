@@ -0,0 +1,80 @@
+from collections import Counter
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Multi-valued fields, with values separated by '|'
+MULTI_HOT_COLS = ['intervention', 'condition']
+DELIMITER = '|'
+# Tokens seen in fewer trials than this share the OTHER_TOKEN column
+MIN_TOKEN_FREQ = 5
+OTHER_TOKEN = '__other__'
+# Joins a field and a token into a feature name, e.g. 'condition=Asthma'
+NAME_SEPARATOR = '='
+
+class MultiHotEncoder:
+    """
+    One column per frequent token of a delimited field, one row per trial.
+    Tokens are stripped and counted once per trial; tokens below `min_freq`
+    and tokens never seen in fit set the shared OTHER_TOKEN column instead.
+    Rows come out as a CSR matrix, so memory follows the number of tokens
+    present rather than trials x vocabulary.
+    """
+
+    def __init__(self, column: str, min_freq: int = MIN_TOKEN_FREQ,
+                 vocabulary: List[str] | None = None, delimiter: str = DELIMITER):
+        self.column = column
+        self.min_freq = min_freq
+        self.delimiter = delimiter
+        self.vocabulary = list(vocabulary) if vocabulary is not None else None
+
+    def _tokens(self, values: pd.Series) -> pd.Series:
+        """Stripped tokens indexed by row position, one entry per distinct token per row"""
+        values = pd.Series(values).fillna('Unknown').astype(str).reset_index(drop=True)
+        tokens = values.str.split(self.delimiter, regex=False).explode().str.strip()
+        tokens = tokens[tokens != '']
+        pairs = pd.DataFrame({'row': tokens.index.to_numpy(), 'token': tokens.to_numpy()}).drop_duplicates()
+        return pd.Series(pairs['token'].to_numpy(), index=pairs['row'].to_numpy())
+
+    def fit(self, values: pd.Series) -> "MultiHotEncoder":
+        counts = Counter(self._tokens(values).to_numpy())
+        frequent = [token for token, count in counts.items() if count >= self.min_freq]
+        # Most common first, ties by name, so the vocabulary is deterministic
+        self.vocabulary = sorted(frequent, key=lambda token: (-counts[token], token))
+        return self
+
+    def feature_names(self) -> List[str]:
+        return [f"{self.column}{NAME_SEPARATOR}{token}" for token in self.vocabulary + [OTHER_TOKEN]]
+
+    def transform(self, values: pd.Series) -> sparse.csr_matrix:
+        """CSR matrix of shape (rows, len(vocabulary) + 1) with 0/1 entries"""
+        n_rows = len(values)
+        tokens = self._tokens(values)
+        codes = pd.Categorical(tokens.to_numpy(), categories=self.vocabulary).codes.astype(np.int64)
+        # Tokens outside the vocabulary all land in the last (other) column
+        codes[codes < 0] = len(self.vocabulary)
+        rows = tokens.index.to_numpy()
+        matrix = sparse.csr_matrix(
+            (np.ones(len(codes), dtype=np.uint8), (rows, codes)),
+            shape=(n_rows, len(self.vocabulary) + 1)
+        )
+        # Several rare tokens in one row still set the other column to 1
+        matrix.data[:] = 1
+        return matrix
+
+    def fit_transform(self, values: pd.Series) -> sparse.csr_matrix:
+        return self.fit(values).transform(values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "column": self.column,
+            "min_freq": self.min_freq,
+            "delimiter": self.delimiter,
+            "vocabulary": self.vocabulary,
+        }
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> "MultiHotEncoder":
+        return cls(spec["column"], spec["min_freq"], spec["vocabulary"], spec["delimiter"])
@@ -0,0 +1,127 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Partitions per worker process, so one slow partition does not idle the others
+PARTITIONS_PER_WORKER = 2
+
+def partition_ids(keys: pd.Series, partitions: int) -> np.ndarray:
+    """Partition of every row from a hash of its key; the same in every process and run"""
+    return (pd.util.hash_pandas_object(keys, index=False).to_numpy() % partitions).astype(np.int64)
+
+def to_shared(df: pd.DataFrame) -> Tuple[str, int]:
+    """
+    Write a frame, index and categoricals included, to a new shared memory
+    block as an Arrow IPC stream. Returns the block's name and the stream size;
+    whoever reads it last unlinks it.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    # Measure first, then serialize straight into the block without a buffer copy
+    sink = pa.MockOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    size = sink.size()
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        buffer = pa.py_buffer(block.buf)
+        stream = pa.FixedSizeBufferWriter(buffer)
+        with pa.ipc.new_stream(stream, table.schema) as writer:
+            writer.write_table(table)
+        stream.close()
+        # The segment can only be closed once no Arrow object points into it
+        del writer, stream, buffer
+    finally:
+        block.close()
+    return block.name, size
+
+def from_shared(handle: Tuple[str, int], unlink: bool = True) -> pd.DataFrame:
+    """Read a frame written by to_shared into private memory, unlinking the block by default"""
+    name, size = handle
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        # One memcpy out of the segment: Arrow-backed pandas columns keep
+        # pointing at the stream's buffers, which must outlive the segment
+        view = block.buf[:size]
+        stream = pa.py_buffer(bytes(view))
+        view.release()
+        df = pa.ipc.open_stream(stream).read_all().to_pandas()
+    finally:
+        block.close()
+        if unlink:
+            block.unlink()
+    return df
+
+def _unlink(name: str):
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+def _run_partition(fn: Callable, handle: Tuple[str, int], args: Sequence) -> Tuple[str, int]:
+    """Worker task: read a partition from shared memory, apply fn and share the result"""
+    return to_shared(fn(from_shared(handle, unlink=False), *args))
+
+def map_partitions(df: pd.DataFrame, ids: np.ndarray, fn: Callable, args: Sequence = (),
+                   workers: int = 1) -> List[pd.DataFrame]:
+    """
+    fn(partition, *args) for each partition of df, where `ids` holds every
+    row's partition number; empty partitions are skipped. Rows keep their
+    order and index within a partition. With several workers the partitions
+    and results travel between processes through shared memory instead of
+    pickles; fn must be a module-level function.
+    """
+    partitions = [df[ids == part] for part in np.unique(ids)]
+    if workers <= 1 or len(partitions) <= 1:
+        return [fn(partition.copy(), *args) for partition in partitions]
+
+    inputs = [to_shared(partition) for partition in partitions]
+    del partitions
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_partition, fn, handle, args) for handle in inputs]
+    finally:
+        for name, _ in inputs:
+            _unlink(name)
+    # Every task has finished; on a failure, drop the results that were shared
+    if any(future.exception() is not None for future in futures):
+        for future in futures:
+            if future.exception() is None:
+                _unlink(future.result()[0])
+        next(future for future in futures if future.exception() is not None).result()
+    return [from_shared(future.result()) for future in futures]
+
+def concat_partitions(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Put partitions of one frame back together in index order; rows sharing
+    an index label must come from the same partition. Categorical columns
+    get the sorted union of the partitions' categories, as astype('category')
+    on the whole column would. The union and sort run in Arrow, and each
+    column is built once from the concatenated codes.
+    """
+    columns = parts[0].columns
+    categorical = [col for col in columns
+                   if any(isinstance(part[col].dtype, pd.CategoricalDtype) for part in parts)]
+    order = np.argsort(np.concatenate([part.index.to_numpy() for part in parts]), kind='stable')
+    df = pd.concat([part.drop(columns=categorical) for part in parts]).iloc[order]
+    for col in categorical:
+        values = [part[col].astype('category').array for part in parts]
+        # One hash pass over every partition's categories, then one sort of the distinct ones
+        encoded = pa.concat_arrays([pa.array(value.categories) for value in values]).dictionary_encode()
+        order_in_union = pc.sort_indices(encoded.dictionary).to_numpy()
+        rank = np.empty(len(order_in_union), dtype=np.int64)
+        rank[order_in_union] = np.arange(len(order_in_union))
+        indexers = np.split(rank[encoded.indices.to_numpy()],
+                            np.cumsum([len(value.categories) for value in values])[:-1])
+        codes = np.concatenate([np.where(value.codes < 0, -1, indexer[value.codes])
+                                for value, indexer in zip(values, indexers)])
+        union = encoded.dictionary.take(pa.array(order_in_union))
+        categories = pd.Index(union.to_pandas()).astype(values[0].categories.dtype)
+        df[col] = pd.Categorical.from_codes(codes[order], dtype=pd.CategoricalDtype(categories))
+    return df[columns]
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow.feather as feather
+from scipy import sparse
+
+from dtype_policy import sparse_frame
+
+CACHE_DIR = os.path.join('data', 'cache')
+# Memoized content digests of input files, keyed by path, size and mtime
+FINGERPRINTS_FILE = 'fingerprints.json'
+# Index column stored alongside frames so their index survives a round trip
+INDEX_COLUMN = '__index__'
+# Sidecars holding a frame's sparse columns as one CSR matrix
+SPARSE_SUFFIX = '.sparse.npz'
+COLUMNS_SUFFIX = '.columns.json'
+
+def write_frame(path: str, df: pd.DataFrame):
+    """
+    Write a DataFrame as uncompressed Feather in a single record batch, so
+    each column is one contiguous buffer that read_frame can map without
+    copying. Sparse columns are stored next to it as one CSR matrix instead.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    sparse_cols = [col for col, dtype in df.dtypes.items() if isinstance(dtype, pd.SparseDtype)]
+    for suffix in (SPARSE_SUFFIX, COLUMNS_SUFFIX):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    if sparse_cols:
+        sparse.save_npz(path + SPARSE_SUFFIX, df[sparse_cols].sparse.to_coo().tocsr())
+        with open(path + COLUMNS_SUFFIX, 'w') as f:
+            json.dump({'columns': list(df.columns), 'sparse': sparse_cols}, f)
+        df = df.drop(columns=sparse_cols)
+
+    table = df.reset_index(names=INDEX_COLUMN)
+    tmp_path = f"{path}.tmp"
+    # The default 64k-row batches split every column into chunks, which to_pandas has to concatenate
+    table.to_feather(tmp_path, compression='uncompressed', chunksize=max(len(table), 1))
+    os.replace(tmp_path, path)
+
+def read_frame(path: str, zero_copy: bool = False) -> pd.DataFrame:
+    """
+    Read a Feather file written by write_frame from a memory map.
+    By default every column is copied into memory, so the frame can be
+    modified. With zero_copy, numeric columns without nulls stay read-only
+    views of the mapped file: nothing is copied until a column is converted,
+    and pages are only read when touched. Assigning into such a column
+    raises, so only use it for frames that are read, e.g. converted to model
+    input. Files written before the single-batch layout are always copied.
+    Columns keep the dtype they were written with, object strings included.
+    """
+    table = feather.read_table(path, memory_map=True)
+    # Arrow strings come back as pandas' str dtype; columns written as object stay object
+    object_cols = [col['name'] for col in (table.schema.pandas_metadata or {}).get('columns', [])
+                   if col['numpy_type'] == 'object' and col['name'] != INDEX_COLUMN]
+    if zero_copy:
+        # One block per column, and each column's buffers released as soon as it is converted
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
+    else:
+        df = table.to_pandas()
+    del table
+    for col in object_cols:
+        if col in df.columns and df[col].dtype != object:
+            df[col] = df[col].astype(object)
+    if INDEX_COLUMN in df.columns:
+        df = df.set_index(INDEX_COLUMN)
+        df.index.name = None
+    if os.path.exists(path + COLUMNS_SUFFIX):
+        with open(path + COLUMNS_SUFFIX) as f:
+            layout = json.load(f)
+        block = sparse_frame(sparse.load_npz(path + SPARSE_SUFFIX), index=df.index, columns=layout['sparse'])
+        df = pd.concat([df, block], axis=1)[layout['columns']]
+    return df
+
+def cache_key(*parts) -> str:
+    """Stable digest of JSON-serializable key parts"""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:24]
+
+class PipelineCache:
+    """
+    Content-addressed store for pipeline stages.
+    Entries live under data/cache/<stage>/<key>/ and are written once, so a
+    key fully determines the content. Keys combine input file digests with
+    the parameters and code that produced the entry.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._fingerprints_path = os.path.join(cache_dir, FINGERPRINTS_FILE)
+        self._fingerprints = {}
+        if os.path.exists(self._fingerprints_path):
+            with open(self._fingerprints_path) as f:
+                self._fingerprints = json.load(f)
+
+    def file_digest(self, path: str) -> str:
+        """
+        SHA-256 of a file's content. The digest is remembered with the file's
+        size and mtime, so unchanged files are not re-read on every run.
+        """
+        stat = os.stat(path)
+        abs_path = os.path.abspath(path)
+        known = self._fingerprints.get(abs_path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self._fingerprints[abs_path] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': digest.hexdigest(),
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self._fingerprints_path, 'w') as f:
+            json.dump(self._fingerprints, f, indent=2)
+        return digest.hexdigest()
+
+    def _entry(self, stage: str, key: str) -> str:
+        return os.path.join(self.cache_dir, stage, key)
+
+    def load_frames(self, stage: str, key: str):
+        """Return the cached {name: DataFrame} for a key, or None on a miss"""
+        entry = self._entry(stage, key)
+        manifest_path = os.path.join(entry, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        return {name: read_frame(os.path.join(entry, f"{name}.feather")) for name in manifest['frames']}
+
+    def save_frames(self, stage: str, key: str, frames, files=None):
+        """
+        Store {name: DataFrame} (and optional extra files, copied as-is) under
+        a key. The manifest is written last, so partial entries are never read.
+        """
+        entry = self._entry(stage, key)
+        os.makedirs(entry, exist_ok=True)
+        try:
+            for name, df in frames.items():
+                write_frame(os.path.join(entry, f"{name}.feather"), df)
+        except Exception as e:
+            # Some object columns mix types that Arrow cannot store; skip caching them
+            print(f"Skipping cache for {stage}: {str(e)}")
+            shutil.rmtree(entry, ignore_errors=True)
+            return
+        for path in files or []:
+            shutil.copy2(path, os.path.join(entry, os.path.basename(path)))
+        with open(os.path.join(entry, 'manifest.json'), 'w') as f:
+            json.dump({'frames': list(frames), 'files': [os.path.basename(p) for p in files or []]}, f)
+
+    def restore_files(self, stage: str, key: str, target_dir: str):
+        """Copy the extra files stored with an entry into target_dir"""
+        entry = self._entry(stage, key)
+        with open(os.path.join(entry, 'manifest.json')) as f:
+            manifest = json.load(f)
+        os.makedirs(target_dir, exist_ok=True)
+        for name in manifest['files']:
+            shutil.copy2(os.path.join(entry, name), os.path.join(target_dir, name))
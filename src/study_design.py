@@ -0,0 +1,47 @@
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+# Keys of the 'Key: value|Key: value' study_design string and the columns they become
+DESIGN_FIELDS = {
+    'Allocation': 'Allocation',
+    'Intervention Model': 'Intervention_Model',
+    'Masking': 'Masking',
+    'Primary Purpose': 'Primary_Purpose',
+}
+DESIGN_COLUMNS = list(DESIGN_FIELDS.values())
+MISSING_VALUE = 'Unknown'
+
+def parse_design(design: str) -> Dict[str, str]:
+    """
+    Split one study_design string into its known fields in a single pass.
+    The first occurrence of each key wins and values are kept verbatim up to
+    the next '|', as the per-field regex extraction did.
+    """
+    fields = {}
+    for segment in design.split('|'):
+        key, separator, value = segment.partition(': ')
+        column = DESIGN_FIELDS.get(key.strip()) if separator else None
+        if column is not None and column not in fields:
+            fields[column] = value
+    return fields
+
+def parse_study_design(values: pd.Series, missing: str = MISSING_VALUE) -> pd.DataFrame:
+    """
+    Categorical Allocation, Intervention_Model, Masking and Primary_Purpose
+    columns for a Series of study_design strings. Each distinct string is
+    parsed once and the results are broadcast back by code, so the cost
+    follows the number of distinct designs rather than rows. Missing designs
+    and absent keys become `missing`.
+    """
+    codes, uniques = pd.factorize(values)
+    parsed = [parse_design(str(design)) for design in uniques]
+
+    columns = {}
+    for column in DESIGN_COLUMNS:
+        field_values = [fields.get(column, missing) for fields in parsed] + [missing]
+        field_codes, categories = pd.factorize(np.asarray(field_values, dtype=object))
+        # Code -1 (missing design) picks the trailing `missing` entry
+        columns[column] = pd.Categorical.from_codes(field_codes[codes], categories=categories)
+    return pd.DataFrame(columns, index=values.index)
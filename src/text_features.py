@@ -0,0 +1,70 @@
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# Free-text fields that can be hashed instead of label-encoded
+TEXT_COLS = ['criteria', 'study_title']
+# Hashed columns per field
+N_TEXT_FEATURES = 2 ** 10
+# Rows vectorized at a time; bounds the working memory of transform
+TEXT_CHUNK_ROWS = 10000
+# Joins a field and a bucket into a feature name, e.g. 'criteria#17'
+NAME_SEPARATOR = '#'
+# Markup characters stripped from eligibility criteria before encoding
+CRITERIA_STRIP_PATTERN = r'[~\-#^*`]'
+
+def clean_criteria(values: pd.Series) -> pd.Series:
+    """
+    Criteria text as the model sees it. Training and the API both call this,
+    so label-encoded and hashed criteria match at serving time; missing
+    values stay missing.
+    """
+    return values.str.replace(CRITERIA_STRIP_PATTERN, '', regex=True).str.strip()
+
+class TextHasher:
+    """
+    Fixed-size sparse term vectors for a free-text field, via the hashing trick.
+    There is no vocabulary: a term's column is a hash of the term, so the
+    encoder is fully described by its parameters and new text never falls
+    outside it. Non-negative term frequencies are L2-normalised per row.
+    """
+
+    def __init__(self, column: str, n_features: int = N_TEXT_FEATURES,
+                 ngram_range=(1, 1), lowercase: bool = True):
+        self.column = column
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.lowercase = lowercase
+        self._vectorizer = HashingVectorizer(
+            n_features=n_features, ngram_range=self.ngram_range, lowercase=lowercase,
+            alternate_sign=False, norm='l2', dtype=np.float32
+        )
+
+    def feature_names(self) -> List[str]:
+        return [f"{self.column}{NAME_SEPARATOR}{i}" for i in range(self.n_features)]
+
+    def transform(self, values: pd.Series, chunk_rows: int = TEXT_CHUNK_ROWS) -> sparse.csr_matrix:
+        """CSR matrix of shape (rows, n_features), hashed chunk by chunk"""
+        values = pd.Series(values).fillna('Unknown').astype(str).to_numpy()
+        chunks = [
+            self._vectorizer.transform(values[start:start + chunk_rows])
+            for start in range(0, len(values), chunk_rows)
+        ]
+        if not chunks:
+            return sparse.csr_matrix((0, self.n_features), dtype=np.float32)
+        return sparse.vstack(chunks, format='csr')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "column": self.column,
+            "n_features": self.n_features,
+            "ngram_range": list(self.ngram_range),
+            "lowercase": self.lowercase,
+        }
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> "TextHasher":
+        return cls(spec["column"], spec["n_features"], spec["ngram_range"], spec["lowercase"])
@@ -0,0 +1,106 @@
+"""
+Shared fixtures: a small synthetic raw dataset laid out like data/raw, the
+merged frame built from it, and a workspace holding what the pipeline
+leaves behind (processed splits, encoders and a published model).
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (PROJECT_ROOT, os.path.join(PROJECT_ROOT, 'src')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from data_processing import (FEATURE_SPEC_PATH, LABEL_ENCODERS_PATH, load_data, merge_datasets,
+                             preprocess_data, save_processed_data, split_data)
+from model_registry import CANARY_ROWS, ModelRegistry
+from model_training import as_model_input
+from sklearn.ensemble import RandomForestClassifier
+
+N_TRIALS = 600
+DESIGNS = [
+    "Allocation: RANDOMIZED|Intervention Model: PARALLEL|Masking: DOUBLE (Participant, Investigator)|Primary Purpose: TREATMENT",
+    "Allocation: NA|Intervention Model: SINGLE_GROUP|Masking: NONE|Primary Purpose: PREVENTION",
+    "Intervention Model: CROSSOVER|Masking: NONE",
+    None,
+]
+STATUSES = ["COMPLETED", "TERMINATED", "WITHDRAWN", "SUSPENDED", "RECRUITING"]
+
+def write_raw_data(raw_dir, n_trials=N_TRIALS, seed=0):
+    """The five RAW_FILES for `n_trials` trials; criteria carry the markup preprocessing strips"""
+    rng = np.random.default_rng(seed)
+    ids = np.array([f"NCT{i:08d}" for i in range(n_trials)])
+    os.makedirs(raw_dir, exist_ok=True)
+
+    pd.DataFrame({
+        "NCT Number": ids,
+        "Study Title": [f"Study {i % 37}" for i in range(n_trials)],
+        "Study Status": rng.choice(STATUSES, n_trials),
+        "Conditions": ["|".join(rng.choice([f"Cond {j}" for j in range(15)], rng.integers(1, 3)))
+                       for _ in range(n_trials)],
+        "Interventions": ["|".join(rng.choice([f"DRUG: d{j}" for j in range(10)], rng.integers(1, 3)))
+                          for _ in range(n_trials)],
+        "Enrollment": np.where(rng.random(n_trials) < 0.2, np.nan, rng.integers(1, 900, n_trials)),
+        "Study Design": rng.choice(np.array(DESIGNS, dtype=object), n_trials),
+        "Sponsor": "X",
+    }).to_csv(os.path.join(raw_dir, "usecase_3_.csv"), index=False)
+    pd.DataFrame({
+        "id": range(n_trials), "nct_id": ids, "gender": "ALL",
+        "criteria": [f"Inclusion ~ crit-{i % 25} #x*" for i in range(n_trials)],
+    }).to_csv(os.path.join(raw_dir, "eligibilities.txt"), sep="|", index=False)
+
+    m = n_trials * 3
+    pd.DataFrame({
+        "id": range(m), "nct_id": rng.choice(ids, m), "name": "Site",
+        "country": rng.choice(["US", "FR", "DE", "JP"], m),
+    }).to_csv(os.path.join(raw_dir, "facilities.txt"), sep="|", index=False)
+    pd.DataFrame({
+        "id": range(m), "nct_id": rng.choice(ids, m), "event_type": rng.choice(["serious", "other"], m),
+        "subjects_at_risk": rng.integers(10, 100, m),
+    }).to_csv(os.path.join(raw_dir, "reported_events.txt"), sep="|", index=False)
+    k = n_trials // 3
+    pd.DataFrame({
+        "id": range(k), "nct_id": rng.choice(ids, k), "reason": "Withdrawal by Subject",
+        "count": rng.integers(0, 30, k),
+    }).to_csv(os.path.join(raw_dir, "drop_withdrawals.txt"), sep="|", index=False)
+
+def fit_forest(X, y, seed=0):
+    """A small forest, enough to exercise the serving paths quickly"""
+    model = RandomForestClassifier(n_estimators=20, max_depth=8, random_state=seed)
+    return model.fit(as_model_input(X), np.asarray(y).ravel())
+
+@pytest.fixture(scope="session")
+def raw_dir(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("raw"))
+    write_raw_data(path)
+    return path
+
+@pytest.fixture(scope="session")
+def merged(raw_dir):
+    """The merged frame; tests that preprocess it work on a copy"""
+    return merge_datasets(load_data(raw_dir))
+
+@pytest.fixture(scope="session")
+def workspace(tmp_path_factory, merged):
+    """
+    A project directory after preprocessing and training: splits and
+    encoders under data/processed and one version, current, in
+    models/registry. Returns its root, registry and splits.
+    """
+    root = str(tmp_path_factory.mktemp("workspace"))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(root)
+        X_train, X_test, y_train, y_test = split_data(preprocess_data(merged.copy()))
+        save_processed_data(X_train, X_test, y_train, y_test)
+        registry = ModelRegistry(os.path.join(root, 'models', 'registry'))
+        version = registry.publish(
+            fit_forest(X_train, y_train), os.path.abspath(LABEL_ENCODERS_PATH), os.path.abspath(FEATURE_SPEC_PATH),
+            canary=as_model_input(X_test.iloc[:CANARY_ROWS])
+        )
+    return SimpleNamespace(root=root, registry=registry, version=version,
+                           X_train=X_train, X_test=X_test, y_train=y_train, y_test=y_test)
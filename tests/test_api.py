@@ -0,0 +1,282 @@
+"""
+Smoke tests of the prediction API against a model published to a
+temporary registry, through the ASGI app and its lifespan.
+"""
+import asyncio
+import importlib
+import os
+import re
+import sys
+import time
+
+import httpx
+import pandas as pd
+import pytest
+
+from data_processing import FEATURE_SPEC_PATH, LABEL_ENCODERS_PATH
+from model_registry import CANARY_ROWS
+from model_training import as_model_input
+from tests.conftest import fit_forest
+from text_features import clean_criteria
+
+N_PAYLOADS = 12
+PROMETHEUS_SAMPLE = re.compile(r'([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="[^"]*",?)*\})? (\S+)')
+
+class AsgiClient:
+    """
+    Requests against the app on one event loop. The lifespan starts the
+    inference scheduler on that loop and it cannot be restarted, so every
+    test of the module shares the loop.
+    """
+
+    def __init__(self, app):
+        self.loop = asyncio.new_event_loop()
+        self._lifespan = app.router.lifespan_context(app)
+        self.loop.run_until_complete(self._lifespan.__aenter__())
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver")
+
+    def get(self, url, **kwargs) -> httpx.Response:
+        return self.loop.run_until_complete(self.client.get(url, **kwargs))
+
+    def post(self, url, **kwargs) -> httpx.Response:
+        return self.loop.run_until_complete(self.client.post(url, **kwargs))
+
+    def post_concurrently(self, url, payloads, **kwargs):
+        """One request per payload, all in flight at once"""
+        async def send():
+            return await asyncio.gather(*(self.client.post(url, json=payload, **kwargs) for payload in payloads))
+        return self.loop.run_until_complete(send())
+
+    def wait_for(self, condition, timeout=60.0):
+        """Poll `condition` while the loop keeps serving, until it holds"""
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise TimeoutError("condition not met")
+            self.loop.run_until_complete(asyncio.sleep(0.05))
+
+    def close(self):
+        self.loop.run_until_complete(self.client.aclose())
+        self.loop.run_until_complete(self._lifespan.__aexit__(None, None, None))
+        self.loop.close()
+
+def start_api(mp, workspace, **env):
+    """A client of app.main imported fresh against the workspace with `env` set"""
+    mp.chdir(workspace.root)
+    mp.setenv('MODEL_REGISTRY_DIR', workspace.registry.root)
+    for name, value in env.items():
+        mp.setenv(name, value)
+    sys.modules.pop('app.main', None)
+    main = importlib.import_module('app.main')
+    client = AsgiClient(main.app)
+    client.main = main
+    return client
+
+@pytest.fixture(scope="module")
+def api(workspace):
+    """The app with the model loaded in the background"""
+    with pytest.MonkeyPatch.context() as mp:
+        # A wide window, so concurrent requests reliably land in one batch
+        client = start_api(mp, workspace, MODEL_LOADING='background', EXPLAINER_LOADING='background',
+                           BATCH_WINDOW_MS='50')
+        # Probed before the background load can finish, for the startup tests
+        client.first_health, client.first_ready = client.get('/health'), client.get('/ready')
+        client.wait_for(lambda: client.get('/ready').status_code == 200)
+        yield client
+        client.close()
+
+def parse_prometheus(text):
+    """Metric types and sample values of a text exposition, asserting its format"""
+    assert text.endswith("\n")
+    types, samples = {}, {}
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            assert len(line.split(" ", 3)) == 4
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert kind in ("counter", "gauge", "histogram") and name not in types
+            types[name] = kind
+        else:
+            match = PROMETHEUS_SAMPLE.fullmatch(line)
+            assert match, line
+            name, labels, value = match.groups()
+            family = name if name in types else re.sub(r"_(bucket|sum|count)$", "", name)
+            # Every sample follows the TYPE line of its family; only histograms add suffixes
+            assert family in types and (family == name or types[family] == "histogram"), line
+            samples[name, labels or ""] = float(value)
+    return types, samples
+
+@pytest.fixture(scope="module")
+def payloads(merged):
+    """/predict bodies for the first trials of the raw data, one condition and intervention each"""
+    trials = []
+    for _, row in merged.head(N_PAYLOADS).iterrows():
+        trial = {col: row[col] for col in ('study_title', 'criteria', 'study_design') if pd.notna(row[col])}
+        trial['condition'] = row['condition'].split('|')[0]
+        trial['intervention'] = row['intervention'].split('|')[0]
+        if pd.notna(row['enrollment']):
+            trial['enrollment'] = int(row['enrollment'])
+        trials.append(trial)
+    return trials
+
+def test_batch_matches_single_predictions(api, payloads):
+    api.main.explanation_cache.clear()
+    responses = [api.post('/predict', json=payload) for payload in payloads]
+    assert all(response.status_code == 200 for response in responses)
+    single = [response.json() for response in responses]
+    assert all(result["explanation"]["top_contributing_features"] for result in single)
+    api.main.explanation_cache.clear()
+    response = api.post('/predict/batch', json={"trials": payloads})
+    assert response.status_code == 200
+    assert response.json()["predictions"] == single
+
+def test_concurrent_requests_share_batches(api, payloads):
+    api.main.explanation_cache.clear()
+    expected = api.post('/predict/batch', json={"trials": payloads}).json()["predictions"]
+    api.main.explanation_cache.clear()
+    before = api.get('/scheduler').json()
+    responses = api.post_concurrently('/predict', payloads)
+    after = api.get('/scheduler').json()
+    assert [response.json() for response in responses] == expected
+    assert after["rows"] - before["rows"] == len(payloads)
+    assert after["batches"] - before["batches"] < len(payloads)
+    assert after["largest_batch_rows"] > 1
+
+def test_repeated_trials_are_served_from_cache(api, payloads):
+    api.main.explanation_cache.clear()
+    first = api.post('/predict', json=payloads[0]).json()
+    cache_before, scheduler_before = api.get('/cache').json(), api.get('/scheduler').json()
+    again = api.post('/predict', json=payloads[0]).json()
+    cache_after, scheduler_after = api.get('/cache').json(), api.get('/scheduler').json()
+    assert again == first
+    assert cache_after["hits"] == cache_before["hits"] + 1
+    assert cache_after["misses"] == cache_before["misses"]
+    # A hit skips inference entirely
+    assert scheduler_after["rows"] == scheduler_before["rows"]
+
+def test_explanation_on_demand(api, payloads):
+    explained = api.post('/predict', json=payloads[1]).json()
+    deferred = api.post('/predict', params={"explain": "false"}, json=payloads[1]).json()
+    assert deferred["explanation"] is None
+    assert deferred["prediction"] == explained["prediction"]
+
+    later = api.get(f"/explanations/{deferred['request_id']}")
+    assert later.status_code == 200
+    assert later.json()["request_id"] == deferred["request_id"]
+    assert later.json()["explanation"] == explained["explanation"]
+
+    approximate = api.get(f"/explanations/{deferred['request_id']}", params={"explanation_mode": "approximate"})
+    assert approximate.json()["explanation"]["mode"] == "approximate"
+    assert api.get('/explanations/not-a-request').status_code == 404
+
+def test_criteria_are_cleaned_like_training(api, merged):
+    """Criteria sent with markup encode to the class training learnt from the cleaned text"""
+    serving = api.main.model_manager.serving()
+    raw = merged['criteria'].iloc[0]
+    cleaned = clean_criteria(pd.Series([raw], dtype=object)).iloc[0]
+    assert raw != cleaned
+    sent = api.main.encode_trials([api.main.TrialData(criteria=raw)], serving)
+    expected = api.main.encode_trials([api.main.TrialData(criteria=cleaned)], serving)
+    pd.testing.assert_frame_equal(sent, expected)
+    assert sent['criteria'].iloc[0] == serving.compiled_encoders.encode_value('criteria', cleaned)
+    assert sent['criteria'].iloc[0] != serving.compiled_encoders.unknown_codes['criteria']
+
+def test_health_answers_while_the_model_loads(api):
+    assert api.first_health.status_code == 200
+    assert api.first_health.json() == {"status": "healthy"}
+    assert api.get('/health').status_code == 200
+
+def test_ready_waits_for_the_model(api, workspace):
+    if api.first_ready.status_code != 200:
+        assert api.first_ready.status_code == 503
+        assert api.first_ready.json()["status"] == "loading"
+    ready = api.get('/ready')
+    assert ready.status_code == 200
+    body = ready.json()
+    assert body["status"] == "ready"
+    assert body["pid"] == os.getpid()
+    assert body["model_version"] == workspace.registry.current() == workspace.version
+    assert body["explainer"] in ('ready', 'building', 'lazy')
+    assert body["startup"]["model_loading"] == 'background'
+    assert body["startup"]["explainer_loading"] == 'background'
+    assert body["startup"]["load_seconds"] >= 0
+    assert body["startup"]["warm_up_seconds"] >= 0
+
+def test_predictions_carry_server_timing(api, payloads):
+    response = api.post('/predict', json=payloads[2])
+    assert response.status_code == 200
+    entries = response.headers["Server-Timing"].split(", ")
+    assert all(re.fullmatch(r"[a-z_]+;dur=\d+\.\d{2}", entry) for entry in entries)
+    assert entries[-1].startswith("total;")
+
+def test_metrics_are_prometheus_text(api, payloads):
+    assert api.post('/predict', json=payloads[3]).status_code == 200
+    response = api.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    types, samples = parse_prometheus(response.text)
+    assert types["trialvision_requests_total"] == "counter"
+    assert types["trialvision_request_duration_seconds"] == "histogram"
+    assert types["trialvision_scheduler_queue_depth"] == "gauge"
+    assert samples["trialvision_requests_total", '{method="POST",path="/predict",status="200"}'] >= 1
+
+    # Buckets are cumulative and the +Inf bucket holds every observation
+    labels = '{path="/predict"'
+    buckets = [value for (name, sample_labels), value in samples.items()
+               if name == "trialvision_request_duration_seconds_bucket" and sample_labels.startswith(labels)]
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == samples["trialvision_request_duration_seconds_count", labels + "}"] >= 1
+
+def test_reload_of_unknown_version_is_rejected(api, workspace):
+    response = api.post('/model/reload', params={"version": "not-a-version"})
+    assert response.status_code == 404
+    assert api.get('/model').json()["version"] == workspace.registry.current()
+
+def test_published_version_is_swapped_in(api, workspace, payloads):
+    registry, first = workspace.registry, workspace.version
+    served_first = api.post('/predict/batch', json={"trials": payloads}).json()["predictions"]
+    assert api.get('/cache').json()["entries"] > 0
+
+    # 1) A version published without activation is not picked up
+    second = registry.publish(
+        fit_forest(workspace.X_train, workspace.y_train, seed=1),
+        os.path.join(workspace.root, LABEL_ENCODERS_PATH), os.path.join(workspace.root, FEATURE_SPEC_PATH),
+        canary=as_model_input(workspace.X_test.iloc[:CANARY_ROWS]), activate=False
+    )
+    assert second != first and second in registry.versions()
+    assert registry.current() == first
+    assert api.get('/model').json()["version"] == first
+
+    # 2) Reloading it swaps it in, makes it CURRENT and drops the old version's cache entries
+    response = api.post('/model/reload', params={"version": second})
+    assert response.status_code == 202
+    assert response.json()["loading"] == second
+    api.wait_for(lambda: api.get('/model').json()["version"] == second)
+    assert registry.current() == second
+    assert api.get('/ready').json()["model_version"] == second
+    assert api.get('/cache').json()["entries"] == 0
+
+    response = api.post('/predict/batch', json={"trials": payloads})
+    assert response.status_code == 200
+    assert response.json()["predictions"] != served_first
+
+    # 3) Rolling back restores the first version's predictions
+    assert api.post('/model/reload', params={"version": first}).status_code == 202
+    api.wait_for(lambda: api.get('/model').json()["version"] == first)
+    assert registry.current() == first
+    api.main.explanation_cache.clear()
+    assert api.post('/predict/batch', json={"trials": payloads}).json()["predictions"] == served_first
+
+@pytest.fixture(scope="module")
+def api_without_metrics(workspace):
+    """A second app, imported with METRICS_ENABLED=0 and its model loaded at import"""
+    with pytest.MonkeyPatch.context() as mp:
+        client = start_api(mp, workspace, METRICS_ENABLED='0', MODEL_LOADING='import', EXPLAINER_LOADING='lazy')
+        yield client
+        client.close()
+
+def test_metrics_can_be_turned_off(api_without_metrics, payloads):
+    response = api_without_metrics.post('/predict', params={"explain": "false"}, json=payloads[0])
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+    assert api_without_metrics.get('/metrics').status_code == 404
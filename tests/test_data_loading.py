@@ -0,0 +1,56 @@
+"""Loading the raw files in parallel must give the frames a sequential load does"""
+import os
+
+import pandas as pd
+import pytest
+
+import data_processing
+from data_processing import RAW_FILES, load_data, split_byte_ranges
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_parallel_load_matches_sequential(raw_dir, monkeypatch, workers):
+    sequential = load_data(raw_dir, workers=1)
+    # Small enough that every raw file is cut into byte ranges
+    monkeypatch.setattr(data_processing, 'SPLIT_MIN_BYTES', 1024)
+    parallel = load_data(raw_dir, workers=workers)
+    assert len(parallel) == len(sequential) == len(RAW_FILES)
+    for expected, actual in zip(sequential, parallel):
+        pd.testing.assert_frame_equal(actual, expected)
+
+@pytest.mark.parametrize("parts", [1, 4, 7])
+def test_byte_ranges_cover_every_line_once(raw_dir, parts):
+    path = os.path.join(raw_dir, "facilities.txt")
+    with open(path, 'rb') as f:
+        header = f.readline()
+        body = f.read()
+    ranges = split_byte_ranges(path, parts)
+    assert 1 <= len(ranges) <= parts
+    assert ranges[0][0] == len(header)
+    assert ranges[-1][1] == os.path.getsize(path)
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+
+    with open(path, 'rb') as f:
+        pieces = []
+        for start, end in ranges:
+            f.seek(start)
+            pieces.append(f.read(end - start))
+    assert all(piece.endswith(b"\n") for piece in pieces)
+    assert b"".join(pieces) == body
+
+def test_aggregates_match_a_groupby_over_the_raw_files(raw_dir, merged):
+    def raw(name):
+        return pd.read_csv(os.path.join(raw_dir, name), sep="|")
+    facilities = raw("facilities.txt").groupby("nct_id")
+    events = raw("reported_events.txt").groupby("nct_id")
+    expected = pd.DataFrame({
+        "facility_count": facilities.size(),
+        "country_count": facilities["country"].nunique(),
+        "event_count": events.size(),
+        "withdrawal_count": raw("drop_withdrawals.txt").groupby("nct_id")["count"].sum(),
+    })
+    # Trials without rows in a file count 0
+    expected = expected.reindex(merged["nct_id"]).fillna(0)
+    actual = merged.set_index("nct_id")[list(expected.columns)]
+    assert actual.index.is_unique
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    assert (actual["withdrawal_count"] > 0).any() and (actual["facility_count"] == 0).any()
@@ -0,0 +1,71 @@
+"""Dtype helpers must change how features are stored, never their values"""
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+from sklearn.preprocessing import LabelEncoder
+
+from data_processing import LABEL_ENCODERS_PATH, preprocess_data
+from dtype_policy import category_codes, compact_numeric, sparse_frame
+from model_training import as_model_input
+
+def test_sparse_frame_keeps_absent_entries_zero():
+    matrix = sparse.random(50, 8, density=0.2, format='csr', dtype=np.float32, random_state=0)
+    frame = sparse_frame(matrix, index=range(100, 150), columns=[f"c{i}" for i in range(8)])
+    assert all(dtype == pd.SparseDtype(np.float32, 0) for dtype in frame.dtypes)
+    assert list(frame.index) == list(range(100, 150))
+    assert np.array_equal(frame.sparse.to_dense().to_numpy(), matrix.toarray())
+    assert np.array_equal(frame.sparse.to_coo().toarray(), matrix.toarray())
+
+def test_encoded_sparse_columns_have_no_missing_values(tmp_path, monkeypatch, merged):
+    monkeypatch.chdir(tmp_path)
+    processed = preprocess_data(merged.copy(), encoding='sparse', text_encoding='hashed')
+    sparse_cols = [col for col, dtype in processed.dtypes.items() if isinstance(dtype, pd.SparseDtype)]
+    assert sparse_cols
+    dense = processed[sparse_cols].sparse.to_dense()
+    assert not dense.isna().any().any()
+    assert set(np.unique(dense.filter(like='intervention').to_numpy())) == {0.0, 1.0}
+
+def test_category_codes_match_label_encoder():
+    values = pd.Series(["b", "Unknown", "a", "b", "c10", "c9", "a"])
+    for column in (values, values.astype('category'), values.astype('category').cat.add_categories(["unused"])):
+        codes, classes = category_codes(column)
+        encoder = LabelEncoder().fit(values)
+        assert codes.dtype == np.uint8
+        assert np.array_equal(codes, encoder.transform(values))
+        assert list(classes) == list(encoder.classes_)
+
+    # Non-string values are coded by their string form, as fit_transform(astype(str)) does
+    numbers = pd.Series([10, 9, 100, 9])
+    codes, classes = category_codes(numbers)
+    assert np.array_equal(codes, LabelEncoder().fit_transform(numbers.astype(str)))
+
+def test_compact_numeric_keeps_values():
+    df = pd.DataFrame({
+        "small": np.array([0, 3, 255], dtype=np.int64),
+        "signed": np.array([-5, 0, 70000], dtype=np.int64),
+        "ratio": np.array([0.5, 1.25, np.nan]),
+        "label": np.array([1, 2, 3], dtype=np.int64),
+    })
+    compact = compact_numeric(df.copy(), exclude=["label"])
+    assert compact.dtypes.to_dict() == {"small": np.uint8, "signed": np.int32, "ratio": np.float32, "label": np.int64}
+    pd.testing.assert_frame_equal(compact, df, check_dtype=False)
+
+@pytest.mark.parametrize("encoding", ["label", "sparse"])
+def test_compact_dtypes_give_the_label_encoder_model_input(tmp_path, monkeypatch, merged, encoding):
+    monkeypatch.chdir(tmp_path)
+    frames, encoders = {}, {}
+    for dtypes in ('compact', 'wide'):
+        processed = preprocess_data(merged.copy(), encoding=encoding, dtypes=dtypes)
+        frames[dtypes] = as_model_input(processed.drop(columns=['study_status']))
+        with open(LABEL_ENCODERS_PATH, 'rb') as f:
+            encoders[dtypes] = pickle.load(f)
+    compact, wide = frames['compact'], frames['wide']
+    if encoding == 'sparse':
+        compact, wide = compact.sparse.to_dense(), wide.sparse.to_dense()
+    pd.testing.assert_frame_equal(compact, wide)
+    assert encoders['compact'].keys() == encoders['wide'].keys()
+    for col, encoder in encoders['wide'].items():
+        assert list(encoders['compact'][col].classes_) == list(encoder.classes_)
@@ -0,0 +1,48 @@
+"""The compiled forest must reproduce RandomForestClassifier exactly"""
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+
+from forest_compiler import CompiledForest, export_forest
+from model_registry import COMPILED_DIR, MODEL_FILE
+from model_training import as_model_input
+
+@pytest.fixture(scope="module")
+def data():
+    X, y = make_classification(n_samples=3000, n_features=12, n_informative=6, n_classes=3,
+                               n_clusters_per_class=1, random_state=0)
+    columns = [f"f{i}" for i in range(X.shape[1])]
+    return pd.DataFrame(X.astype(np.float32), columns=columns), y
+
+@pytest.mark.parametrize("missing_rate", [0.0, 0.1])
+def test_predict_proba_is_bit_identical(tmp_path, data, missing_rate):
+    X, y = data
+    # A writable array: scikit-learn's missing-value check rejects the read-only views pandas returns
+    X = X.to_numpy(copy=True)
+    X[np.random.default_rng(1).random(X.shape) < missing_rate] = np.nan
+    model = RandomForestClassifier(n_estimators=30, max_depth=12, random_state=0).fit(X, y)
+    export_forest(model, str(tmp_path))
+    for mmap in (True, False):
+        compiled = CompiledForest.load(str(tmp_path), mmap=mmap)
+        assert np.array_equal(compiled.predict_proba(X), model.predict_proba(X))
+        assert np.array_equal(compiled.predict(X), model.predict(X))
+
+def test_columns_are_taken_by_name(tmp_path, data):
+    X, y = data
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    export_forest(model, str(tmp_path))
+    compiled = CompiledForest.load(str(tmp_path))
+    shuffled = X[X.columns[::-1]]
+    assert np.array_equal(compiled.predict_proba(shuffled), model.predict_proba(X))
+
+def test_matches_the_published_model(workspace):
+    """The forest the API serves, on the processed test split"""
+    with open(workspace.registry.path(workspace.version, MODEL_FILE), 'rb') as f:
+        model = pickle.load(f)
+    compiled = CompiledForest.load(workspace.registry.path(workspace.version, COMPILED_DIR))
+    X = as_model_input(workspace.X_test)
+    assert np.array_equal(compiled.predict_proba(X), model.predict_proba(X))
@@ -0,0 +1,28 @@
+"""neighbor_median must fill exactly what the per-gap loop it replaced filled"""
+import numpy as np
+import pytest
+
+from imputation import neighbor_median
+from scripts.benchmark_imputation import original_loop, synthetic_enrollment
+
+@pytest.mark.parametrize("missing_rate", [0.0, 0.1, 0.5, 0.9, 0.99, 1.0])
+def test_matches_the_original_loop(missing_rate):
+    values = synthetic_enrollment(3000, missing_rate, seed=7)
+    assert np.array_equal(neighbor_median(values), original_loop(values), equal_nan=True)
+
+@pytest.mark.parametrize("values", [
+    [np.nan, np.nan, np.nan, np.nan, np.nan, 10.0],
+    [10.0, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan],
+    [np.nan, 4.0, np.nan, np.nan, 1.0, np.nan, np.nan, np.nan, np.nan, np.nan, 7.0, np.nan],
+    [np.nan] * 5 + [3.0] + [np.nan] * 20 + [8.0],
+    [np.nan],
+    [],
+], ids=["leading", "trailing", "mixed", "carried", "single", "empty"])
+def test_edges_match_the_original_loop(values):
+    values = np.array(values, dtype=np.float64)
+    assert np.array_equal(neighbor_median(values), original_loop(values), equal_nan=True)
+
+def test_known_values_are_kept():
+    values = synthetic_enrollment(500, 0.3)
+    known = ~np.isnan(values)
+    assert np.array_equal(neighbor_median(values)[known], values[known])
@@ -0,0 +1,54 @@
+"""Incremental updates must keep the codes and trees the model already has"""
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import LabelEncoder
+
+from incremental import category_stability, extend_label_encoder, update_forest
+from model_training import as_model_input
+from tests.conftest import fit_forest
+
+def test_extended_encoder_keeps_existing_codes():
+    encoder = LabelEncoder().fit(["b", "a", "c"])
+    appended = []
+    codes, added = extend_label_encoder(encoder, appended, pd.Series(["c", "x", "a", "y", "x"]))
+    assert codes.tolist() == [2, 3, 0, 4, 3]
+    assert added == 2 and appended == ["x", "y"]
+    assert encoder.classes_.tolist() == ["a", "b", "c"]
+
+    # A later batch numbers its new classes after the ones appended before
+    codes, added = extend_label_encoder(encoder, appended, pd.Series(["y", "z", "b"]))
+    assert codes.tolist() == [4, 5, 1]
+    assert added == 1 and appended == ["x", "y", "z"]
+
+@pytest.mark.parametrize("mode, grows", [("add", True), ("window", False)])
+def test_update_forest(workspace, mode, grows):
+    model = fit_forest(workspace.X_train, workspace.y_train)
+    n_trees = len(model.estimators_)
+    old_trees = list(model.estimators_)
+    X = as_model_input(workspace.X_test)
+    y = np.asarray(workspace.y_test).ravel()
+
+    update_forest(model, X, y, mode=mode, n_trees=5)
+    assert len(model.estimators_) == model.n_estimators == (n_trees + 5 if grows else n_trees)
+    # 'add' keeps every tree; 'window' drops the oldest five
+    kept = old_trees if grows else old_trees[5:]
+    assert model.estimators_[:len(kept)] == kept
+    assert not model.warm_start
+    assert model.predict_proba(X).shape == (len(X), len(model.classes_))
+
+def test_category_stability():
+    rng = np.random.default_rng(0)
+    shares = np.array([0.4, 0.3, 0.2, 0.1])
+    reference = rng.choice(4, 20000, p=shares)
+
+    psi, unseen_rate = category_stability(reference, rng.choice(4, 20000, p=shares), n_known=4)
+    assert psi < 0.01 and unseen_rate == 0.0
+
+    psi, unseen_rate = category_stability(reference, rng.choice(4, 20000, p=shares[::-1]), n_known=4)
+    assert psi > 0.5 and unseen_rate == 0.0
+
+    # Classes the model has never seen count as drift of their own
+    current = np.concatenate([rng.choice(4, 15000, p=shares), np.full(5000, 4)])
+    psi, unseen_rate = category_stability(reference, current, n_known=4)
+    assert psi > 0.5 and unseen_rate == 0.25
@@ -0,0 +1,106 @@
+"""Compressed forests must stay valid scikit-learn forests the serving paths can load"""
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+
+from forest_compiler import CompiledForest, export_forest
+from model_compression import (TREE_LEAF, cap_forest_depth, cap_tree_depth, distill, greedy_prune, main,
+                               oob_masks, subset_forest, tree_probabilities)
+from tests.conftest import fit_forest
+
+@pytest.fixture(scope="module")
+def data():
+    X, y = make_classification(n_samples=2000, n_features=10, n_informative=5, random_state=0)
+    # Missing values exercise the missing_go_to_left branches the cap keeps
+    X[np.random.default_rng(1).random(X.shape) < 0.05] = np.nan
+    return pd.DataFrame(X.astype(np.float32), columns=[f"f{i}" for i in range(X.shape[1])]), y
+
+@pytest.fixture(scope="module")
+def forest(data):
+    X, y = data
+    return RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y)
+
+def walk_to_depth(tree, x, max_depth):
+    """Class probabilities of the node a row reaches after at most `max_depth` splits"""
+    node, depth = 0, 0
+    while tree.children_left[node] != TREE_LEAF and depth < max_depth:
+        value = x[tree.feature[node]]
+        if np.isnan(value):
+            go_left = tree.missing_go_to_left[node]
+        else:
+            go_left = value <= tree.threshold[node]
+        node = tree.children_left[node] if go_left else tree.children_right[node]
+        depth += 1
+    value = tree.value[node, 0]
+    return value / value.sum()
+
+@pytest.mark.parametrize("max_depth", [1, 3, 6])
+def test_capped_tree_stops_at_the_stored_node_value(data, forest, max_depth):
+    X, _ = data
+    rows = X.to_numpy()[:300]
+    for estimator in forest.estimators_[:5]:
+        capped = cap_tree_depth(estimator, max_depth)
+        assert capped.tree_.max_depth == max_depth < estimator.tree_.max_depth
+        assert capped.tree_.node_count < estimator.tree_.node_count
+        expected = np.stack([walk_to_depth(estimator.tree_, x, max_depth) for x in rows])
+        np.testing.assert_allclose(capped.predict_proba(rows), expected, rtol=1e-12)
+    # The original tree is left untouched
+    assert forest.estimators_[0].tree_.max_depth > max_depth
+
+def test_cap_deeper_than_the_tree_changes_nothing(forest):
+    estimator = forest.estimators_[0]
+    assert cap_tree_depth(estimator, estimator.tree_.max_depth) is estimator
+
+@pytest.mark.parametrize("name", ["pruned", "capped", "pruned+capped", "distilled"])
+def test_candidates_compile_to_the_same_probabilities(tmp_path, data, forest, name):
+    X, y = data
+    P = tree_probabilities(forest, X.iloc[:500])
+    order, _ = greedy_prune(P, y[:500].astype(np.float32), 8)
+    assert len(set(order)) == len(order) == 8
+    candidate = {
+        "pruned": lambda: subset_forest(forest, order),
+        "capped": lambda: cap_forest_depth(forest, 4),
+        "pruned+capped": lambda: cap_forest_depth(subset_forest(forest, order), 4),
+        "distilled": lambda: distill(forest, X, n_trees=5, max_depth=6, rows=1000),
+    }[name]()
+    export_forest(candidate, str(tmp_path))
+    compiled = CompiledForest.load(str(tmp_path))
+    assert np.array_equal(compiled.predict_proba(X), candidate.predict_proba(X))
+
+def test_oob_masks_follow_the_bootstrap(data, forest):
+    X, _ = data
+    rows = np.arange(0, len(X), 7)
+    masks = oob_masks(forest, len(X), rows)
+    assert masks.shape == (len(forest.estimators_), len(rows))
+    for mask, drawn in zip(masks, forest.estimators_samples_):
+        assert not np.isin(rows[mask], drawn).any()
+        assert np.isin(rows[~mask], drawn).all()
+    # Not the split the forest was fitted on
+    assert oob_masks(forest, len(X) - 1, rows) is None
+
+@pytest.mark.parametrize("tolerance", [0.0, 0.02])
+def test_selected_candidate_is_within_the_auc_tolerance(workspace, tmp_path, monkeypatch, tolerance):
+    monkeypatch.chdir(workspace.root)
+    model_path = str(tmp_path / "model.pkl")
+    with open(model_path, 'wb') as f:
+        pickle.dump(fit_forest(workspace.X_train, workspace.y_train), f)
+    report = main(model_path=model_path, prune_sizes=(3, 10), depths=(2, 5), tolerance=tolerance,
+                  distill_trees=5, distill_depth=4, output=str(tmp_path / "report.json"),
+                  save_path=str(tmp_path / "compressed.pkl"))
+
+    candidates = report["candidates"]
+    assert {"original", "pruned-3", "pruned-10", "depth-2", "pruned-3+depth-2", "distilled-5x4"} <= set(candidates)
+    floor = candidates["original"]["auc_roc"] - tolerance
+    assert candidates[report["selected"]]["auc_roc"] >= floor
+    # Nothing smaller was passed over
+    smaller = [name for name, r in candidates.items() if r["pickle_mb"] < candidates[report["selected"]]["pickle_mb"]]
+    assert all(candidates[name]["auc_roc"] < floor for name in smaller)
+    with open(tmp_path / "report.json") as f:
+        assert json.load(f)["selected"] == report["selected"]
+    assert os.path.exists(tmp_path / "compressed.pkl")
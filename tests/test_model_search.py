@@ -0,0 +1,48 @@
+"""Successive halving must pick one of the grid's candidates and hand back a fitted forest"""
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import ParameterGrid
+
+import model_training
+from model_search import successive_halving, tree_schedule
+from model_training import as_model_input, train_model
+
+SMALL_GRID = {
+    'n_estimators': [10, 30],
+    'max_depth': [4, None],
+    'min_samples_split': [2, 10],
+}
+
+@pytest.fixture
+def small_search(workspace, tmp_path, monkeypatch):
+    """Training inputs, with a grid small enough to search quickly and models/ under tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(model_training, 'PARAM_GRID', SMALL_GRID)
+    return as_model_input(workspace.X_train), np.asarray(workspace.y_train).ravel()
+
+def test_tree_schedule_ends_at_max_trees():
+    assert tree_schedule(9, 25, 300, 3) == [25, 87, 300]
+    assert tree_schedule(1, 25, 300, 3) == [300]
+    assert tree_schedule(9, 300, 300, 3) == [300]
+
+def test_halving_returns_a_fitted_forest(small_search):
+    X, y = small_search
+    model = train_model(X, y, search='halving', min_trees=5)
+    assert isinstance(model, RandomForestClassifier)
+    assert len(model.estimators_) == max(SMALL_GRID['n_estimators'])
+    assert model.predict_proba(X.iloc[:10]).shape == (10, len(np.unique(y)))
+
+def test_halving_chooses_among_the_grid_search_candidates(small_search):
+    X, y = small_search
+    candidates = list(ParameterGrid(SMALL_GRID))
+    grid_model = train_model(X, y, search='grid')
+    assert {name: grid_model.get_params()[name] for name in SMALL_GRID} in candidates
+
+    grid = {name: values for name, values in SMALL_GRID.items() if name != 'n_estimators'}
+    best_params, best_score, history = successive_halving(X, y, grid, min_trees=5, max_trees=30, n_jobs=1)
+    assert best_params in candidates
+    # The first rung scores every candidate the grid search fits, and only those
+    first_rung = [entry["params"] for entry in history if entry["rung"] == 0]
+    assert sorted(map(str, first_rung)) == sorted(map(str, ParameterGrid(grid)))
+    assert best_score == max(entry["mean_accuracy"] for entry in history if entry["n_estimators"] == 30)
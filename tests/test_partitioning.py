@@ -0,0 +1,38 @@
+"""Partitioned preprocessing must produce the frame and encoders of a serial run"""
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_processing import FEATURE_SPEC_PATH, LABEL_ENCODERS_PATH, preprocess_data
+
+def preprocess_in(directory, merged, **kwargs):
+    """The processed frame and the encoders and feature spec it wrote under `directory`"""
+    os.makedirs(directory)
+    os.chdir(directory)
+    processed = preprocess_data(merged.copy(), **kwargs)
+    with open(LABEL_ENCODERS_PATH, 'rb') as f:
+        encoders = pickle.load(f)
+    with open(FEATURE_SPEC_PATH) as f:
+        feature_spec = json.load(f)
+    return processed, encoders, feature_spec
+
+@pytest.mark.parametrize("encoding, text_encoding", [
+    ('label', 'label'), ('sparse', 'label'), ('label', 'hashed'),
+])
+def test_partitioned_matches_serial(tmp_path, monkeypatch, merged, encoding, text_encoding):
+    monkeypatch.chdir(tmp_path)
+    serial, serial_encoders, serial_spec = preprocess_in(
+        tmp_path / "serial", merged, encoding=encoding, text_encoding=text_encoding)
+    partitioned, partitioned_encoders, partitioned_spec = preprocess_in(
+        tmp_path / "partitioned", merged, encoding=encoding, text_encoding=text_encoding,
+        partitions=4, workers=2)
+
+    pd.testing.assert_frame_equal(partitioned, serial)
+    assert partitioned_spec == serial_spec
+    assert serial_encoders.keys() == partitioned_encoders.keys()
+    for col, encoder in serial_encoders.items():
+        assert np.array_equal(partitioned_encoders[col].classes_, encoder.classes_)
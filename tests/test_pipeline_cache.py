@@ -0,0 +1,80 @@
+"""The Feather cache must give back what it was given, and miss when an input changes"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_processing
+from data_processing import RAW_FILES, load_data, pipeline_cache_keys
+from pipeline_cache import PipelineCache, read_frame, write_frame
+
+@pytest.fixture
+def raw_copy(raw_dir, tmp_path):
+    """A private copy of the raw files, for tests that edit them"""
+    path = str(tmp_path / "raw")
+    shutil.copytree(raw_dir, path)
+    return path
+
+def load_cached(raw_dir, cache):
+    return load_data(raw_dir, cache=cache, cache_keys=pipeline_cache_keys(cache, raw_dir)['datasets'])
+
+def parsed_files(monkeypatch):
+    """Names of the raw files load_data parses from here on"""
+    parsed = []
+    load_file = data_processing.load_file
+    def recording_load_file(spec, raw_dir):
+        parsed.append(spec["name"])
+        return load_file(spec, raw_dir)
+    monkeypatch.setattr(data_processing, 'load_file', recording_load_file)
+    return parsed
+
+def test_frames_round_trip(tmp_path):
+    df = pd.DataFrame({
+        "count": np.arange(5, dtype=np.int64),
+        "enrollment": [1.5, np.nan, 3.0, 4.0, 5.0],
+        "title": ["a", None, "c", "d", "e"],
+        "flag": pd.arrays.SparseArray([0, 1, 0, 0, 1], fill_value=0, dtype=np.float32),
+    }, index=[10, 3, 7, 1, 2])
+    path = str(tmp_path / "frame.feather")
+    write_frame(path, df)
+    for zero_copy in (False, True):
+        pd.testing.assert_frame_equal(read_frame(path, zero_copy=zero_copy), df)
+    # Copied columns can be assigned into; mapped ones are read-only views of the file
+    copied = read_frame(path)
+    copied.loc[10, "count"] = 0
+    assert copied.loc[10, "count"] == 0
+    assert not read_frame(path, zero_copy=True)["count"].to_numpy().flags.writeable
+
+def test_cache_hit_matches_the_uncached_load(raw_dir, tmp_path, monkeypatch):
+    uncached = load_data(raw_dir)
+    cache = PipelineCache(str(tmp_path / "cache"))
+    first = load_cached(raw_dir, cache)
+
+    parsed = parsed_files(monkeypatch)
+    second = load_cached(raw_dir, PipelineCache(str(tmp_path / "cache")))
+    assert parsed == []
+    assert len(first) == len(second) == len(uncached) == len(RAW_FILES)
+    for expected, miss, hit in zip(uncached, first, second):
+        pd.testing.assert_frame_equal(miss, expected)
+        pd.testing.assert_frame_equal(hit, expected)
+
+def test_changed_raw_file_misses(raw_copy, tmp_path, monkeypatch):
+    cache = PipelineCache(str(tmp_path / "cache"))
+    before = pipeline_cache_keys(cache, raw_copy)
+    load_cached(raw_copy, cache)
+
+    path = os.path.join(raw_copy, "drop_withdrawals.txt")
+    with open(path, 'a') as f:
+        f.write("99999|NCT00000001|Withdrawal by Subject|7\n")
+    after = pipeline_cache_keys(cache, raw_copy)
+    changed = [name for name in before["datasets"] if before["datasets"][name] != after["datasets"][name]]
+    assert changed == ["drop_withdrawals.txt"]
+    assert after["merged"] != before["merged"] and after["splits"] != before["splits"]
+
+    parsed = parsed_files(monkeypatch)
+    reloaded = load_cached(raw_copy, cache)
+    assert parsed == ["drop_withdrawals.txt"]
+    for expected, actual in zip(load_data(raw_copy), reloaded):
+        pd.testing.assert_frame_equal(actual, expected)
@@ -0,0 +1,37 @@
+"""parse_study_design must extract what the four per-field regex scans did"""
+import pandas as pd
+import pytest
+
+from scripts.benchmark_study_design import four_extracts, synthetic_designs
+from study_design import DESIGN_COLUMNS, parse_study_design
+
+def assert_matches_regex(designs):
+    parsed = parse_study_design(designs)
+    assert list(parsed.columns) == DESIGN_COLUMNS
+    assert all(isinstance(parsed[col].dtype, pd.CategoricalDtype) for col in DESIGN_COLUMNS)
+    pd.testing.assert_frame_equal(parsed.astype(object), four_extracts(designs)[DESIGN_COLUMNS].astype(object))
+
+def test_matches_regex_on_synthetic_designs():
+    assert_matches_regex(synthetic_designs(5000, seed=3))
+
+@pytest.mark.parametrize("design", [
+    None,
+    "",
+    "Observational Model: Cohort|Time Perspective: Prospective",
+    "Masking: NONE",
+    "Allocation: RANDOMIZED| Intervention Model: PARALLEL|  Masking: NONE",
+    "Allocation: RANDOMIZED |Masking: SINGLE (Participant) |Primary Purpose: OTHER",
+    "Allocation: RANDOMIZED|Allocation: NA|Masking: NONE|Masking: DOUBLE",
+    "Time Perspective: Prospective|Allocation: NA|Sampling: Probability|Primary Purpose: TREATMENT",
+    "Allocation: |Masking: NONE",
+    "Allocation:RANDOMIZED|Masking: NONE",
+], ids=["none", "empty", "observational", "one-key", "space-after-bar", "trailing-space",
+        "duplicate-keys", "unknown-keys", "empty-value", "no-space-after-colon"])
+def test_matches_regex_on_edge_cases(design):
+    assert_matches_regex(pd.Series([design, "Allocation: NA|Masking: NONE"], dtype=object))
+
+def test_keeps_the_index():
+    designs = pd.Series(["Allocation: NA", None, "Masking: NONE"], index=[10, 5, 7], dtype=object)
+    parsed = parse_study_design(designs)
+    assert parsed.index.tolist() == [10, 5, 7]
+    assert parsed.loc[5].tolist() == ['Unknown'] * len(DESIGN_COLUMNS)
@@ -0,0 +1,46 @@
+"""Criteria cleanup and text hashing shared by training and serving"""
+import numpy as np
+import pandas as pd
+
+from data_processing import preprocess_columns
+from text_features import TextHasher, clean_criteria
+
+def test_hasher_is_rebuilt_from_its_spec(merged):
+    hasher = TextHasher('criteria', n_features=256, ngram_range=(1, 2))
+    rebuilt = TextHasher.from_dict(hasher.to_dict())
+    values = merged['criteria']
+    assert rebuilt.feature_names() == hasher.feature_names()
+    assert np.array_equal(rebuilt.transform(values).toarray(), hasher.transform(values).toarray())
+
+def test_chunking_does_not_change_the_vectors(merged):
+    hasher = TextHasher('study_title')
+    values = merged['study_title']
+    whole = hasher.transform(values)
+    assert whole.shape == (len(values), hasher.n_features)
+    assert np.array_equal(hasher.transform(values, chunk_rows=7).toarray(), whole.toarray())
+    # Every row has at least one term ('Unknown' for missing text) and unit length
+    assert np.allclose(np.sqrt(whole.multiply(whole).sum(axis=1)), 1.0)
+    assert hasher.transform(pd.Series([], dtype=object)).shape == (0, hasher.n_features)
+
+def test_clean_criteria_strips_markup():
+    raw = pd.Series(["  Inclusion ~ crit-3 #x* ", "^`age`^", None, "plain"], dtype=object)
+    cleaned = clean_criteria(raw)
+    assert cleaned.iloc[0] == "Inclusion  crit3 x"
+    assert cleaned.iloc[1] == "age"
+    assert pd.isna(cleaned.iloc[2])
+    assert cleaned.iloc[3] == "plain"
+
+def test_training_criteria_are_cleaned(merged):
+    processed = preprocess_columns(merged.copy(), expand=False)
+    expected = clean_criteria(merged['criteria'])
+    assert processed['criteria'].tolist() == expected.tolist()
+    assert not processed['criteria'].str.contains(r'[~\-#^*`]').any()
+
+def test_hashed_criteria_depend_on_the_cleanup(merged):
+    """Raw and cleaned criteria hash differently, so both paths must clean the same way"""
+    hasher = TextHasher('criteria')
+    raw = merged['criteria'].head(50)
+    training = hasher.transform(preprocess_columns(merged.head(50).copy(), expand=False)['criteria'])
+    serving = hasher.transform(clean_criteria(raw.astype(object)))
+    assert np.array_equal(training.toarray(), serving.toarray())
+    assert not np.array_equal(hasher.transform(raw).toarray(), serving.toarray())